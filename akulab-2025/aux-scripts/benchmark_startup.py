@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold vs. warm invocation latency of the cron entry points.
+
+cold : python3 <script> --help
+warm : python3 -S warm_worker.py call <name> --help   (fork from warm server)
+
+'--help' runs every module-level import and argument parsing but no real
+work, so the numbers are pure start-up cost. If no warm_worker server is
+running, a temporary one is started for the benchmark.
+
+Examples
+--------
+python benchmark_startup.py
+python benchmark_startup.py --runs 20
+"""
+
+from __future__ import annotations
+import argparse, os, statistics, subprocess, sys, time
+from pathlib import Path
+
+RPI_DIR = Path(__file__).resolve().parent.parent / "raspberry-pis"
+WORKER = RPI_DIR / "warm_worker.py"
+ENTRY_POINTS = {
+    "rpi_health_snapshot": RPI_DIR / "rpi_health_snapshot.py",
+    "backup_recordings": RPI_DIR / "backup_recordings.py",
+    "summarize_daily_logs": RPI_DIR / "analytics-pi" / "summarize_daily_logs.py",
+}
+
+
+def timed_run(cmd: list[str]) -> float:
+    """Run *cmd* silently and return wall time in ms."""
+    t0 = time.perf_counter()
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def socket_path() -> str:
+    return f"/tmp/akulab_warm_worker_{os.getuid()}.sock"
+
+
+def ensure_server() -> subprocess.Popen | None:
+    """Start a temporary warm_worker if none is listening; return its Popen."""
+    if os.path.exists(socket_path()):
+        return None
+    proc = subprocess.Popen([sys.executable, str(WORKER), "serve"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        if os.path.exists(socket_path()):
+            time.sleep(0.2)   # preload finishes before bind, but be safe
+            return proc
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("warm_worker did not come up")
+
+
+def main():
+    ap = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    ap.add_argument("--runs", type=int, default=10, help="invocations per mode")
+    args = ap.parse_args()
+
+    server = ensure_server()
+    try:
+        print(f"{'entry point':24s} {'cold ms':>10s} {'warm ms':>10s} {'speed-up':>9s}")
+        for name, script in ENTRY_POINTS.items():
+            cold = [timed_run([sys.executable, str(script), "--help"]) for _ in range(args.runs)]
+            warm = [timed_run([sys.executable, "-S", str(WORKER), "call", name, "--help"])
+                    for _ in range(args.runs)]
+            c, w = statistics.median(cold), statistics.median(warm)
+            print(f"{name:24s} {c:10.1f} {w:10.1f} {c / w:8.1f}x")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            if os.path.exists(socket_path()):
+                os.unlink(socket_path())
+
+
+if __name__ == "__main__":
+    main()
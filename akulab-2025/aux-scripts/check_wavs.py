@@ -2,40 +2,50 @@
 
 import os
 import sys
-import soundfile as sf
+from pathlib import Path
+
+# Header-only parser from raspberry-pis/; unlike libsndfile it sees the true
+# length of >4 GB files whose RF64 header was never written.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "raspberry-pis"))
+import wav_header
+from verify_segments import find_wavs, read_recording_config
 
 def main(directory):
     total_frames = 0
     valid_files = 0
-
-    for filename in os.listdir(directory):
-        if filename.lower().endswith(".wav"):
-            filepath = os.path.join(directory, filename)
-            try:
-                with sf.SoundFile(filepath) as snd:
-                    # Check number of channels
-                    if snd.channels != 8:
-                        print(f"{filename}: not 8 channels; skipping.")
-                        continue
-                    # Check format is 32-bit float
-                    # SoundFile uses 'FLOAT' as the subtype for 32-bit float WAV
-                    if snd.subtype != 'FLOAT':
-                        print(f"{filename}: not 32-bit float (found {snd.subtype}); skipping.")
-                        continue
-
-                    frames = len(snd)  # total audio frames
-                    total_frames += frames
-                    valid_files += 1
-
-            except RuntimeError as e:
-                print(f"{filename}: error reading file: {e}")
+    _, segment_time = read_recording_config(
+        Path(__file__).resolve().parent.parent / "raspberry-pis" / "config.ini")
+
+    for filepath in find_wavs([directory]):
+        filename = os.path.relpath(filepath, directory)
+        try:
+            hdr = wav_header.read_header(filepath)
+        except OSError as e:
+            print(f"{filename}: error reading file: {e}")
+            continue
+        if hdr["problems"]:
+            print(f"{filename}: header problems: {'; '.join(hdr['problems'])}")
+            if hdr["frames_on_disk"] is None:
+                continue
+        # Check number of channels
+        if hdr["channels"] != 8:
+            print(f"{filename}: not 8 channels; skipping.")
+            continue
+        # Check format is 32-bit float ('FLOAT', same name as libsndfile's subtype)
+        if hdr["subtype"] != 'FLOAT':
+            print(f"{filename}: not 32-bit float (found {hdr['subtype']}); skipping.")
+            continue
+
+        # Frames actually on disk, even if the header claims fewer
+        total_frames += hdr["frames_on_disk"]
+        valid_files += 1
 
     if valid_files == 0:
         print("No valid 8-channel, 32-bit float WAV files found.")
         return
 
-    # Each valid file is assumed to be 1 hour = 3600 seconds
-    average_sample_rate = total_frames / (valid_files * 3600.0)
+    # Each valid file is assumed to be one full segment_time long
+    average_sample_rate = total_frames / (valid_files * float(segment_time))
     print(f"Found {valid_files} valid 8-ch 32-bit float WAV files.")
     print(f"Average sample rate = {average_sample_rate:.2f} Hz")
 
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+estimate_sample_rate.py
+
+Estimate the effective sample rate of the recorder, and how it drifts, from
+recordings that already exist — no new take, no audio read.
+
+measure_sample_rate.py records a fresh take and trusts that ffmpeg ran for
+exactly --duration wall-clock seconds. Here every segment header gives the
+frames actually captured, and the wall clock comes from, best first:
+
+  sidecar  segment_writer's .timing.csv: one (sample, CLOCK_REALTIME) pair
+           per second of audio (the clock map's least-delayed estimate)
+  starts   segment start times (BEXT time_reference, BEXT origination time
+           or the file name; see raspberry-pis/segment_timeline.py)
+
+segment_writer carries its sample clock into BEXT and the name, so without
+sidecars its segments only show re-anchor steps, not drift; the source used
+is printed per session. Within one recording session
+
+    captured_frames(t) = F0 + rate * t + 0.5 * drift * t^2 + steps
+
+is fitted by robust (Huber IRLS) least squares, where t is wall-clock seconds
+since the first segment and 'steps' are level shifts at joins where the
+timestamps jump against the audio (NTP clock step, or samples dropped by
+the capture). Steps are found first from the per-join frame deficit and
+reported; they do not bias the rate. A negative step means the wall clock
+jumped ahead of the audio (clock stepped forward, or samples were lost).
+
+Because only headers are read, a whole season takes seconds.
+
+Usage:
+    python3 estimate_sample_rate.py /media/nas/Audio/2025-06-0*
+    python3 estimate_sample_rate.py /media/nas/Audio --start 2025-06-01 --end 2025-06-08 --csv fit.csv
+"""
+
+import os
+import sys
+import csv
+import argparse
+import calendar
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "raspberry-pis"))
+import segment_timeline
+
+
+def huber_irls(X, y, k=1.345, iters=50):
+    """Robust linear fit y ≈ X·b with Huber weights. Returns (b, residuals, scale)."""
+    w = np.ones(len(y))
+    b = np.zeros(X.shape[1])
+    scale = 1.0
+    for _ in range(iters):
+        sw = np.sqrt(w)
+        b_new = np.linalg.lstsq(X * sw[:, None], y * sw, rcond=None)[0]
+        r = y - X @ b_new
+        scale = 1.4826 * np.median(np.abs(r - np.median(r))) or 1e-9
+        u = np.abs(r) / (k * scale)
+        w = np.where(u <= 1, 1.0, 1.0 / np.maximum(u, 1e-12))
+        if np.allclose(b_new, b, rtol=1e-12, atol=1e-9):
+            b = b_new
+            break
+        b = b_new
+    return b, y - X @ b, scale
+
+
+def find_steps(frames, dt, resolution, threshold=6.0):
+    """
+    Per-join frame deficit e = dt·rate − frames, with rate the median
+    frames/dt over joins with dt > 0. Joins whose |e − median| exceeds
+    threshold·MAD and the timestamp resolution are returned as step
+    indices (into joins).
+    """
+    ok = dt > 0
+    rate0 = np.median(frames[ok] / dt[ok]) if ok.any() else 0.0
+    e = dt * rate0 - frames
+    dev = e - np.median(e)
+    mad = 1.4826 * np.median(np.abs(dev))
+    limit = np.maximum(threshold * mad, 2 * resolution)
+    return np.flatnonzero(np.abs(dev) > limit), e
+
+
+def observations(tl, idx, nominal):
+    """
+    Wall-clock observations of one session: (t, F, seg, resolution, source)
+    with t seconds since the first one, F frames captured before it, seg
+    the session-relative segment of each, resolution in samples per join.
+    """
+    frames = tl["frames"][idx].astype(np.float64)
+    before = np.concatenate(([0.0], np.cumsum(frames[:-1])))
+    sidecars = [segment_timeline.read_sidecar(p) for p in tl["path"][idx]]
+    if all(sc is not None for sc in sidecars):
+        seg = np.concatenate([np.full(len(sc["sample"]), k) for k, sc in enumerate(sidecars)])
+        ns = np.concatenate([sc["map_ns"] if "map_ns" in sc else sc["realtime_ns"] for sc in sidecars])
+        F = before[seg] + np.concatenate([sc["sample"] for sc in sidecars])
+        t = (ns - ns[0]) / 1e9
+        res = np.full(len(t) - 1, nominal // 1000, dtype=np.int64)   # clock map, ~1 ms
+        return t, F, seg, res, "sidecar"
+    start = tl["start"][idx]
+    res = np.maximum(tl["resolution"][idx][1:], tl["resolution"][idx][:-1])
+    names = sorted({segment_timeline.SOURCES[s] for s in tl["source"][idx]})
+    source = "+".join(names) + (" (carried by segment_writer, no sidecar: steps only)"
+                                if tl["carried"][idx].any() else "")
+    return (start - start[0]) / float(nominal), before, np.arange(len(idx)), res, source
+
+
+def fit_session(tl, idx, nominal, quadratic=True, threshold=6.0):
+    """Fit one session (indices into the timeline). Returns a result dict."""
+    # duplicate copies (or two starts within a name's 1 s) would give dt = 0
+    idx = idx[np.concatenate(([True], np.diff(tl["start"][idx]) > 0))]
+    t, F, seg, res, source = observations(tl, idx, nominal)
+    keep = np.concatenate(([True], np.diff(t) > 0))
+    if not keep.all():
+        t, F, seg = t[keep], F[keep], seg[keep]
+        res = res[keep[1:]]
+    steps, e = find_steps(np.diff(F), np.diff(t), res, threshold)
+
+    # Columns: 1, t, [t²], one Heaviside per step
+    cols = [np.ones_like(t), t]
+    if quadratic and len(t) > 3:
+        cols.append(0.5 * t**2)
+    for j in steps:
+        cols.append((np.arange(len(t)) > j).astype(np.float64))
+    X = np.column_stack(cols)
+    b, r, scale = huber_irls(X, F)
+
+    rate = b[1]
+    drift = b[2] if quadratic and len(t) > 3 else 0.0
+    # Standard error of the rate from the residual scale
+    XtX = X.T @ X
+    try:
+        se = scale * np.sqrt(np.linalg.inv(XtX)[1, 1])
+    except np.linalg.LinAlgError:
+        se = float("nan")
+    n_fixed = X.shape[1] - len(steps)
+    step_list = [{
+        "after": tl["path"][idx[seg[j]]],
+        "before": tl["path"][idx[seg[j + 1]]],
+        "samples": float(b[n_fixed + i]),
+        "ms": float(b[n_fixed + i]) / nominal * 1e3,
+    } for i, j in enumerate(steps)]
+    return {
+        "first": tl["path"][idx[0]],
+        "last": tl["path"][idx[-1]],
+        "segments": len(idx),
+        "source": source,
+        "observations": len(t),
+        "hours": t[-1] / 3600.0,
+        "rate": rate,
+        "rate_se": se,
+        "ppm": (rate / nominal - 1.0) * 1e6,
+        "drift_ppm_per_day": drift / nominal * 1e6 * 86400.0,
+        "residual_rms": float(np.sqrt(np.mean(r**2))),
+        "steps": step_list,
+        "t": t,
+        "seg": idx[seg],
+        "residual": r,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline effective sample-rate and drift estimate from WAV headers.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories (recursive)")
+    parser.add_argument("--nominal", type=int, default=None, help="nominal rate (default: from headers)")
+    parser.add_argument("--start", help="only segments starting on/after YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--end", help="only segments starting before YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--session-break", type=float, default=60.0,
+                        help="gap (s) that starts a new session (default: 60)")
+    parser.add_argument("--step-threshold", type=float, default=6.0,
+                        help="MADs a join must deviate to be flagged as a step (default: 6)")
+    parser.add_argument("--linear", action="store_true", help="fit rate only, no drift term")
+    parser.add_argument("--min-segments", type=int, default=6, help="skip shorter sessions (default: 6)")
+    parser.add_argument("--csv", help="write per-segment residuals to this CSV")
+    args = parser.parse_args()
+
+    tl = segment_timeline.build_timeline(args.paths)
+    if len(tl["start"]) == 0:
+        print("No timestamped .wav files found.")
+        return 1
+    nominal = args.nominal or int(np.median(tl["sample_rate"]))
+
+    keep = np.ones(len(tl["start"]), dtype=bool)
+    for bound, op in ((args.start, np.greater_equal), (args.end, np.less)):
+        if bound:
+            ts = calendar.timegm(datetime.fromisoformat(bound).timetuple())
+            keep &= op(tl["start"], ts * nominal)
+    tl = {k: v[keep] for k, v in tl.items()}
+
+    joins = segment_timeline.analyse_joins(tl, session_break=args.session_break)
+    seg_session = np.concatenate(([0], joins["session"])) if len(tl["start"]) > 1 else np.zeros(len(tl["start"]), int)
+
+    results = []
+    for s in np.unique(seg_session):
+        idx = np.flatnonzero(seg_session == s)
+        if len(idx) < args.min_segments:
+            print(f"session {s}: {len(idx)} segments, skipped (< --min-segments)")
+            continue
+        res = fit_session(tl, idx, nominal, not args.linear, args.step_threshold)
+        results.append((idx, res))
+        print(f"session {s}: {res['segments']} segments, {res['hours']:.1f} h  "
+              f"{os.path.basename(res['first'])} … {os.path.basename(res['last'])}")
+        print(f"    wall clock     {res['source']} ({res['observations']} observations)")
+        print(f"    effective rate {res['rate']:.4f} ± {res['rate_se']:.4f} Hz "
+              f"({res['ppm']:+.2f} ppm vs {nominal})")
+        if not args.linear:
+            print(f"    drift          {res['drift_ppm_per_day']:+.3f} ppm/day")
+        print(f"    residual rms   {res['residual_rms']:.0f} samples")
+        for st in res["steps"]:
+            print(f"    STEP {st['samples']:+.0f} samples ({st['ms']:+.1f} ms) between "
+                  f"{os.path.basename(st['after'])} and {os.path.basename(st['before'])}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "session", "t_s", "residual_samples"])
+            for s, (idx, res) in enumerate(results):
+                for i, t, r in zip(res["seg"], res["t"], res["residual"]):
+                    writer.writerow([tl["path"][i], s, f"{t:.3f}", f"{r:.1f}"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,58 +1,138 @@
 import soundfile as sf
 import argparse
+import calendar
 import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
 
-def extract_tracks(input_wav_file, track_indices, output_base_name):
+import numpy as np
+
+# Header-only parser + timeline from raspberry-pis/; read_header also sees the
+# true length of >4 GB files whose RF64 header was never written.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "raspberry-pis"))
+import wav_header
+import segment_timeline
+from audio_blocks import BLOCK_FRAMES, iter_blocks
+
+
+def extract_tracks(input_wav_file, track_indices, output_base_name, start=None, end=None,
+                   block_frames=BLOCK_FRAMES, use_mmap=False):
     """
     Extracts specified tracks from a multi-track WAV file and saves them
-    as separate single-track WAV files.
+    as separate single-track WAV files, streaming block by block.
 
     Args:
         input_wav_file (str): Path to the input multi-track WAV file.
         track_indices (list): List of track indices to extract (1-based indexing).
         output_base_name (str): Base name for output files (e.g., 'recording_name').
+        start, end (float): Optional range in seconds from the start of the file.
+
+    Returns:
+        (frames_written, bytes_read), or None on error.
     """
     try:
-        # Read the multi-track WAV file
-        data, samplerate = sf.read(input_wav_file)
-
-        # Check if it's actually multi-channel (more than one track)
-        if data.ndim < 2:
-            print(f"Error: Input file '{input_wav_file}' does not appear to be multi-track.")
-            return
+        hdr = wav_header.read_header(input_wav_file)
+    except FileNotFoundError:
+        print(f"Error: Input file '{input_wav_file}' not found.")
+        return None
+    if hdr["frames_on_disk"] is None:
+        print(f"Error: '{input_wav_file}': {'; '.join(hdr['problems'])}")
+        return None
+
+    num_channels = hdr["channels"]
+    samplerate = hdr["sample_rate"]
+    if num_channels < 2:
+        print(f"Error: Input file '{input_wav_file}' does not appear to be multi-track.")
+        return None
+    print(f"Input file has {num_channels} tracks.")
+
+    tracks = []
+    for track_number in track_indices:
+        if track_number <= 0 or track_number > num_channels:
+            print(f"Error: Track {track_number} is out of range (1 to {num_channels}). Skipping track {track_number}.")
+            continue
+        tracks.append(track_number)
+    if not tracks:
+        return None
+
+    total = hdr["frames_on_disk"]
+    start_frame = max(0, int(round((start or 0.0) * samplerate)))
+    stop_frame = total if end is None else min(total, int(round(end * samplerate)))
+    if stop_frame <= start_frame:
+        print(f"Error: empty range {start}..{end} s in '{input_wav_file}'.")
+        return None
+
+    # RF64 only when a single track would pass the 4 GiB RIFF limit
+    out_format = "RF64" if (stop_frame - start_frame) * 4 >= 2**32 - 1024 else "WAV"
+    cols = [t - 1 for t in tracks]   # Convert to 0-based indexing
+    outputs = [sf.SoundFile(f"{output_base_name}_track_{t}.wav", "w", samplerate=samplerate,
+                            channels=1, subtype="FLOAT", format=out_format) for t in tracks]
+    written = 0
+    try:
+        # One pass over the input; every requested track gets each block
+        for block in iter_blocks(input_wav_file, hdr, start_frame, stop_frame, block_frames, use_mmap):
+            for out, c in zip(outputs, cols):
+                out.write(np.ascontiguousarray(block[:, c]))
+            written += len(block)
+    except (sf.LibsndfileError, OSError) as e:
+        print(f"Error reading or writing WAV file: {e}")
+        return None
+    finally:
+        for out in outputs:
+            out.close()
 
-        num_channels = data.shape[1] # Get the number of channels (tracks)
-        print(f"Input file has {num_channels} tracks.")
+    for t, out in zip(tracks, outputs):
+        print(f"Track {t} saved to '{out.name}'")
+    print("Track extraction complete.")
+    return written, written * hdr["block_align"]
 
-        for track_number in track_indices:
-            if track_number <= 0 or track_number > num_channels:
-                print(f"Error: Track {track_number} is out of range (1 to {num_channels}). Skipping track {track_number}.")
-                continue
 
-            track_index_0based = track_number - 1  # Convert to 0-based indexing
-            track_data = data[:, track_index_0based]
-            output_file = f"{output_base_name}_track_{track_number}.wav"
-            sf.write(output_file, track_data, samplerate, subtype='FLOAT')
-            print(f"Track {track_number} saved to '{output_file}'")
+def parse_time(value):
+    """'12.5' → seconds in file; ISO date-time → POSIX seconds (UTC)."""
+    try:
+        return float(value), False
+    except ValueError:
+        return calendar.timegm(datetime.fromisoformat(value).timetuple()), True
 
-        print("Track extraction complete.")
 
-    except sf.LibsndfileError as e:
-        print(f"Error reading or writing WAV file: {e}")
-    except FileNotFoundError:
-        print(f"Error: Input file '{input_wav_file}' not found.")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+def plan_jobs(inputs, start, end):
+    """
+    Return [(path, start_s, end_s)] for the inputs. Offsets in seconds apply
+    to every file; ISO times select the segments overlapping the range and
+    cut each to it (start times from segment_timeline).
+    """
+    s, s_abs = parse_time(start) if start else (None, False)
+    e, e_abs = parse_time(end) if end else (None, False)
+    if not (s_abs or e_abs):
+        return [(p, s, e) for p in wav_header.iter_wavs(inputs)]
+
+    tl = segment_timeline.build_timeline(inputs)
+    jobs = []
+    for path, st, fr, sr in zip(tl["path"], tl["start"], tl["frames"], tl["sample_rate"]):
+        f0, f1 = st / sr, (st + fr) / sr
+        lo = s if s_abs else f0
+        hi = e if e_abs else f1
+        if f1 <= lo or f0 >= hi:
+            continue
+        jobs.append((path, max(0.0, lo - f0), min(f1, hi) - f0))
+    return jobs
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract tracks from a multi-track WAV file.")
-    parser.add_argument("input_file", help="Path to the input multi-track WAV file.")
+    parser = argparse.ArgumentParser(description="Extract tracks from multi-track WAV files (streaming).")
+    parser.add_argument("input_file", nargs="+", help="Input multi-track WAV file(s) or directories (recursive).")
     parser.add_argument("tracks", help="Comma-separated list of track numbers to extract (e.g., '2,5').")
+    parser.add_argument("--start", help="Start: seconds into each file, or ISO time (e.g. 2025-06-01T04:00:00).")
+    parser.add_argument("--end", help="End: seconds into each file, or ISO time.")
+    parser.add_argument("--out-dir", default=".", help="Directory for the output files (default: .).")
+    parser.add_argument("--block-frames", type=int, default=BLOCK_FRAMES,
+                        help=f"Frames per block (default: {BLOCK_FRAMES}).")
+    parser.add_argument("--mmap", action="store_true", help="Memory-map the data chunk instead of read().")
 
     args = parser.parse_args()
 
-    input_file = args.input_file
     tracks_str = args.tracks
 
     try:
@@ -65,7 +145,28 @@ if __name__ == "__main__":
         print("Error: No track numbers specified.")
         exit(1)
 
-    # Create output base name from input file name (remove extension)
-    output_base_name = os.path.splitext(os.path.basename(input_file))[0]
-
-    extract_tracks(input_file, track_indices, output_base_name)
+    os.makedirs(args.out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    total_frames = total_bytes = 0
+    audio_seconds = 0.0
+    for input_file, start_s, end_s in plan_jobs(args.input_file, args.start, args.end):
+        # Create output base name from input file name (remove extension)
+        output_base_name = os.path.join(args.out_dir, os.path.splitext(os.path.basename(input_file))[0])
+        t_file = time.perf_counter()
+        res = extract_tracks(input_file, track_indices, output_base_name, start_s, end_s,
+                             args.block_frames, args.mmap)
+        if res is None:
+            continue
+        frames, nbytes = res
+        dt = time.perf_counter() - t_file
+        sr = wav_header.read_header(input_file)["sample_rate"]
+        print(f"  {frames} frames, {nbytes / 1e6:.1f} MB in {dt:.2f} s "
+              f"({nbytes / 1e6 / dt if dt else 0:.0f} MB/s, {frames / sr / dt if dt else 0:.0f}x real time)")
+        total_frames += frames
+        total_bytes += nbytes
+        audio_seconds += frames / sr
+
+    dt = time.perf_counter() - t0
+    if total_frames:
+        print(f"Total: {audio_seconds / 3600:.2f} h of audio, {total_bytes / 1e6:.1f} MB in {dt:.1f} s "
+              f"({total_bytes / 1e6 / dt:.0f} MB/s, {audio_seconds / dt:.0f}x real time)")
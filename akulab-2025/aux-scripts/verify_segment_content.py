@@ -3,59 +3,182 @@
 """
 verify_spectrogram_and_continuity.py
 
-1) For each .wav in a directory, generate an 8-row spectrogram figure (one row per channel).
-   Save as "<basename>_spectrogram.png".
-
-2) For consecutive .wav files (sorted by name), verify continuity by:
-   - Reading a short region at the end of the first file
-   - Reading a short region at the start of the second file
-   - Plotting them (time domain waveforms) in 8 stacked subplots
-   - Mark a dashed vertical line at the boundary
-   - Save as "<basename1>_TO_<basename2>_waveform_continuous.png"
+1) (--spectrograms) For each .wav in a directory, generate an 8-row spectrogram
+   figure (one row per channel). Save as "<basename>_spectrogram.png", next to
+   "<basename>_spec.npz" with the dB array. Streams the audio, runs on a
+   worker pool and skips segments whose outputs are already up to date.
+
+2) For consecutive .wav files (whole trees, ordered by start time), verify
+   continuity numerically:
+   - Seek to and read only the last/first --window-ms of each pair
+   - Per channel: jump at the join against the local slope (second
+     difference vs. its robust spread), run of exact zeros across the join,
+     and the lag at which the head best repeats the tail (duplicated audio;
+     the expected lag is 0, i.e. no repeat)
+   - Write one CSV table of flagged joins (--csv, --all for every join)
+   - Only for flagged joins: plot the waveforms in stacked subplots with a
+     dashed line at the boundary, saved as
+     "<basename1>_TO_<basename2>_waveform_continuous.png"
 
 Assumes 8-ch, float, 48 kHz, but it should adapt to actual # channels.
 """
 
 import os
 import sys
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
 import numpy as np
-import soundfile as sf
-import matplotlib.pyplot as plt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "raspberry-pis"))
+import spectrogram
+import wav_header
+import segment_timeline
+from audio_blocks import read_frames
 
 # How many seconds to capture at the end of the file
 TAIL_SECONDS = 0.01  # adjust as you like
 # How many seconds to capture at the beginning of the file
 HEAD_SECONDS = 0.01  # adjust as you like
 
+# Flag thresholds
+JUMP_RATIO_LIMIT = 8.0     # |2nd difference at join| / robust spread of 2nd differences
+ZERO_RUN_LIMIT = 4         # exact-zero frames (all channels) across the join
+DUP_CORR_LIMIT = 0.9       # normalised correlation of head with an earlier stretch of tail
+DUP_WINDOW = 32            # samples compared when looking for repeated audio
+
 
 def plot_spectrograms(wavpath, out_png):
     """
-    Read entire file, produce 8 subplots (one per channel) of spectrogram, and save.
+    Produce 8 subplots (one per channel) of spectrogram, and save.
+    Uses the streaming STFT in raspberry-pis/spectrogram.py, so RAM stays
+    bounded for 10-minute 8-channel segments.
     """
-    data, sr = sf.read(wavpath)  # shape: (frames, channels)
-    # data shape => (samples, channels)
+    spec = spectrogram.spectrogram(wavpath)
+    spectrogram.save_png(spec, out_png, os.path.basename(wavpath))
 
-    if data.ndim == 1:
-        # only 1 channel
-        data = data[:, np.newaxis]
-    channels = data.shape[1]
 
-    fig, axes = plt.subplots(channels, 1, figsize=(10, 2*channels), sharex=True)
-    if channels == 1:
-        axes = [axes]  # make it iterable
+def read_join(wav1, wav2, hdr1, hdr2, tail_sec=TAIL_SECONDS, head_sec=HEAD_SECONDS):
+    """
+    Seek to and read the last tail_sec of wav1 and the first head_sec of
+    wav2 as float32 (frames, channels). Headers come from wav_header, so
+    nothing else of the files is touched.
+    """
+    sr = hdr1["sample_rate"]
+    if hdr2["sample_rate"] != sr:
+        print(f"WARNING: sample rates differ for {wav1} ({sr}) vs {wav2} ({hdr2['sample_rate']}).")
+    frames_tail = int(tail_sec * sr)
+    frames_head = int(head_sec * sr)
+    # Make sure we don't go negative
+    start_tail = max(0, hdr1["frames_on_disk"] - frames_tail)
+    data_tail = read_frames(wav1, start_tail, frames_tail, hdr1)
+    data_head = read_frames(wav2, 0, frames_head, hdr2)
+    return data_tail, data_head, sr
 
-    for ch in range(channels):
-        ax = axes[ch]
-        ax.specgram(data[:, ch], Fs=sr, cmap='viridis')
-        ax.set_ylabel(f"Ch{ch+1}")
-        if ch == 0:
-            ax.set_title(os.path.basename(wavpath))
-        if ch == channels - 1:
-            ax.set_xlabel("Time (s)")
 
-    plt.tight_layout()
-    plt.savefig(out_png)
-    plt.close(fig)
+def _unit_windows(x, w):
+    """(n, channels) → (n-w+1, channels, w) zero-mean, unit-norm sliding windows."""
+    win = np.lib.stride_tricks.sliding_window_view(x, w, axis=0)
+    win = win - win.mean(axis=-1, keepdims=True)
+    norm = np.sqrt((win * win).sum(axis=-1, keepdims=True))
+    return np.divide(win, norm, out=np.zeros_like(win), where=norm > 0)
+
+
+def join_metrics(tail, head, dup_window=DUP_WINDOW):
+    """
+    Discontinuity metrics for one join, vectorised over channels.
+
+    jump_ratio  |x[j+1] - 2x[j] + x[j-1]| at the join divided by the robust
+                spread (1.4826 * MAD) of the same second difference inside the
+                windows: a click or cut stands out from the local slope.
+    zero_run    longest run of frames that are exactly 0.0 on all channels,
+                touching the join (ffmpeg padding / dropped buffers).
+    dup_lag     samples back into the tail where the head's first dup_window
+                samples repeat best (expected: 0, no repeat), and dup_corr the
+                excess of that correlation over the tail's own
+                self-similarity at the same lag (so steady tones don't flag).
+    """
+    x = np.concatenate((tail, head)).astype(np.float64)
+    j = len(tail)
+    d2 = x[2:] - 2 * x[1:-1] + x[:-2]                  # index i ↔ sample i+1
+    at_join = np.abs(d2[j - 2:j]).max(axis=0) if j >= 2 and len(head) else np.zeros(x.shape[1])
+    local = np.delete(d2, [j - 2, j - 1], axis=0) if len(d2) > 2 else d2
+    spread = 1.4826 * np.median(np.abs(local - np.median(local, axis=0)), axis=0)
+    jump_ratio = at_join / np.maximum(spread, 1e-12)
+    jump_ratio[(at_join == 0)] = 0.0
+
+    zeros = np.all(x == 0.0, axis=1)
+    back = np.argmin(zeros[:j][::-1]) if not zeros[:j].all() else j
+    fwd = np.argmin(zeros[j:]) if not zeros[j:].all() else len(head)
+    zero_run = int(back + fwd)
+
+    dup_lag, dup_corr = 0, 0.0
+    w = dup_window
+    if len(head) >= w and j >= 2 * w:
+        tw = _unit_windows(tail.astype(np.float64), w)          # window start s = 0 … j-w
+        hz = _unit_windows(head[:w].astype(np.float64), w)[0]
+        c_join = (tw * hz).sum(axis=-1).mean(axis=-1)           # head vs tail[s:s+w]
+        c_self = (tw * tw[-1]).sum(axis=-1).mean(axis=-1)       # tail end vs tail[s:s+w]
+        # Repeat of d samples: head[:w] == tail[j-d : j-d+w], d = w … j-w
+        s = np.arange(w, j - w + 1)
+        excess = c_join[s] - np.maximum(c_self[s - w], 0.0)
+        excess[c_join[s] < DUP_CORR_LIMIT] = -np.inf
+        k = int(np.argmax(excess))
+        if np.isfinite(excess[k]):
+            dup_lag, dup_corr = int(j - s[k]), float(excess[k])
+    return {
+        "jump_ratio": jump_ratio,
+        "zero_run": zero_run,
+        "dup_lag": int(dup_lag),
+        "dup_corr": dup_corr,
+    }
+
+
+def flag_reasons(m):
+    reasons = []
+    if m["jump_ratio"].max() > JUMP_RATIO_LIMIT:
+        reasons.append("jump")
+    if m["zero_run"] >= ZERO_RUN_LIMIT:
+        reasons.append("zeros")
+    if m["dup_lag"] and m["dup_corr"] > 0.5:
+        reasons.append("repeat")
+    return reasons
+
+
+def check_joins(paths, tail_sec=TAIL_SECONDS, head_sec=HEAD_SECONDS):
+    """
+    Yield one row per join of consecutive segments under *paths*.
+    Joins across a timeline gap (recorder restart) are reported but not
+    scored: a discontinuity is expected there.
+    """
+    tl = segment_timeline.build_timeline(paths)
+    joins = segment_timeline.analyse_joins(tl)
+    hdr_next = None
+    for i in range(len(joins["gap"])):
+        wav1, wav2 = tl["path"][i], tl["path"][i + 1]
+        hdr1 = hdr_next or wav_header.read_header(wav1)
+        hdr_next = hdr2 = wav_header.read_header(wav2)
+        row = {"prev": wav1, "next": wav2, "timeline": joins["status"][i],
+               "gap_samples": int(joins["gap"][i]), "jump_ratio": "", "worst_channel": "",
+               "zero_run": "", "dup_lag": "", "dup_corr": "", "flags": ""}
+        if joins["status"][i] == "gap" or not hdr1["frames_on_disk"] or not hdr2["frames_on_disk"]:
+            row["flags"] = "timeline-gap" if joins["status"][i] == "gap" else "empty"
+            yield row
+            continue
+        tail, head, _ = read_join(wav1, wav2, hdr1, hdr2, tail_sec, head_sec)
+        if tail.shape[1] != head.shape[1]:
+            row["flags"] = "channel-mismatch"
+            yield row
+            continue
+        m = join_metrics(tail, head)
+        row.update(jump_ratio=round(float(m["jump_ratio"].max()), 2),
+                   worst_channel=int(np.argmax(m["jump_ratio"])) + 1,
+                   zero_run=m["zero_run"], dup_lag=m["dup_lag"], dup_corr=round(m["dup_corr"], 3),
+                   flags=";".join(flag_reasons(m)))
+        yield row
 
 
 def plot_boundary_continuity(wav1, wav2, out_png, tail_sec=0.1, head_sec=0.1):
@@ -64,31 +187,8 @@ def plot_boundary_continuity(wav1, wav2, out_png, tail_sec=0.1, head_sec=0.1):
     then plot waveforms for all channels stacked, with a dashed line
     at the boundary. Save figure to out_png.
     """
-    info1 = sf.info(wav1)
-    info2 = sf.info(wav2)
-
-    sr1, sr2 = info1.samplerate, info2.samplerate
-    if sr1 != sr2:
-        print(f"WARNING: sample rates differ for {wav1} ({sr1}) vs {wav2} ({sr2}).")
-        # We'll just proceed, but you'd typically handle this more gracefully.
-
-    sr = sr1  # assume they match
-
-    frames1 = info1.frames
-    frames_tail = int(tail_sec * sr)
-    frames_head = int(head_sec * sr)
-
-    # Make sure we don't go negative
-    start_tail = max(0, frames1 - frames_tail)
-
-    data_tail, _ = sf.read(wav1, start=start_tail, frames=frames_tail, dtype='float32')
-    data_head, _ = sf.read(wav2, start=0, frames=frames_head, dtype='float32')
-
-    # If either is 1D, reshape
-    if data_tail.ndim == 1:
-        data_tail = data_tail[:, np.newaxis]
-    if data_head.ndim == 1:
-        data_head = data_head[:, np.newaxis]
+    data_tail, data_head, sr = read_join(wav1, wav2, wav_header.read_header(wav1),
+                                         wav_header.read_header(wav2), tail_sec, head_sec)
 
     # For simpler code, ensure same #channels
     if data_tail.shape[1] != data_head.shape[1]:
@@ -105,7 +205,11 @@ def plot_boundary_continuity(wav1, wav2, out_png, tail_sec=0.1, head_sec=0.1):
     time = np.linspace(0, total_frames / sr, total_frames, endpoint=False)
     boundary_time = data_tail.shape[0] / sr  # where the tail ends
 
-    # Plot waveforms
+    # Plot waveforms (matplotlib only imported when a join is plotted)
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(channels, 1, figsize=(10, 2*channels), sharex=True)
     if channels == 1:
         axes = [axes]
@@ -126,44 +230,60 @@ def plot_boundary_continuity(wav1, wav2, out_png, tail_sec=0.1, head_sec=0.1):
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: verify_spectrogram_and_continuity.py <directory_of_wav_files>")
-        sys.exit(1)
-
-    directory = sys.argv[1]
-    # Gather all WAV files
-    wavs = [f for f in os.listdir(directory) if f.lower().endswith('.wav')]
-    if not wavs:
+    parser = argparse.ArgumentParser(description="Join continuity table (+ plots of flagged joins) and spectrograms.")
+    parser.add_argument("paths", nargs="+", help="directories (recursive) or .wav files")
+    parser.add_argument("--csv", default="boundary_report.csv", help="table of joins (default: boundary_report.csv)")
+    parser.add_argument("--all", action="store_true", help="write every join, not only flagged ones")
+    parser.add_argument("--window-ms", type=float, default=TAIL_SECONDS * 1000,
+                        help="tail/head window per join (default: 10 ms)")
+    parser.add_argument("--plot-dir", default=None, help="where flagged-join PNGs go (default: next to the WAV)")
+    parser.add_argument("--plot-all", action="store_true", help="plot every join (old behaviour)")
+    parser.add_argument("--no-plots", action="store_true", help="table only")
+    parser.add_argument("--spectrograms", action="store_true", help="also make per-segment spectrograms")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for spectrograms")
+    args = parser.parse_args()
+
+    wavpaths = list(wav_header.iter_wavs(args.paths))
+    if not wavpaths:
         print("No .wav files found.")
         return
 
-    # Sort by name (assuming the date-based filenames already sort chronologically)
-    wavs.sort()
-    wavpaths = [os.path.join(directory, w) for w in wavs]
-
-    # 1) Create spectrogram for each
-    #for wp in wavpaths:
-    #    out_png = wp.rsplit('.', 1)[0] + "_spectrogram.png"
-    #    print(f"Creating spectrogram for {wp}")
-    #    plot_spectrograms(wp, out_png)
-
-    # 2) Create continuity plots between consecutive pairs
-    for i in range(len(wavpaths) - 1):
-        wp1 = wavpaths[i]
-        wp2 = wavpaths[i+1]
-        # e.g. "zoom_audio_20250414_113100_TO_zoom_audio_20250414_113200_waveform_continuous.png"
-        out_png = (wp1.rsplit('.', 1)[0] + 
-                   "_TO_" + 
-                   os.path.basename(wp2).rsplit('.',1)[0] + 
-                   "_waveform_continuous.png")
-        out_png = out_png.replace('/', '_')  # just in case, remove extra path separators
-        out_png = os.path.join(directory, os.path.basename(out_png))
-        print(f"Checking boundary continuity between {wp1} and {wp2}")
-        plot_boundary_continuity(wp1, wp2, out_png, 
-                                 tail_sec=TAIL_SECONDS, 
-                                 head_sec=HEAD_SECONDS)
+    # 1) Create spectrogram for each (skips up-to-date ones)
+    if args.spectrograms:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for res in pool.map(partial(spectrogram.process_file, png=True), wavpaths):
+                print(f"Spectrogram for {res['file']}: {res['status']}")
+
+    # 2) Numeric continuity check of every join; plots only where flagged
+    win = args.window_ms / 1000.0
+    n_joins = n_flagged = 0
+    fields = ["prev", "next", "timeline", "gap_samples", "jump_ratio", "worst_channel",
+              "zero_run", "dup_lag", "dup_corr", "flags"]
+    with open(args.csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in check_joins(wavpaths, win, win):
+            n_joins += 1
+            flagged = bool(row["flags"]) and row["flags"] != "timeline-gap"
+            n_flagged += flagged
+            if flagged or args.all:
+                writer.writerow(row)
+            if flagged:
+                print(f"FLAGGED {row['flags']:12s} {os.path.basename(row['prev'])} -> "
+                      f"{os.path.basename(row['next'])} (jump x{row['jump_ratio']} ch{row['worst_channel']}, "
+                      f"zeros {row['zero_run']}, repeat lag {row['dup_lag']})")
+            if args.no_plots or not (flagged or args.plot_all):
+                continue
+            wp1, wp2 = row["prev"], row["next"]
+            # e.g. "zoom_audio_20250414_113100_TO_zoom_audio_20250414_113200_waveform_continuous.png"
+            out_png = (os.path.basename(wp1).rsplit('.', 1)[0] +
+                       "_TO_" +
+                       os.path.basename(wp2).rsplit('.', 1)[0] +
+                       "_waveform_continuous.png")
+            out_png = os.path.join(args.plot_dir or os.path.dirname(wp1), out_png)
+            plot_boundary_continuity(wp1, wp2, out_png, tail_sec=win, head_sec=win)
+    print(f"{n_joins} joins checked, {n_flagged} flagged -> {args.csv}")
 
 
 if __name__ == "__main__":
     main()
-
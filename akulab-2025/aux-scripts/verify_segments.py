@@ -3,154 +3,330 @@
 """
 verify_segments.py
 
-Verifies:
-- Each WAV file is 8-ch, 32-bit float, 48k sample rate
-- Average sample rate matches ~ 48000
-- (Optionally) checks continuity by looking for zero-gap between chunk files
-- (Optional) if a known test tone was played, do a quick spectral check
-  to confirm the presence of that frequency
+Verifies every WAV segment under one or more directories (recursively, e.g.
+a whole season of date-partitioned NAS folders; float_codec .wav.f32z
+archives are checked under their .wav name):
+- Each WAV file is 8-ch, 32-bit float, at the configured sample rate
+- Frame count matches segment_time * sample_rate (from config.ini)
+- The header agrees with the file size (see raspberry-pis/wav_header.py)
+- (Optional) if known test tones were played, check every channel for
+  each frequency in windows across the file (raspberry-pis/tone_detect.py)
+- Continuity: gaps/overlaps between consecutive segments in samples, from
+  BEXT time_reference / origination time or the file name, plus frame
+  counts (see raspberry-pis/segment_timeline.py)
+
+Files are checked on a process pool. Each worker reads headers only, plus at
+most --max-mem-mb of audio for the tone check, and can be hard-capped with
+--memory-limit-mb, so a full-season scan cannot exhaust a Pi's RAM.
+
+Results are appended as JSON lines to --report as they finish. Re-running
+with the same report skips files already checked (same size and mtime), so
+an interrupted scan resumes where it stopped. A file whose check fails
+(vanished, unreadable, or its worker killed by the memory cap) is reported
+with status 'error' and the scan goes on; a pool broken by a dead worker is
+rebuilt for the files it had not finished.
+
+Usage:
+    verify_segments.py <dir> [<dir> ...] [known_freq_in_Hz]
+                       [--report verify_report.jsonl] [--workers N]
 """
 
 import os
 import sys
-import soundfile as sf
-import numpy as np
+import json
+import time
+import argparse
+import configparser
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+RPI_DIR = Path(__file__).resolve().parent.parent / "raspberry-pis"
+sys.path.insert(0, str(RPI_DIR))
+import wav_header
+
+EXPECTED_CHANNELS = 8
+EXPECTED_SUBTYPE = "FLOAT"
+
+# Per-worker settings, filled in by init_worker()
+_MAX_READ_BYTES = 64 * 1024**2
+
+
+def read_recording_config(config_path):
+    """Return (sample_rate, segment_time) from the [recordingpi] section."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return (config.getint("recordingpi", "sample_rate", fallback=48000),
+            config.getint("recordingpi", "segment_time", fallback=600))
+
+
+def init_worker(max_mem_mb, memory_limit_mb):
+    """Pool initializer: set the read budget and an optional hard RAM cap."""
+    global _MAX_READ_BYTES
+    _MAX_READ_BYTES = int(max_mem_mb * 1024**2)
+    if memory_limit_mb:
+        import resource
+        limit = int(memory_limit_mb * 1024**2)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
 
 
-def analyze_file(filepath, known_freq=None):
+def stat_segment(filepath):
+    """os.stat of the segment, or of its float_codec archive if only that exists."""
+    if not os.path.exists(filepath) and os.path.exists(filepath + wav_header.ARCHIVE_SUFFIX):
+        filepath += wav_header.ARCHIVE_SUFFIX
+    return os.stat(filepath)
+
+
+def analyze_file(filepath, known_freq=None, sample_rate=48000, segment_time=600,
+                 frame_tolerance=0):
     """
     Returns a dict with:
       - channels
       - samplerate
       - subtype
-      - frames
-      - duration (seconds)
-      - avg_sample_rate (frames / duration)
-      - freq_ok (True/False) if known_freq is specified
+      - frames (frames on disk)
+      - duration (seconds, frames / samplerate)
+      - status: ok | short | long | bad_format | bad_header | error
+      - problems (list of strings)
+      - freq_ok (True/False) if known_freq (Hz, or a list of Hz) is specified,
+        and tone_channels: per frequency, the fraction of windows the tone
+        was found in on each channel
     """
-    info = sf.info(filepath)
-    samplerate = info.samplerate
-    frames = info.frames
-    duration = 60 #frames / float(samplerate) if samplerate else 0.0
+    st = stat_segment(filepath)
+    result = {
+        'file': str(filepath),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'samplerate': None,
+        'channels': None,
+        'subtype': None,
+        'frames': None,
+        'expected_frames': sample_rate * segment_time,
+        'duration': None,
+        'status': 'ok',
+        'problems': [],
+        'freq_ok': None,
+        'tone_channels': None,
+    }
+    try:
+        hdr = wav_header.read_header(filepath)
+    except OSError as e:
+        result['status'] = 'error'
+        result['problems'].append(f"read error: {e}")
+        return result
 
-    subtype = info.subtype  # e.g. 'FLOAT'
-    channels = info.channels
+    result.update(samplerate=hdr['sample_rate'], channels=hdr['channels'],
+                  subtype=hdr['subtype'], frames=hdr['frames_on_disk'])
+    problems = result['problems']
+    problems.extend(hdr['problems'])
 
-    avg_sr = None
-    if duration > 0:
-        avg_sr = frames / duration
+    if hdr['channels'] != EXPECTED_CHANNELS:
+        problems.append(f"channels {hdr['channels']} != {EXPECTED_CHANNELS}")
+    if hdr['subtype'] != EXPECTED_SUBTYPE:
+        problems.append(f"subtype {hdr['subtype']} != {EXPECTED_SUBTYPE}")
+    if hdr['sample_rate'] != sample_rate:
+        problems.append(f"samplerate {hdr['sample_rate']} != {sample_rate}")
 
-    result = {
-        'file': os.path.basename(filepath),
-        'samplerate': samplerate,
-        'channels': channels,
-        'subtype': subtype,
-        'frames': frames,
-        'duration': duration,
-        'avg_sample_rate': avg_sr,
-        'freq_ok': None
-    }
+    if problems:
+        fmt_bad = any(p.startswith(("channels", "subtype", "samplerate")) for p in problems)
+        result['status'] = 'bad_format' if fmt_bad else 'bad_header'
+    if hdr['frames_on_disk'] is None:
+        return result
 
-    # If a known frequency is provided, do a short spectral check
-    if known_freq is not None and duration > 0:
-        # Read a chunk of audio data (e.g. first few seconds)
-        # to reduce memory usage for hour-long files
-        # Let's read 2 seconds from the middle of the file
-        start_frame = frames // 2
-        read_frames = min(samplerate * 2, frames - start_frame)
-        if read_frames < 1:
-            # fallback to reading entire file if too short
-            start_frame = 0
-            read_frames = frames
-
-        data, _ = sf.read(filepath, start=start_frame, frames=int(read_frames), dtype='float32')
-        if data.ndim > 1:
-            # If multi-channel, pick just one channel for test
-            data = data[:, 0]
-
-        # Quick & dirty FFT approach
-        fft_data = np.fft.rfft(data)
-        freqs = np.fft.rfftfreq(len(data), d=1.0/samplerate)
-        mag = np.abs(fft_data)
-
-        # Find which frequency bin is strongest
-        idx_max = np.argmax(mag)
-        peak_freq = freqs[idx_max]
-
-        # Check if the peak is near known_freq (± a tolerance)
-        tolerance = 2.0  # ±2 Hz
-        result['freq_ok'] = abs(peak_freq - known_freq) < tolerance
+    frames = hdr['frames_on_disk']
+    result['duration'] = frames / float(hdr['sample_rate']) if hdr['sample_rate'] else None
+    diff = frames - result['expected_frames']
+    if result['status'] == 'ok' and abs(diff) > frame_tolerance:
+        # Short segments are normal at the start/end of a recording session.
+        result['status'] = 'short' if diff < 0 else 'long'
+        problems.append(f"frames {frames} differ from expected by {diff:+d}")
 
+    # If a known frequency is provided, do a short spectral check
+    if known_freq is not None and frames > 0 and result['status'] not in ('bad_format', 'error'):
+        result['freq_ok'], result['tone_channels'] = check_tone(filepath, hdr, known_freq)
     return result
 
 
+def check_tone(filepath, hdr, known_freq, window_s=0.5, step_s=60.0, snr_db=10.0):
+    """
+    Test for one or more known tones on every channel in short windows spread
+    over the file (tone_detect.detect_tones: single-bin DFT bank, only the
+    windows are read, each capped by the worker's memory budget). Returns
+    (freq_ok, detail): freq_ok is True if every tone is present on every
+    channel in at least half the windows; detail maps each frequency to the
+    per-channel fraction of windows it was found in.
+    """
+    import tone_detect
+    freqs = [known_freq] if isinstance(known_freq, (int, float)) else list(known_freq)
+    bytes_per_frame = hdr['block_align'] or 4 * hdr['channels']
+    window_s = min(window_s, _MAX_READ_BYTES / float(bytes_per_frame * hdr['sample_rate']))
+    res = tone_detect.detect_tones(filepath, freqs, window_s, step_s, snr_db, hdr)
+    if not len(res['times']):
+        return False, {}
+    frac = res['present'].mean(axis=0)                 # (channels, freqs)
+    detail = {f"{f:g}": [round(float(v), 2) for v in frac[:, j]] for j, f in enumerate(freqs)}
+    return bool((frac >= 0.5).all()), detail
+
+
+def find_wavs(directories):
+    """Recursively list segments (sorted, so date-partitioned trees come out in time order)."""
+    return list(wav_header.iter_wavs(directories))
+
+
+def load_report(report_path):
+    """Return {path: result} for files already in the report (for resume)."""
+    done = {}
+    if report_path and os.path.exists(report_path):
+        with open(report_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    res = json.loads(line)
+                except ValueError:
+                    continue   # torn last line after a crash
+                done[res['file']] = res
+    return done
+
+
+def run_pool(files, args, known_freq, sample_rate, segment_time):
+    """
+    Check 'files' on a fresh pool, yielding each result as it finishes; a
+    failed check becomes an 'error' result. Returns the files that were
+    still unfinished when a worker died and broke the pool.
+    """
+    broken = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.max_mem_mb, args.memory_limit_mb)) as pool:
+        futures = {pool.submit(analyze_file, wf, known_freq, sample_rate, segment_time,
+                               args.frame_tolerance): wf for wf in files}
+        for fut in as_completed(futures):
+            wf = futures[fut]
+            try:
+                res = fut.result()
+            except BrokenProcessPool:
+                broken.append(wf)
+                continue
+            except MemoryError:
+                res = {'file': wf, 'status': 'error', 'problems': ['memory limit exceeded']}
+            except Exception as e:
+                res = {'file': wf, 'status': 'error', 'problems': [f"{type(e).__name__}: {e}"]}
+            yield res
+    return broken
+
+
+def check_all(files, args, known_freq, sample_rate, segment_time):
+    """
+    Yield a result for every file. When a worker dies, the unfinished files
+    go to a fresh pool; if a pool finishes nothing, its first file is
+    checked on its own and reported as an error if it kills that worker too.
+    """
+    while files:
+        broken = set((yield from run_pool(files, args, known_freq, sample_rate, segment_time)))
+        if broken and len(broken) == len(files):
+            culprit = files[0]
+            if (yield from run_pool([culprit], args, known_freq, sample_rate, segment_time)):
+                yield {'file': culprit, 'status': 'error',
+                       'problems': ['worker process died (memory limit?)']}
+            broken.discard(culprit)
+        files = [wf for wf in files if wf in broken]
+
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: verify_segments.py <directory_of_wavs> [known_freq_in_Hz]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Verify WAV segments in directory trees.")
+    parser.add_argument("paths", nargs="+",
+                        help="directories to scan; a trailing number is taken as known_freq (Hz)")
+    parser.add_argument("--known-freq", type=float, action="append", default=None,
+                        help="test tone frequency (Hz); repeat for several")
+    parser.add_argument("--config", default=str(RPI_DIR / "config.ini"),
+                        help="config.ini with [recordingpi] sample_rate/segment_time")
+    parser.add_argument("--sample-rate", type=int, default=None, help="override config sample_rate")
+    parser.add_argument("--segment-time", type=int, default=None, help="override config segment_time (s)")
+    parser.add_argument("--frame-tolerance", type=int, default=0,
+                        help="allowed |frames - expected| before flagging (default: 0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--max-mem-mb", type=float, default=64,
+                        help="max audio read per worker for content checks (default: 64)")
+    parser.add_argument("--memory-limit-mb", type=float, default=None,
+                        help="hard address-space limit per worker (RLIMIT_AS)")
+    parser.add_argument("--report", default="verify_report.jsonl",
+                        help="JSON-lines report, also used to resume (default: verify_report.jsonl)")
+    parser.add_argument("--quiet", action="store_true", help="only print files with problems")
+    parser.add_argument("--no-continuity", action="store_true", help="skip the gap/overlap check")
+    args = parser.parse_args()
 
-    directory = sys.argv[1]
-    known_freq = None
-    if len(sys.argv) == 3:
-        known_freq = float(sys.argv[2])
+    # Backwards compatible: verify_segments.py <dir> [known_freq]
+    directories = list(args.paths)
+    known_freq = args.known_freq
+    if len(directories) > 1 and not os.path.isdir(directories[-1]):
+        try:
+            known_freq = (known_freq or []) + [float(directories.pop())]
+        except ValueError:
+            pass
 
-    wav_files = sorted(
-        [os.path.join(directory, f) for f in os.listdir(directory)
-         if f.lower().endswith('.wav')]
-    )
+    sample_rate, segment_time = read_recording_config(args.config)
+    sample_rate = args.sample_rate or sample_rate
+    segment_time = args.segment_time or segment_time
 
+    wav_files = find_wavs(directories)
     if not wav_files:
-        print("No .wav files found in", directory)
+        print("No .wav files found in", " ".join(directories))
         sys.exit(1)
 
-    prev_end_time = 0.0
-    for i, wf in enumerate(wav_files):
-        res = analyze_file(wf, known_freq=known_freq)
-
-        # Print summary
-        print(f"File: {res['file']}")
-        print(f"  Channels = {res['channels']}")
-        print(f"  Samplerate = {res['samplerate']} (should be 48000)")
-        print(f"  Subtype = {res['subtype']} (should be FLOAT for 32-bit float)")
-        print(f"  Frames = {res['frames']}")
-        print(f"  Duration = {res['duration']:.3f}s")
-        print(f"  Average sample rate = {res['avg_sample_rate']:.2f} Hz")
-
-        if known_freq is not None:
-            if res['freq_ok'] is True:
-                print(f"  Found expected test tone near {known_freq} Hz")
-            elif res['freq_ok'] is False:
-                print(f"  WARNING: Did NOT find tone near {known_freq} Hz!")
-            else:
-                print("  (freq_ok not tested, possibly too short file)")
-
-        # Check for suspicious sample rate drift
-        sr_diff = abs(res['avg_sample_rate'] - 48000)
-        if sr_diff > 20:
-            print(f"  WARNING: sample rate drift ~ {sr_diff:.2f} Hz from 48000")
-
-        # Optional continuity check:
-        # If the files are named with a timestamp, you might parse them
-        # or if you assume each chunk is exactly 3600s, compare durations etc.
-        # For simplicity, we skip reading file name times. Just an example approach:
-        # For chunk i, it starts right after chunk i-1 ends, ideally with zero gap.
-        # But if there's top-of-hour alignment, you may see a small difference.
-
-        # e.g., if i>0: check if there's a big time gap from prev_end_time
-        if i > 0:
-            # In a perfect chain, current file's start_time ~ prev_end_time
-            # but your chunk alignment might be top-of-hour vs. purely sequential.
-            # We'll just demonstrate the idea:
-            gap_sec = 0.0  # if we had real start times, we'd compute them
-            if abs(gap_sec) > 0.2:
-                print(f"  POSSIBLE GAP of {gap_sec:.3f}s from previous chunk!")
-        prev_end_time += res['duration']
+    done = load_report(args.report)
+    todo = []
+    for wf in wav_files:
+        prev = done.get(wf)
+        try:
+            st = stat_segment(wf)
+        except OSError:
+            todo.append(wf)                    # vanished: reported as an error below
+            continue
+        if prev and prev.get('size') == st.st_size and prev.get('mtime') == st.st_mtime:
+            continue
+        todo.append(wf)
+    print(f"{len(wav_files)} files, {len(wav_files) - len(todo)} already in {args.report}, "
+          f"checking {len(todo)} with {args.workers} workers "
+          f"(expect {sample_rate} Hz x {segment_time} s)")
 
-        print()
+    counts = {}
+    t0 = time.perf_counter()
+    with open(args.report, "a", encoding="utf-8") as report:
+        for res in check_all(todo, args, known_freq, sample_rate, segment_time):
+            report.write(json.dumps(res) + "\n")
+            report.flush()
+            counts[res['status']] = counts.get(res['status'], 0) + 1
+
+            if res['status'] != 'ok' or not args.quiet:
+                print(f"{res['status']:10s} {res['file']}")
+                for p in res['problems']:
+                    print(f"           {p}")
+            if known_freq is not None and res.get('freq_ok') is False:
+                for f, fracs in (res.get('tone_channels') or {}).items():
+                    missing = [str(c + 1) for c, v in enumerate(fracs) if v < 0.5]
+                    if missing:
+                        print(f"           WARNING: tone {f} Hz missing on channel(s) {','.join(missing)}")
+                if not res.get('tone_channels'):
+                    print(f"           WARNING: Did NOT find tone near {known_freq} Hz!")
+
+    dt = time.perf_counter() - t0
+    print()
+    print(f"Checked {len(todo)} files in {dt:.1f} s: " +
+          ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
 
+    # Continuity across all files (headers only, so cheap even on resume)
+    if not args.no_continuity:
+        import segment_timeline
+        tl = segment_timeline.build_timeline(wav_files, default_rate=sample_rate)
+        joins = segment_timeline.analyse_joins(tl)
+        print()
+        for r in segment_timeline.join_rows(tl, joins):
+            print(f"POSSIBLE {r['status'].upper()} of {r['gap_samples']:+d} samples "
+                  f"({r['gap_s']:+.3f} s) [{r['source']}] "
+                  f"{os.path.basename(r['prev'])} -> {os.path.basename(r['next'])}")
+        for s in segment_timeline.session_summary(tl, joins):
+            print(f"Session {s['session']}: {s['segments']} segments, "
+                  f"drift {s['drift_samples']:+d} samples ({s['drift_ppm']:+.1f} ppm)")
     print("Done verifying files.")
 
 
 if __name__ == "__main__":
     main()
-
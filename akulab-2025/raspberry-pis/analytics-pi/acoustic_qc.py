@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+acoustic_qc.py
+
+Per-segment acoustic QC of the eight microphones, so a dead, clipping or
+DC-shifted channel is noticed the same day.
+
+Every run (cron, after backup_recordings.py) takes the segments listed in
+synced_files.log that have not been checked yet, streams each one once from
+the NAS (audio_blocks.iter_blocks, bounded memory) and computes per channel,
+vectorised over all channels:
+
+  rms_db     AC RMS level, dBFS
+  peak_db    largest |sample|, dBFS
+  clips      samples with |x| >= clip_level
+  dc         mean (DC offset)
+  silence    fraction of silence_window_s windows below silence_dbfs
+  xcorr      largest |Pearson r| with any other channel (cross-talk / short)
+
+One row per segment is appended to a compact per-day binary index
+(binlog.py format):
+    /home/<user>/logs/acoustic_qc/<DATE>_acoustic_qc.bin
+with columns timestamp, file, frames, then <metric>_<mic> for each mic.
+Checked files are listed in acoustic_qc/checked_files.log.
+
+Thresholds and the channel → microphone names (same order as the
+record_zoom.sh metadata) live in [acoustic_qc] in config.ini; mic_status()
+turns a row into OK / DEAD / SILENT / CLIP / DC / XTALK and is also used by
+summarize_daily_logs.py for the per-microphone table.
+
+Usage:
+    python3 acoustic_qc.py                    # new synced segments
+    python3 acoustic_qc.py /media/nas/Audio/2025-06-01/*.wav
+"""
+
+import os
+import sys
+import time
+import getpass
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import binlog
+import wav_header
+import segment_timeline
+from audio_blocks import iter_blocks
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+DEFAULT_MICS = ["BOND6", "FAR3", "TRI6", "TRI7C", "BOND1", "ROST2", "TRI2", "Bjorn1"]
+METRICS = ["rms_db", "peak_db", "clips", "dc", "silence", "xcorr"]
+STATUS_ORDER = ["DEAD", "CLIP", "SILENT", "XTALK", "DC", "OK"]   # worst first
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_qc_config(config_path=CONFIG_PATH):
+    """Return the [acoustic_qc] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["acoustic_qc"] if config.has_section("acoustic_qc") else {}
+    get = lambda k, d: float(sec.get(k, d))
+    mics = [m.strip() for m in sec.get("mic_names", ",".join(DEFAULT_MICS)).split(",") if m.strip()]
+    return {
+        "mic_names": mics,
+        "clip_level": get("clip_level", 1.0),
+        "silence_dbfs": get("silence_dbfs", -90.0),
+        "silence_window_s": get("silence_window_s", 0.1),
+        "dead_dbfs": get("dead_dbfs", -110.0),
+        "silence_limit": get("silence_limit", 0.5),
+        "clip_limit": get("clip_limit", 0),
+        "dc_limit": get("dc_limit", 0.01),
+        "xtalk_limit": get("xtalk_limit", 0.98),
+        "audio_dir": config.get("analyticspi", "to_audio_dir", fallback="/media/nas/Audio"),
+    }
+
+
+def mic_names(cfg, channels):
+    names = list(cfg["mic_names"][:channels])
+    return names + [f"ch{i + 1}" for i in range(len(names), channels)]
+
+###############################################################################
+# QC ENGINE
+###############################################################################
+
+def _db(x):
+    return 20.0 * np.log10(np.maximum(x, 1e-12))
+
+
+def segment_qc(path, cfg, hdr=None):
+    """
+    Stream one segment and return a dict of per-channel arrays (METRICS)
+    plus 'frames' and 'channels'.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    ch = hdr["channels"]
+    win = max(1, int(cfg["silence_window_s"] * hdr["sample_rate"]))
+    silence_ms = 10.0 ** (cfg["silence_dbfs"] / 10.0)      # mean-square threshold
+
+    n = 0
+    s1 = np.zeros(ch)
+    cross = np.zeros((ch, ch))
+    peak = np.zeros(ch)
+    clips = np.zeros(ch, dtype=np.int64)
+    quiet = np.zeros(ch, dtype=np.int64)
+    windows = 0
+    carry = np.zeros((0, ch), dtype=np.float32)
+
+    for block in iter_blocks(path, hdr):
+        x = block.astype(np.float64)
+        n += len(x)
+        s1 += x.sum(axis=0)
+        cross += x.T @ x                       # diagonal = Σx², off-diagonal for correlation
+        np.maximum(peak, np.abs(x).max(axis=0), out=peak)
+        clips += (np.abs(x) >= cfg["clip_level"]).sum(axis=0)
+
+        # Silence: whole windows only, remainder carried to the next block
+        w = np.concatenate((carry, block)) if len(carry) else block
+        k = len(w) // win
+        if k:
+            ms = (w[:k * win].astype(np.float64) ** 2).reshape(k, win, ch).mean(axis=1)
+            quiet += (ms < silence_ms).sum(axis=0)
+            windows += k
+        carry = w[k * win:].copy()
+
+    if n == 0:
+        nan = np.full(ch, np.nan)
+        return {"frames": 0, "channels": ch, "rms_db": nan, "peak_db": nan,
+                "clips": np.zeros(ch, dtype=np.int64), "dc": nan, "silence": nan, "xcorr": nan}
+
+    mean = s1 / n
+    cov = cross / n - np.outer(mean, mean)
+    var = np.maximum(np.diag(cov), 0.0)
+    denom = np.sqrt(np.outer(var, var))
+    corr = np.divide(cov, denom, out=np.zeros_like(cov), where=denom > 0)
+    np.fill_diagonal(corr, 0.0)
+    return {
+        "frames": n,
+        "channels": ch,
+        "rms_db": _db(np.sqrt(var)),
+        "peak_db": _db(peak),
+        "clips": clips,
+        "dc": mean,
+        "silence": quiet / windows if windows else np.full(ch, np.nan),
+        "xcorr": np.abs(corr).max(axis=1) if ch > 1 else np.zeros(ch),
+    }
+
+
+def mic_status(m, cfg):
+    """Status of one microphone from its metrics (dict metric → value)."""
+    def val(k):
+        v = m.get(k)
+        return np.nan if v is None else float(v)
+    if np.isnan(val("rms_db")) or val("rms_db") < cfg["dead_dbfs"] or val("silence") >= 0.99:
+        return "DEAD"
+    if val("clips") > cfg["clip_limit"]:
+        return "CLIP"
+    if val("silence") > cfg["silence_limit"]:
+        return "SILENT"
+    if val("xcorr") > cfg["xtalk_limit"]:
+        return "XTALK"
+    if abs(val("dc")) > cfg["dc_limit"]:
+        return "DC"
+    return "OK"
+
+###############################################################################
+# INDEX
+###############################################################################
+
+def index_row(path, qc, names):
+    """(header, row, types) for one segment's binlog record."""
+    t = segment_timeline.parse_name_time(path)
+    stamp = (datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+             if t is not None else "")
+    header = ["timestamp", "file", "frames"]
+    row = [stamp, os.path.basename(path), int(qc["frames"])]
+    types = {"timestamp": "s20", "file": "s48", "frames": "i8"}
+    for metric in METRICS:
+        for i, name in enumerate(names):
+            col = f"{metric}_{name}"
+            header.append(col)
+            v = qc[metric][i]
+            row.append(int(v) if metric == "clips" else (None if np.isnan(v) else float(v)))
+            types[col] = "i8" if metric == "clips" else "f8"
+    return header, row, types
+
+
+def read_index(log_dir, log_date):
+    """Return (columns, rows as dicts) of one day's QC index (all parts)."""
+    cols, rows = [], []
+    for part in binlog.day_files(log_dir, f"{log_date}_acoustic_qc"):
+        part_cols, part_rows = binlog.read_records(part)
+        cols.extend(c for c in part_cols if c not in cols)
+        rows.extend(dict(zip(part_cols, r)) for r in part_rows)
+    rows.sort(key=lambda r: r.get("timestamp") or "")
+    return cols, rows
+
+
+def day_mics(cols):
+    """Microphone names present in an index, in channel order."""
+    return [c[len("rms_db_"):] for c in cols if c.startswith("rms_db_")]
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def new_segments(cfg, checked_log, synced_log):
+    """Synced segments (absolute paths on the NAS) not yet in checked_log."""
+    done = set()
+    if checked_log.is_file():
+        done = {l.strip() for l in checked_log.read_text(encoding="utf-8").splitlines() if l.strip()}
+    todo = []
+    if synced_log.is_file():
+        for line in synced_log.read_text(encoding="utf-8").splitlines():
+            rel = line.strip()
+            if rel and rel not in done:
+                todo.append(rel)
+    return [(rel, os.path.join(cfg["audio_dir"], rel)) for rel in todo]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-segment acoustic QC → per-day binary index.")
+    parser.add_argument("paths", nargs="*", help="WAVs/directories to check (default: new synced segments)")
+    parser.add_argument("--max-files", type=int, default=0, help="stop after N segments (0 = all)")
+    args = parser.parse_args()
+
+    cfg = read_qc_config()
+    user = getpass.getuser()
+    log_dir = Path(f"/home/{user}/logs/acoustic_qc")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    checked_log = log_dir / "checked_files.log"
+
+    if args.paths:
+        jobs = [(p, p) for p in wav_header.iter_wavs(args.paths)]
+    else:
+        synced_log = Path(f"/home/{user}/logs/backup_recordings/synced_files/synced_files.log")
+        jobs = new_segments(cfg, checked_log, synced_log)
+    if args.max_files:
+        jobs = jobs[:args.max_files]
+    if not jobs:
+        print("No new segments to check.")
+        return 0
+
+    writers = {}
+    for key, path in jobs:
+        t0 = time.perf_counter()
+        try:
+            hdr = wav_header.read_header(path)
+        except OSError as e:
+            print(f"{path}: {e}")
+            continue
+        if not hdr["frames_on_disk"] or hdr["data_offset"] is None:
+            # 0-byte / headerless segment: never gets better, do not retry it
+            print(f"{path}: no audio ({'; '.join(hdr['problems'])}), skipped")
+            with open(checked_log, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+            continue
+        try:
+            qc = segment_qc(path, cfg, hdr)
+        except OSError as e:
+            print(f"{path}: {e}")                 # e.g. mount gone: retried next run
+            continue
+        except Exception as e:
+            print(f"{path}: QC failed ({type(e).__name__}: {e}), skipped")
+            with open(checked_log, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+            continue
+        names = mic_names(cfg, qc["channels"])
+        header, row, types = index_row(path, qc, names)
+
+        day = row[0][:10] or datetime.now().strftime("%Y-%m-%d")
+        if day not in writers:
+            writers[day] = binlog.BinLogWriter(log_dir, f"{day}_acoustic_qc")
+        writers[day].append(header, row, types)
+        writers[day].flush()
+        with open(checked_log, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+
+        statuses = [mic_status({m: qc[m][i] for m in METRICS}, cfg) for i in range(len(names))]
+        bad = [f"{n}={s}" for n, s in zip(names, statuses) if s != "OK"]
+        dt = time.perf_counter() - t0
+        audio_s = qc["frames"] / float(hdr["sample_rate"] or 1)
+        print(f"{os.path.basename(path)}: {audio_s / dt if dt else 0:.0f}x real time"
+              + (f"  {' '.join(bad)}" if bad else "  all OK"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
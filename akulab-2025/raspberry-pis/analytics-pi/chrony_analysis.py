@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+chrony_analysis.py
+
+High-resolution analysis of chrony's own logs for all three Pis.
+
+The health snapshot keeps one `chronyc tracking` sample per 10 minutes.
+chrony itself logs every clock update when chrony.conf contains
+
+    log tracking measurements statistics
+
+and pool_logs.py copies /var/log/chrony/ of every Pi to
+    /home/analyticspi/logs/pooled/<pi>/chrony/
+        tracking.log[.N][.gz]  measurements.log…  statistics.log…
+(rotated .gz files included, so multi-day windows keep their history;
+lines present in two rotated copies count once)
+
+From those this module computes, vectorised with numpy:
+  * offset time series per Pi (tracking.log)
+  * overlapping Allan deviation of the clock offset at octave-spaced taus
+  * cross-Pi clock differences A − B from measurements.log: each Pi logs
+    every sample's offset to each source (NTP sign: source − local), so
+    A − B is −offset_A[B] when B is A's source, or offset_B[S] −
+    offset_A[S] over a source S both poll (host IPs from config.ini).
+    tracking.log offsets are only residuals against each Pi's own source
+    and say nothing about A − B
+  * source-switch events (reference changes in tracking.log)
+  * per-source offset / delay statistics (measurements.log, statistics.log)
+
+summarize_daily_logs.py calls build_html() for each day. For multi-day
+windows run it directly:
+
+    python3 chrony_analysis.py --start 2025-05-18 --end 2025-05-21
+    python3 chrony_analysis.py --start 2025-05-18 --end 2025-05-21 --json out.json
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import warnings
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+
+LOG_BASE = "/home/analyticspi/logs/pooled"
+PI_NAMES = ["clockpi", "analyticspi", "recordingpi"]
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+DATA_LINE = re.compile(r"^\d.*$", re.M)
+
+
+def read_host_ips(config_path=CONFIG_PATH):
+    """pi → IP address as chrony logs it (from the [<pi>] <pi>_ip entries)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return {pi: config.get(pi, f"{pi}_ip", fallback=None) for pi in PI_NAMES}
+
+###############################################################################
+# PARSING
+###############################################################################
+
+def log_files(chrony_dir, name):
+    """tracking.log plus rotated tracking.log.1, .2.gz, … (oldest first)."""
+    d = Path(chrony_dir)
+    if not d.is_dir():
+        return []
+    files = [p for p in d.iterdir() if p.name == name or p.name.startswith(name + ".")]
+
+    def rotation(p):
+        rest = p.name[len(name):].lstrip(".").replace(".gz", "")
+        return int(rest) if rest.isdigit() else 0
+    return sorted(files, key=rotation, reverse=True)
+
+
+def read_rows(files, t_start, t_end, cols):
+    """
+    Data lines inside [t_start, t_end), parsed in one np.loadtxt call.
+    cols: field indices after the timestamp (0 = source IP) to return.
+    Returns (times datetime64[s] UTC as chrony logs it, source, {idx: float
+    array}), sorted by time; NaN where a field is not a number.
+    """
+    lines = []
+    for path in files:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8", errors="replace") as fh:
+            # data lines start with the date; headers with spaces or '='
+            lines.extend(DATA_LINE.findall(fh.read()))
+    lines = list(dict.fromkeys(lines))          # same line in two rotated copies
+    if not lines:
+        return np.empty(0, "datetime64[s]"), np.empty(0, object), {i: np.empty(0) for i in cols}
+    dtype = [("date", "U10"), ("time", "U8"), ("source", "U64")] + [(f"c{i}", "f8") for i in cols]
+    usecols = (0, 1, 2) + tuple(i + 2 for i in cols)
+    try:
+        tab = np.loadtxt(lines, dtype=dtype, usecols=usecols, comments=None, encoding="utf-8", ndmin=1)
+    except ValueError:
+        # a short / garbled line (e.g. cut by a crash): slower parser that drops it
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tab = np.atleast_1d(np.genfromtxt(lines, dtype=dtype, usecols=usecols, comments=None,
+                                              invalid_raise=False, encoding="utf-8"))
+    times = np.char.add(np.char.add(tab["date"], "T"), tab["time"]).astype("datetime64[s]")
+    keep = (times >= np.datetime64(t_start, "s")) & (times < np.datetime64(t_end, "s"))
+    order = np.argsort(times[keep], kind="stable")
+    return (times[keep][order], tab["source"][keep][order].astype(object),
+            {i: tab[f"c{i}"][keep][order] for i in cols})
+
+
+def load_tracking(chrony_dir, t_start, t_end):
+    """
+    tracking.log columns after the timestamp:
+      IP  St  Freq_ppm  Skew_ppm  Offset  L  Co  Offset_sd  Rem_corr  Root_delay  Root_disp  Max_err
+    """
+    t, src, c = read_rows(log_files(chrony_dir, "tracking.log"), t_start, t_end, (1, 2, 3, 4, 7, 9, 10))
+    return {
+        "t": t,
+        "source": src,
+        "stratum": c[1],
+        "freq_ppm": c[2],
+        "skew_ppm": c[3],
+        "offset": c[4],
+        "offset_sd": c[7],
+        "root_delay": c[9],
+        "root_disp": c[10],
+    }
+
+
+def load_measurements(chrony_dir, t_start, t_end):
+    """
+    measurements.log columns after the timestamp:
+      IP  L  St  123  567  ABCD  LP  RP  Score  Offset  Peer_del  Peer_disp  Root_del  Root_disp  Refid …
+    Offset is source − local clock (NTP sign: positive = local clock slow).
+    """
+    t, src, c = read_rows(log_files(chrony_dir, "measurements.log"), t_start, t_end, (9, 10))
+    return {
+        "t": t,
+        "source": src,
+        "offset": c[9],
+        "peer_delay": c[10],
+    }
+
+
+def load_statistics(chrony_dir, t_start, t_end):
+    """
+    statistics.log columns after the timestamp:
+      IP  Std_dev  Est_offset  Offset_sd  Diff_freq  Est_skew  Stress  Ns  Bs  Nr  Asym
+    """
+    t, src, c = read_rows(log_files(chrony_dir, "statistics.log"), t_start, t_end, (1, 2, 5))
+    return {
+        "t": t,
+        "source": src,
+        "std_dev": c[1],
+        "est_offset": c[2],
+        "est_skew": c[5],
+    }
+
+###############################################################################
+# ANALYSIS
+###############################################################################
+
+def seconds(t):
+    return t.astype("datetime64[s]").astype(np.int64).astype(np.float64)
+
+
+def uniform_phase(t, x, tau0=None):
+    """
+    Resample an irregular offset series onto a uniform grid of step tau0
+    (default: median update interval). Returns (tau0, x_uniform).
+    """
+    ok = np.isfinite(x)
+    ts, xs = seconds(t)[ok], x[ok]
+    if len(ts) < 3:
+        return None, np.empty(0)
+    if tau0 is None:
+        tau0 = float(np.median(np.diff(ts))) or 1.0
+    grid = np.arange(ts[0], ts[-1], tau0)
+    return tau0, np.interp(grid, ts, xs)
+
+
+def allan_deviation(x, tau0, max_points=12):
+    """
+    Overlapping Allan deviation from phase samples x (seconds) taken every
+    tau0 seconds, at taus m·tau0 for m = 1, 2, 4, … while N − 2m ≥ 2.
+
+    σ²(τ) = Σ (x[i+2m] − 2x[i+m] + x[i])² / (2 τ² (N − 2m))
+    Returns (taus, adev) arrays.
+    """
+    n = len(x)
+    taus, devs = [], []
+    m = 1
+    while n - 2 * m >= 2 and len(taus) < max_points:
+        d = x[2 * m:] - 2.0 * x[m:n - m] + x[:n - 2 * m]
+        tau = m * tau0
+        taus.append(tau)
+        devs.append(np.sqrt(np.mean(d * d) / (2.0 * tau * tau)))
+        m *= 2
+    return np.array(taus), np.array(devs)
+
+
+def source_switches(trk):
+    """List of (time, from_source, to_source) where the reference changed."""
+    src = trk["source"]
+    if len(src) < 2:
+        return []
+    idx = np.nonzero(src[1:] != src[:-1])[0] + 1
+    return [(str(trk["t"][i]), src[i - 1], src[i]) for i in idx]
+
+
+def _source_series(meas, source):
+    """(seconds, offset) of one source's samples in a measurements dict."""
+    sel = (meas["source"] == source) & np.isfinite(meas["offset"])
+    return seconds(meas["t"][sel]), meas["offset"][sel]
+
+
+def _on_grid(series, step):
+    """Interpolate [(t, x), …] onto a common grid over their overlap."""
+    if any(len(t) < 2 for t, _ in series):
+        return None, []
+    lo, hi = max(t[0] for t, _ in series), min(t[-1] for t, _ in series)
+    if hi <= lo:
+        return None, []
+    grid = np.arange(lo, hi, step)
+    return grid, [np.interp(grid, t, x) for t, x in series]
+
+
+def clock_difference(meas_a, meas_b, ip_a=None, ip_b=None, step=60.0):
+    """
+    Clock A − clock B on a common grid from both Pis' measurements.log
+    (offset = source − local):
+      B is a source of A     →  −offset_A[B]
+      A is a source of B     →  +offset_B[A]
+      else shared source S   →  offset_B[S] − offset_A[S]  (S polled most by both)
+    Returns (t_grid_seconds, diff, via) — via is the source used — or None.
+    """
+    src_a = set(np.unique(meas_a["source"])) if len(meas_a["t"]) else set()
+    src_b = set(np.unique(meas_b["source"])) if len(meas_b["t"]) else set()
+    if ip_b and ip_b in src_a:
+        grid, (x,) = _on_grid([_source_series(meas_a, ip_b)], step)
+        return (grid, -x, ip_b) if grid is not None else None
+    if ip_a and ip_a in src_b:
+        grid, (x,) = _on_grid([_source_series(meas_b, ip_a)], step)
+        return (grid, x, ip_a) if grid is not None else None
+    shared = sorted(src_a & src_b - {""},
+                    key=lambda s: (min(np.sum(meas_a["source"] == s), np.sum(meas_b["source"] == s)), s))
+    for s in reversed(shared):
+        grid, xs = _on_grid([_source_series(meas_a, s), _source_series(meas_b, s)], step)
+        if grid is not None:
+            return grid, xs[1] - xs[0], s
+    return None
+
+
+def per_source_stats(meas):
+    """source → dict(count, median_offset, mad_offset, median_delay)."""
+    out = {}
+    src = meas["source"]
+    for s in np.unique(src):
+        sel = src == s
+        off = meas["offset"][sel]
+        off = off[np.isfinite(off)]
+        dly = meas["peer_delay"][sel]
+        dly = dly[np.isfinite(dly)]
+        if not len(off):
+            continue
+        med = float(np.median(off))
+        out[str(s)] = {
+            "count": int(sel.sum()),
+            "median_offset": med,
+            "mad_offset": float(np.median(np.abs(off - med))),
+            "median_delay": float(np.median(dly)) if len(dly) else None,
+        }
+    return out
+
+
+def summarise(x):
+    x = x[np.isfinite(x)]
+    if not len(x):
+        return None
+    return {
+        "n": int(len(x)),
+        "mean": float(np.mean(x)),
+        "rms": float(np.sqrt(np.mean(x * x))),
+        "p50_abs": float(np.percentile(np.abs(x), 50)),
+        "p99_abs": float(np.percentile(np.abs(x), 99)),
+        "max_abs": float(np.max(np.abs(x))),
+    }
+
+
+def analyse(log_base, t_start, t_end, pis=PI_NAMES, host_ips=None):
+    """Run the full analysis for [t_start, t_end); return a JSON-able dict."""
+    host_ips = read_host_ips() if host_ips is None else host_ips
+    measurements, result = {}, {"start": str(t_start), "end": str(t_end), "pis": {}, "relative": {}}
+    for pi in pis:
+        chrony_dir = os.path.join(log_base, pi, "chrony")
+        trk = load_tracking(chrony_dir, t_start, t_end)
+        if not len(trk["t"]):
+            continue
+        tau0, xu = uniform_phase(trk["t"], trk["offset"])
+        taus, adev = allan_deviation(xu, tau0) if tau0 else (np.empty(0), np.empty(0))
+        meas = load_measurements(chrony_dir, t_start, t_end)
+        stats = load_statistics(chrony_dir, t_start, t_end)
+        measurements[pi] = meas
+        result["pis"][pi] = {
+            "updates": int(len(trk["t"])),
+            "offset": summarise(trk["offset"]),
+            "freq_ppm": summarise(trk["freq_ppm"]),
+            "skew_ppm_max": float(np.nanmax(trk["skew_ppm"])) if np.isfinite(trk["skew_ppm"]).any() else None,
+            "adev": [[float(a), float(b)] for a, b in zip(taus, adev)],
+            "switches": source_switches(trk),
+            "sources": per_source_stats(meas) if len(meas["t"]) else {},
+            "stat_std_dev": summarise(stats["std_dev"]) if len(stats["t"]) else None,
+        }
+
+    names = list(measurements)
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            a, b = names[i], names[j]
+            diff = clock_difference(measurements[a], measurements[b], host_ips.get(a), host_ips.get(b))
+            s = summarise(diff[1]) if diff else None
+            if s:
+                s["via"] = diff[2]
+                result["relative"][f"{a}-{b}"] = s
+    return result
+
+###############################################################################
+# HTML (used by summarize_daily_logs.py)
+###############################################################################
+
+def _us(v):
+    return "N/A" if v is None else f"{v * 1e6:.2f}"
+
+
+def build_html(log_base, log_date, pis=PI_NAMES):
+    """HTML snippet with the chrony analysis of one UTC day."""
+    day = datetime.strptime(log_date, "%Y-%m-%d")
+    res = analyse(log_base, day, day + timedelta(days=1), pis)
+    if not res["pis"]:
+        return "<p>No chrony tracking logs found (enable 'log tracking measurements statistics').</p>"
+
+    html = ["<h2>Chrony Analysis (all Pis)</h2>",
+            "<table border='1' cellpadding='3' cellspacing='0'>",
+            "<tr><th>Pi</th><th>Updates</th><th>|offset| p50 µs</th><th>|offset| p99 µs</th>"
+            "<th>|offset| max µs</th><th>RMS µs</th><th>Freq ppm (mean)</th><th>Source switches</th></tr>"]
+    for pi, r in res["pis"].items():
+        o, fq = r["offset"] or {}, r["freq_ppm"] or {}
+        html.append(
+            f"<tr><td>{pi}</td><td>{r['updates']}</td><td>{_us(o.get('p50_abs'))}</td>"
+            f"<td>{_us(o.get('p99_abs'))}</td><td>{_us(o.get('max_abs'))}</td><td>{_us(o.get('rms'))}</td>"
+            f"<td>{fq.get('mean', float('nan')):.3f}</td><td>{len(r['switches'])}</td></tr>"
+        )
+    html.append("</table>")
+
+    if res["relative"]:
+        html.append("<h5>Cross‑Pi clock difference (A − B, from measurements.log)</h5>")
+        html.append("<table border='1' cellpadding='3' cellspacing='0'>"
+                    "<tr><th>Pair</th><th>via source</th><th>mean µs</th><th>|Δ| p99 µs</th><th>|Δ| max µs</th></tr>")
+        for pair, s in res["relative"].items():
+            html.append(f"<tr><td>{pair}</td><td>{s['via']}</td><td>{_us(s['mean'])}</td>"
+                        f"<td>{_us(s['p99_abs'])}</td><td>{_us(s['max_abs'])}</td></tr>")
+        html.append("</table>")
+
+    html.append("<h5>Allan deviation of clock offset</h5>")
+    html.append("<table border='1' cellpadding='3' cellspacing='0'><tr><th>Pi</th><th>τ (s) : σ<sub>y</sub>(τ)</th></tr>")
+    for pi, r in res["pis"].items():
+        pts = ", ".join(f"{tau:.0f}: {dev:.2e}" for tau, dev in r["adev"])
+        html.append(f"<tr><td>{pi}</td><td>{pts or 'N/A'}</td></tr>")
+    html.append("</table>")
+
+    for pi, r in res["pis"].items():
+        if r["switches"]:
+            html.append(f"<p><b>{pi} source switches</b>: " +
+                        "; ".join(f"{t} {a} → {b}" for t, a, b in r["switches"][:20]) +
+                        (" …" if len(r["switches"]) > 20 else "") + "</p>")
+    return "\n".join(html)
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse chrony tracking/measurements/statistics logs.")
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD (UTC, inclusive)")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD (UTC, exclusive)")
+    parser.add_argument("--log-base", default=LOG_BASE, help=f"pooled logs (default: {LOG_BASE})")
+    parser.add_argument("--json", help="write the full result to this JSON file")
+    args = parser.parse_args()
+
+    t0 = datetime.now()
+    res = analyse(args.log_base,
+                  datetime.strptime(args.start, "%Y-%m-%d"),
+                  datetime.strptime(args.end, "%Y-%m-%d"))
+    elapsed = (datetime.now() - t0).total_seconds()
+
+    for pi, r in res["pis"].items():
+        o = r["offset"] or {}
+        print(f"{pi:12s} updates={r['updates']:7d}  |offset| p99={_us(o.get('p99_abs'))} µs"
+              f"  max={_us(o.get('max_abs'))} µs  switches={len(r['switches'])}")
+    for pair, s in res["relative"].items():
+        print(f"{pair:28s} mean={_us(s['mean'])} µs  |Δ| p99={_us(s['p99_abs'])} µs  (via {s['via']})")
+    print(f"Analysed in {elapsed:.2f} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
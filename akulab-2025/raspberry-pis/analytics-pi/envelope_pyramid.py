@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+envelope_pyramid.py
+
+Multi-resolution min / max / RMS envelopes of every channel, one compact
+file per day, so a whole day of 8-channel audio can be browsed or triaged
+without touching the 1.1 GB segments.
+
+Builder (cron, chained after acoustic_qc.py so the segments are still in the
+page cache): each newly synced segment is streamed once (audio_blocks), cut
+into wall-clock aligned bins of the finest level (default 1 s) and written
+into its day file; the coarser levels (default 10 s, 1 min) are recomputed
+from the finest one for the affected range only. Bins are placed by the
+segment's start sample (segment_timeline: BEXT, else file name), so bins
+split between two segments are merged exactly (per-bin frame counts).
+
+Day file  <out_dir>/<YYYY-MM-DD>_envelope.bin  (UTC day):
+    4096-byte header   b"ENVP1\\n" + JSON (channels, levels, bins, offsets)
+    count              (bins_0,) uint32     frames in each finest bin
+    level i            (bins_i, channels, 3) float16   min, max, rms
+Unwritten bins are NaN. 8 channels at 1 s / 10 s / 60 s ≈ 4.9 MB per day.
+
+Query API (memory-mapped, milliseconds):
+    query(out_dir, start, end, channels=None, max_points=2000)
+picks the finest level with at most max_points bins in [start, end) and
+returns times plus (bins, channels) min / max / rms arrays.
+
+Usage:
+    python3 envelope_pyramid.py                        # new synced segments
+    python3 envelope_pyramid.py /media/nas/Audio/2025-06-01
+    python3 envelope_pyramid.py --query 2025-06-01T04:00 2025-06-01T06:00 --channels 1,3
+"""
+
+import os
+import sys
+import json
+import time
+import warnings
+import getpass
+import argparse
+import calendar
+import configparser
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import wav_header
+import segment_timeline
+from audio_blocks import iter_blocks
+from acoustic_qc import new_segments
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+MAGIC = b"ENVP1\n"
+HEADER_BYTES = 4096
+DAY = 86400
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_envelope_config(config_path=CONFIG_PATH):
+    """Return the [envelope_pyramid] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["envelope_pyramid"] if config.has_section("envelope_pyramid") else {}
+    levels = [int(v) for v in sec.get("levels", "1, 10, 60").split(",") if v.strip()]
+    if any(DAY % l or l % levels[0] for l in levels) or levels != sorted(levels):
+        raise ValueError(f"levels {levels}: must be ascending, divide {DAY} and be multiples of the first")
+    return {
+        "out_dir": sec.get("out_dir", "/media/nas/Envelopes"),
+        "levels": levels,
+        "audio_dir": config.get("analyticspi", "to_audio_dir", fallback="/media/nas/Audio"),
+    }
+
+###############################################################################
+# DAY FILES
+###############################################################################
+
+def day_path(out_dir, day):
+    return os.path.join(out_dir, f"{day}_envelope.bin")
+
+
+def open_day(path, channels=None, levels=None, mode="r"):
+    """
+    Return (meta, count, [level arrays]) as memmaps of one day file.
+    With mode 'r+' and channels/levels given, a missing file is created
+    with every bin NaN.
+    """
+    if not os.path.exists(path):
+        if mode == "r" or channels is None:
+            raise FileNotFoundError(path)
+        bins = [DAY // l for l in levels]
+        offsets, off = [], HEADER_BYTES + 4 * bins[0]
+        for b in bins:
+            offsets.append(off)
+            off += b * channels * 3 * 2
+        meta = {"channels": channels, "levels": levels, "bins": bins, "offsets": offsets}
+        head = MAGIC + json.dumps(meta).encode()
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(head.ljust(HEADER_BYTES, b" "))
+            f.write(np.zeros(bins[0], dtype=np.uint32).tobytes())
+            for b in bins:
+                f.write(np.full(b * channels * 3, np.nan, dtype=np.float16).tobytes())
+        os.replace(tmp, path)
+
+    with open(path, "rb") as f:
+        head = f.read(HEADER_BYTES)
+    if not head.startswith(MAGIC):
+        raise ValueError(f"{path}: not an envelope file")
+    meta = json.loads(head[len(MAGIC):].decode().strip())
+    ch = meta["channels"]
+    count = np.memmap(path, dtype=np.uint32, mode=mode, offset=HEADER_BYTES, shape=(meta["bins"][0],))
+    arrays = [np.memmap(path, dtype=np.float16, mode=mode, offset=off, shape=(b, ch, 3))
+              for b, off in zip(meta["bins"], meta["offsets"])]
+    return meta, count, arrays
+
+###############################################################################
+# BUILDER
+###############################################################################
+
+def segment_bins(path, bin_s, hdr=None):
+    """
+    Stream one segment and return (bin_ids, n, mn, mx, ss): wall-clock bins
+    of bin_s seconds (id = epoch // bin_s), frames per bin, and per-channel
+    min, max and sum of squares (partial bins at the segment edges included).
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    tl = segment_timeline.build_timeline([path], default_rate=hdr["sample_rate"])
+    if not len(tl["path"]):
+        raise ValueError(f"{path}: no start time")
+    sr = int(tl["sample_rate"][0])
+    bf = int(bin_s * sr)
+    pos = int(tl["start"][0])                    # absolute sample number of the next frame
+
+    parts = []                                   # closed bins: (ids, n, mn, mx, ss) per block
+    open_bin = None                              # last bin of the previous block, may continue
+    for block in iter_blocks(path, hdr):
+        first = (-pos) % bf
+        starts = np.unique(np.concatenate(([0], np.arange(first, len(block), bf))))
+        cur = [(pos + starts) // bf,
+               np.diff(np.append(starts, len(block))),
+               np.minimum.reduceat(block, starts, axis=0),
+               np.maximum.reduceat(block, starts, axis=0),
+               np.add.reduceat(block.astype(np.float64) ** 2, starts, axis=0)]
+        if open_bin is not None:
+            if open_bin[0][0] == cur[0][0]:
+                cur[1][0] += open_bin[1][0]
+                cur[2][0] = np.minimum(cur[2][0], open_bin[2][0])
+                cur[3][0] = np.maximum(cur[3][0], open_bin[3][0])
+                cur[4][0] += open_bin[4][0]
+            else:
+                parts.append(open_bin)
+        parts.append([v[:-1] for v in cur])
+        open_bin = [v[-1:] for v in cur]
+        pos += len(block)
+    if open_bin is not None:
+        parts.append(open_bin)
+    if not parts:
+        ch = hdr["channels"]
+        return (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros((0, ch)),
+                np.zeros((0, ch)), np.zeros((0, ch)))
+    ids, n, mn, mx, ss = (np.concatenate(v) for v in zip(*parts))
+    return ids.astype(np.int64), n.astype(np.int64), mn, mx, ss
+
+
+def _aggregate(fine, count, factor):
+    """Coarser (bins, ch, 3) from finest bins, weighting RMS by frame count."""
+    b, ch, _ = fine.shape
+    f = fine.astype(np.float32).reshape(b // factor, factor, ch, 3)
+    w = count.astype(np.float64).reshape(b // factor, factor, 1)
+    out = np.full((b // factor, ch, 3), np.nan, dtype=np.float32)
+    has = w.sum(axis=1) > 0                                       # (bins, 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN bins stay NaN
+        out[..., 0] = np.nanmin(f[..., 0], axis=1)
+        out[..., 1] = np.nanmax(f[..., 1], axis=1)
+        ms = np.nansum(np.nan_to_num(f[..., 2]) ** 2 * w, axis=1) / w.sum(axis=1)
+        out[..., 2] = np.where(has, np.sqrt(ms), np.nan)
+    return out
+
+
+def add_segment(path, cfg, hdr=None):
+    """Write one segment's envelope into its day file(s). Returns the bins written."""
+    levels = cfg["levels"]
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    ids, n, mn, mx, ss = segment_bins(path, levels[0], hdr)
+    days = (ids * levels[0]) // DAY
+    for day_id in np.unique(days):
+        sel = days == day_id
+        day = datetime.fromtimestamp(int(day_id) * DAY, timezone.utc).strftime("%Y-%m-%d")
+        meta, count, arrays = open_day(day_path(cfg["out_dir"], day), hdr["channels"], levels, "r+")
+        idx = ids[sel] - int(day_id) * DAY // levels[0]
+        fine = arrays[0]
+
+        # Merge with what an adjacent segment already put in a shared edge bin
+        old_n = count[idx].astype(np.int64)
+        old = fine[idx].astype(np.float64)
+        tot = old_n + n[sel]
+        new_mn = np.where(old_n[:, None] > 0, np.fmin(old[..., 0], mn[sel]), mn[sel])
+        new_mx = np.where(old_n[:, None] > 0, np.fmax(old[..., 1], mx[sel]), mx[sel])
+        old_ss = np.nan_to_num(old[..., 2]) ** 2 * old_n[:, None]
+        rms = np.sqrt((old_ss + ss[sel]) / tot[:, None])
+        fine[idx] = np.stack((new_mn, new_mx, rms), axis=-1).astype(np.float16)
+        count[idx] = tot
+
+        # Recompute the coarser levels over the affected range only
+        for lvl, arr in zip(levels[1:], arrays[1:]):
+            factor = lvl // levels[0]
+            lo, hi = idx.min() // factor, idx.max() // factor + 1
+            arr[lo:hi] = _aggregate(fine[lo * factor:hi * factor], count[lo * factor:hi * factor],
+                                    factor).astype(np.float16)
+        for a in [count] + arrays:
+            a.flush()
+    return len(ids)
+
+###############################################################################
+# QUERY
+###############################################################################
+
+def query(out_dir, start, end, channels=None, max_points=2000):
+    """
+    Envelope of [start, end) (POSIX seconds, UTC) from the finest level with
+    at most max_points bins. channels: 1-based list (default all).
+    Returns dict(level, times, min, max, rms), arrays shaped (bins, channels),
+    NaN where nothing was recorded.
+    """
+    start, end = float(start), float(end)
+    days = range(int(start // DAY), int(np.ceil(end / DAY)))
+    opened = []
+    for d in days:
+        day = datetime.fromtimestamp(d * DAY, timezone.utc).strftime("%Y-%m-%d")
+        try:
+            opened.append((d, open_day(day_path(out_dir, day))))
+        except FileNotFoundError:
+            opened.append((d, None))
+    known = [o for _, o in opened if o is not None]
+    if not known:
+        raise FileNotFoundError(f"no envelope files in {out_dir} for that range")
+    meta = known[0][0]
+    levels = meta["levels"]
+    li = next((i for i, l in enumerate(levels) if (end - start) / l <= max_points), len(levels) - 1)
+    lvl = levels[li]
+    cols = [c - 1 for c in channels] if channels else list(range(meta["channels"]))
+
+    parts = []
+    for d, o in opened:
+        lo = max(start, d * DAY)
+        hi = min(end, (d + 1) * DAY)
+        b0, b1 = int((lo - d * DAY) // lvl), int(np.ceil((hi - d * DAY) / lvl))
+        if o is None:
+            parts.append(np.full((b1 - b0, len(cols), 3), np.nan, dtype=np.float32))
+        else:
+            parts.append(np.asarray(o[2][li][b0:b1, cols], dtype=np.float32))
+    env = np.concatenate(parts)
+    t0 = (start // lvl) * lvl
+    return {"level": lvl, "times": t0 + np.arange(len(env)) * lvl,
+            "min": env[..., 0], "max": env[..., 1], "rms": env[..., 2]}
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def parse_time(value):
+    """ISO date-time (UTC) → POSIX seconds."""
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-day min/max/RMS envelope pyramid of the recordings.")
+    parser.add_argument("paths", nargs="*", help="WAVs/directories to add (default: new synced segments)")
+    parser.add_argument("--query", nargs=2, metavar=("START", "END"),
+                        help="print the envelope of an ISO time range (UTC) instead of building")
+    parser.add_argument("--channels", help="comma-separated channels for --query (default: all)")
+    parser.add_argument("--max-points", type=int, default=2000, help="max bins returned by --query")
+    parser.add_argument("--out-dir", help="override [envelope_pyramid] out_dir")
+    args = parser.parse_args()
+
+    cfg = read_envelope_config()
+    if args.out_dir:
+        cfg["out_dir"] = args.out_dir
+
+    if args.query:
+        channels = [int(c) for c in args.channels.split(",")] if args.channels else None
+        t0 = time.perf_counter()
+        env = query(cfg["out_dir"], parse_time(args.query[0]), parse_time(args.query[1]),
+                    channels, args.max_points)
+        dt = (time.perf_counter() - t0) * 1000
+        print(f"{len(env['times'])} bins of {env['level']} s x {env['rms'].shape[1]} channels in {dt:.1f} ms")
+        with np.errstate(divide="ignore"):
+            rms_db = 20 * np.log10(np.nanmax(env["rms"], axis=0)) if len(env["times"]) else []
+        for i, v in enumerate(rms_db):
+            print(f"  ch{(channels or range(1, len(rms_db) + 1))[i]}: max RMS {v:6.1f} dBFS, "
+                  f"covered {np.mean(~np.isnan(env['rms'][:, i])) * 100:5.1f} %")
+        return 0
+
+    user = getpass.getuser()
+    log_dir = Path(f"/home/{user}/logs/envelope_pyramid")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    os.makedirs(cfg["out_dir"], exist_ok=True)
+    checked_log = log_dir / "checked_files.log"
+    if args.paths:
+        jobs = [(p, p) for p in wav_header.iter_wavs(args.paths)]
+    else:
+        synced_log = Path(f"/home/{user}/logs/backup_recordings/synced_files/synced_files.log")
+        jobs = new_segments(cfg, checked_log, synced_log)
+    if not jobs:
+        print("No new segments.")
+        return 0
+
+    for key, path in jobs:
+        t0 = time.perf_counter()
+        try:
+            hdr = wav_header.read_header(path)
+        except OSError as e:
+            print(f"{path}: {e}")
+            continue
+        if not hdr["frames_on_disk"] or hdr["data_offset"] is None:
+            # 0-byte / headerless segment: nothing to add, do not retry it
+            print(f"{path}: no audio ({'; '.join(hdr['problems'])}), skipped")
+            with open(checked_log, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+            continue
+        try:
+            bins = add_segment(path, cfg, hdr)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            continue
+        with open(checked_log, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+        dt = time.perf_counter() - t0
+        audio_s = (hdr["frames_on_disk"] or 0) / float(hdr["sample_rate"] or 1)
+        print(f"{os.path.basename(path)}: {bins} bins, {audio_s / dt if dt else 0:.0f}x real time")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+event_screen.py
+
+Cheap streaming pre-screen for acoustic events, so a classifier (Perch,
+BirdNET) only has to look at candidate windows instead of 24 h × 8 channels.
+
+Every run (cron, after backup_recordings.py) takes the synced segments not
+screened yet and streams each once through the STFT engine of
+spectrogram.py. For every channel and every band in [event_screen] bands
+(vectorised: one matrix product per block):
+
+  energy   band power per STFT frame, dB
+  floor    adaptive noise floor: the 20th percentile of each ~1.4 s block,
+           followed by an asymmetric EMA (falls fast, rises slowly), so
+           wind or surf raise it but calls do not
+  score    energy − floor, dB
+
+Runs of frames with score ≥ threshold_db lasting ≥ min_duration_s (runs
+closer than merge_gap_s joined) become events, appended to a per-day
+binary index (binlog.py format):
+    /home/<user>/logs/event_screen/<DATE>_events.bin
+    columns timestamp, t_start, duration, channel, band, score, file
+
+read_events() / candidate_windows() give downstream classifiers the
+windows to run on. Each segment prints its real-time factor and events per
+channel-hour.
+
+Usage:
+    python3 event_screen.py                      # new synced segments
+    python3 event_screen.py /media/nas/Audio/2025-06-01 --dry-run
+"""
+
+import os
+import sys
+import time
+import getpass
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import binlog
+import wav_header
+import segment_timeline
+from spectrogram import stft_power
+from acoustic_qc import mic_names, new_segments
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_screen_config(config_path=CONFIG_PATH):
+    """Return the [event_screen] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["event_screen"] if config.has_section("event_screen") else {}
+    bands = []
+    for b in sec.get("bands", "500-2000, 2000-8000").split(","):
+        lo, hi = b.strip().split("-")
+        bands.append((float(lo), float(hi)))
+    get = lambda k, d: float(sec.get(k, d))
+    mics = config.get("acoustic_qc", "mic_names", fallback="")
+    return {
+        "bands": bands,
+        "nfft": int(get("nfft", 1024)),
+        "hop": int(get("hop", 512)),
+        "threshold_db": get("threshold_db", 10.0),
+        "min_duration_s": get("min_duration_s", 0.1),
+        "merge_gap_s": get("merge_gap_s", 0.3),
+        "floor_rise": get("floor_rise", 0.05),
+        "floor_fall": get("floor_fall", 0.5),
+        "mic_names": [m.strip() for m in mics.split(",") if m.strip()],
+        "audio_dir": config.get("analyticspi", "to_audio_dir", fallback="/media/nas/Audio"),
+    }
+
+
+def band_label(band):
+    return f"{band[0]:g}-{band[1]:g}"
+
+###############################################################################
+# DETECTOR
+###############################################################################
+
+def band_scores(path, cfg, hdr=None):
+    """
+    Stream one segment and return (scores, frame_s): scores (frames,
+    channels, bands) float32 in dB above the adaptive floor, and the frame
+    hop in seconds.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    sr, nfft, hop = hdr["sample_rate"], cfg["nfft"], cfg["hop"]
+    freqs = np.fft.rfftfreq(nfft, 1.0 / sr)
+    masks = np.stack([(freqs >= lo) & (freqs < hi) for lo, hi in cfg["bands"]], axis=1)
+    masks = masks.astype(np.float64)                                  # (bins, bands)
+
+    floor = None
+    out = []
+    for power in stft_power(path, nfft, hop, hdr):                    # (frames, ch, bins)
+        e = 10.0 * np.log10(power @ masks + 1e-20)                    # (frames, ch, bands)
+        level = np.percentile(e, 20, axis=0)                          # (ch, bands)
+        if floor is None:
+            floor = level
+        else:
+            rate = np.where(level > floor, cfg["floor_rise"], cfg["floor_fall"])
+            floor = floor + rate * (level - floor)
+        out.append((e - floor).astype(np.float32))
+    if not out:
+        return np.zeros((0, hdr["channels"], len(cfg["bands"])), np.float32), hop / float(sr)
+    return np.concatenate(out), hop / float(sr)
+
+
+def find_events(scores, frame_s, cfg):
+    """
+    Events from scores: list of (start_s, duration_s, channel, band, peak
+    score), start relative to the segment, channel and band 0-based.
+    """
+    events = []
+    if not len(scores):
+        return events
+    active = scores >= cfg["threshold_db"]
+    gap = int(round(cfg["merge_gap_s"] / frame_s))
+    min_len = int(round(cfg["min_duration_s"] / frame_s))
+    n = len(scores)
+    for ch in range(scores.shape[1]):
+        for b in range(scores.shape[2]):
+            a = active[:, ch, b]
+            if not a.any():
+                continue
+            edges = np.diff(np.concatenate(([0], a.astype(np.int8), [0])))
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            # join runs separated by short gaps
+            keep = np.concatenate(([True], starts[1:] - ends[:-1] > gap))
+            starts = starts[keep]
+            ends = np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+            for s, e in zip(starts, ends):
+                if e - s < min_len:
+                    continue
+                peak = float(scores[s:min(e, n), ch, b].max())
+                events.append((s * frame_s, (e - s) * frame_s, ch, b, peak))
+    events.sort()
+    return events
+
+
+def screen_segment(path, cfg, hdr=None):
+    """Scores + events of one segment; returns (events, audio_seconds)."""
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    scores, frame_s = band_scores(path, cfg, hdr)
+    return find_events(scores, frame_s, cfg), len(scores) * frame_s
+
+###############################################################################
+# INDEX
+###############################################################################
+
+HEADER = ["timestamp", "t_start", "duration", "channel", "band", "score", "file"]
+TYPES = {"timestamp": "s24", "t_start": "f8", "duration": "f8", "channel": "i8",
+         "band": "s16", "score": "f8", "file": "s48"}
+
+
+def read_events(log_dir, log_date):
+    """Rows (dicts) of one day's event index, in time order."""
+    rows = []
+    for part in binlog.day_files(log_dir, f"{log_date}_events"):
+        cols, part_rows = binlog.read_records(part)
+        rows.extend(dict(zip(cols, r)) for r in part_rows)
+    rows.sort(key=lambda r: r["t_start"])
+    return rows
+
+
+def candidate_windows(rows, pad_s=1.0, channel=None):
+    """
+    Merge events (optionally of one 1-based channel) into padded
+    [(start, end)] POSIX-second windows for a downstream classifier.
+    """
+    spans = sorted((r["t_start"] - pad_s, r["t_start"] + r["duration"] + pad_s)
+                   for r in rows if channel is None or r["channel"] == channel)
+    merged = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [tuple(m) for m in merged]
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Energy-based event pre-screen → per-day event index.")
+    parser.add_argument("paths", nargs="*", help="WAVs/directories to screen (default: new synced segments)")
+    parser.add_argument("--max-files", type=int, default=0, help="stop after N segments (0 = all)")
+    parser.add_argument("--dry-run", action="store_true", help="print events, do not write the index")
+    args = parser.parse_args()
+
+    cfg = read_screen_config()
+    user = getpass.getuser()
+    log_dir = Path(f"/home/{user}/logs/event_screen")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    checked_log = log_dir / "checked_files.log"
+
+    if args.paths:
+        jobs = [(p, p) for p in wav_header.iter_wavs(args.paths)]
+    else:
+        synced_log = Path(f"/home/{user}/logs/backup_recordings/synced_files/synced_files.log")
+        jobs = new_segments(cfg, checked_log, synced_log)
+    if args.max_files:
+        jobs = jobs[:args.max_files]
+    if not jobs:
+        print("No new segments to screen.")
+        return 0
+
+    writers = {}
+    total_audio = total_time = 0.0
+    total_events = 0
+    for key, path in jobs:
+        t0 = time.perf_counter()
+        try:
+            hdr = wav_header.read_header(path)
+        except OSError as e:
+            print(f"{path}: {e}")
+            continue
+        # same start as catalog.py / envelope_pyramid.py: BEXT time_reference first
+        tl = segment_timeline.build_timeline([path], default_rate=hdr["sample_rate"] or 48000)
+        if not hdr["frames_on_disk"] or hdr["data_offset"] is None or not len(tl["path"]):
+            # 0-byte / headerless / undatable segment: do not retry it
+            print(f"{path}: no audio or no start time ({'; '.join(hdr['problems']) or 'unnamed'}), skipped")
+            if not args.dry_run:
+                with open(checked_log, "a", encoding="utf-8") as f:
+                    f.write(key + "\n")
+            continue
+        try:
+            events, audio_s = screen_segment(path, cfg, hdr)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            continue
+        seg_t0 = tl["start"][0] / float(tl["sample_rate"][0])
+        names = mic_names(cfg, hdr["channels"])
+        for start, dur, ch, b, score in events:
+            t = seg_t0 + start
+            stamp = datetime.fromtimestamp(t, timezone.utc)
+            row = [stamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], t, dur, ch + 1,
+                   band_label(cfg["bands"][b]), score, os.path.basename(path)]
+            if args.dry_run:
+                print(f"  {row[0]}  {names[ch]:8s} {row[4]:>10s} Hz  {dur:5.2f} s  +{score:4.1f} dB")
+                continue
+            day = row[0][:10]
+            if day not in writers:
+                writers[day] = binlog.BinLogWriter(log_dir, f"{day}_events")
+            writers[day].append(HEADER, row, TYPES)
+        for w in writers.values():
+            w.flush()
+        if not args.dry_run:
+            with open(checked_log, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+
+        dt = time.perf_counter() - t0
+        total_audio += audio_s
+        total_time += dt
+        total_events += len(events)
+        ch_hours = audio_s * hdr["channels"] / 3600.0
+        print(f"{os.path.basename(path)}: {len(events)} events "
+              f"({len(events) / ch_hours if ch_hours else 0:.0f} per channel-hour), "
+              f"{audio_s / dt if dt else 0:.0f}x real time")
+    if total_time:
+        print(f"Total: {total_events} events in {total_audio / 3600:.2f} h of audio, "
+              f"{total_audio / total_time:.0f}x real time")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+gcc_phat.py
+
+Inter-microphone time delays (GCC-PHAT) for every channel pair of the
+8-mic array, as the input to localization (aux-history/sound_localization.md,
+microphone_array.md).
+
+Per window (window_s, every hop_s) and all pairs at once:
+
+    X      = rfft(hann · x, nfft)            one batched FFT per chunk of
+                                              windows, all channels
+    G_ij   = X_i · conj(X_j) / |X_i · conj(X_j)|    phase transform, band only
+    cc_ij  = irfft(G_ij)                      one batched inverse FFT
+    delay  = argmax over |lag| ≤ max_delay_ms, parabolic sub-sample refine
+    confidence = cc peak / peak of a perfectly coherent pair (0 … 1)
+
+delay[i, j] > 0 means the sound reached mic i later than mic j.
+
+Segments are streamed (audio_blocks.iter_windows), or — when the event
+pre-screen has an index for that day and use_events is on — only the
+padded event windows are read. Segments run on a process pool; each
+writes one file
+    <out_dir>/<DATE>/<segment>_tdoa.npz        DATE = UTC capture date
+    t (windows,) POSIX start, delay (windows, pairs) s float32,
+    confidence (windows, pairs) float16, pairs (pairs, 2) 1-based
+and existing files are skipped, so a cron run for yesterday picks up
+where it stopped. load_day() / delay_matrix() read them back as
+(windows, ch, ch) matrices.
+
+Usage:
+    python3 gcc_phat.py                              # yesterday, [gcc_phat] settings
+    python3 gcc_phat.py --date 2025-06-01 --all-windows
+    python3 gcc_phat.py /media/nas/Audio/2025-06-01/auklab_20250601T040000.wav --print
+"""
+
+import os
+import sys
+import time
+import getpass
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import wav_header
+import segment_timeline
+from audio_blocks import iter_windows
+from event_screen import read_events, candidate_windows
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_gcc_config(config_path=CONFIG_PATH):
+    """Return the [gcc_phat] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["gcc_phat"] if config.has_section("gcc_phat") else {}
+    get = lambda k, d: float(sec.get(k, d))
+    lo, hi = sec.get("band", "300-8000").split("-")
+    return {
+        "window_s": get("window_s", 0.1),
+        "hop_s": get("hop_s", 0.1),
+        "max_delay_ms": get("max_delay_ms", 12.0),
+        "band": (float(lo), float(hi)),
+        "use_events": sec.get("use_events", "true").strip().lower() == "true",
+        "event_pad_s": get("event_pad_s", 0.5),
+        "workers": int(get("workers", 4)),
+        "out_dir": sec.get("out_dir", "/media/nas/TDOA"),
+        "audio_dir": config.get("analyticspi", "to_audio_dir", fallback="/media/nas/Audio"),
+    }
+
+###############################################################################
+# ENGINE
+###############################################################################
+
+class GccPhat:
+    """Precomputed window, band weights and lag range for one (rate, window) pair."""
+
+    def __init__(self, sample_rate, window_frames, channels, band=(300.0, 8000.0),
+                 max_delay_s=0.012):
+        self.sr = sample_rate
+        self.n = window_frames
+        self.max_lag = min(int(np.ceil(max_delay_s * sample_rate)), window_frames - 1)
+        # zero-pad so lags up to max_lag do not wrap around
+        self.nfft = 1 << int(np.ceil(np.log2(window_frames + self.max_lag)))
+        self.taper = np.hanning(window_frames).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.nfft, 1.0 / sample_rate)
+        self.weight = ((freqs >= band[0]) & (freqs <= band[1])).astype(np.float32)
+        self.pairs = np.array([(i, j) for i in range(channels) for j in range(i + 1, channels)])
+        # correlation peak of a perfectly coherent pair = PHAT-weighted lag-0 value
+        self.full_scale = float(np.fft.irfft(self.weight, self.nfft)[0])
+
+    def __call__(self, frames):
+        """
+        frames (W, channels, n) float32 → (delay_s, confidence), each
+        (W, pairs) float32.
+        """
+        spec = np.fft.rfft(frames * self.taper, self.nfft, axis=-1)          # (W, ch, K)
+        cross = spec[:, self.pairs[:, 0]] * np.conj(spec[:, self.pairs[:, 1]])  # (W, P, K)
+        cross *= self.weight / (np.abs(cross) + 1e-12)
+        cc = np.fft.irfft(cross, self.nfft, axis=-1)                           # (W, P, nfft)
+        L = self.max_lag
+        cc = np.concatenate((cc[..., -L:], cc[..., :L + 1]), axis=-1)        # lags −L … L
+        k = np.clip(np.argmax(cc, axis=-1), 1, 2 * L - 1)
+        y0 = np.take_along_axis(cc, (k - 1)[..., None], -1)[..., 0]
+        y1 = np.take_along_axis(cc, k[..., None], -1)[..., 0]
+        y2 = np.take_along_axis(cc, (k + 1)[..., None], -1)[..., 0]
+        denom = y0 - 2.0 * y1 + y2
+        frac = np.where(denom < 0, 0.5 * (y0 - y2) / np.where(denom < 0, denom, 1.0), 0.0)
+        delay = (k - L + frac) / float(self.sr)
+        confidence = np.clip(y1 / self.full_scale, 0.0, 1.0)
+        return delay.astype(np.float32), confidence.astype(np.float32)
+
+
+def event_spans(path, seg_t0, frames, sr, pad_s, log_dir):
+    """Frame ranges [(start, stop)] of this segment's pre-screen events, or None without an index."""
+    days = {datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d")
+            for t in (seg_t0, seg_t0 + frames / float(sr))}
+    rows = []
+    indexed = False
+    for day in sorted(days):
+        if any(Path(log_dir).glob(f"{day}_events*.bin")):
+            indexed = True
+            rows.extend(r for r in read_events(log_dir, day) if r["file"] == os.path.basename(path))
+    if not indexed:
+        return None
+    spans = []
+    for s, e in candidate_windows(rows, pad_s):
+        a, b = max(0, int((s - seg_t0) * sr)), min(frames, int(np.ceil((e - seg_t0) * sr)))
+        if b > a:
+            spans.append((a, b))
+    return spans
+
+
+def process_segment(path, cfg, out_path=None, events_dir=None, chunk=32):
+    """
+    Delays for one segment. Returns (t, delay, confidence, pairs, stats);
+    written to out_path (.npz) when given.
+    """
+    t0 = time.perf_counter()
+    hdr = wav_header.read_header(path)
+    sr, ch, frames = hdr["sample_rate"], hdr["channels"], hdr["frames_on_disk"] or 0
+    tl = segment_timeline.build_timeline([path], default_rate=sr or 48000)
+    if not frames or hdr["data_offset"] is None or not len(tl["path"]):
+        raise ValueError(f"{path}: no audio or no start time")
+    seg_t0 = tl["start"][0] / float(tl["sample_rate"][0])
+    window, hop = int(cfg["window_s"] * sr), int(cfg["hop_s"] * sr)
+    engine = GccPhat(sr, window, ch, cfg["band"], cfg["max_delay_ms"] / 1000.0)
+
+    spans = None
+    if events_dir is not None:
+        spans = event_spans(path, seg_t0, frames, sr, cfg["event_pad_s"], events_dir)
+    if spans is None:
+        spans = [(0, frames)]
+    times, delays, confs = [], [], []
+    for a, b in spans:
+        b = max(b, a + window)          # short events: one whole window
+        for first, win in iter_windows(path, window, hop, hdr, a, b, chunk=chunk):
+            d, c = engine(win)
+            delays.append(d)
+            confs.append(c)
+            times.append(seg_t0 + (a + (first + np.arange(len(win))) * hop) / float(sr))
+
+    P = len(engine.pairs)
+    t = np.concatenate(times) if times else np.zeros(0)
+    delay = np.concatenate(delays) if delays else np.zeros((0, P), np.float32)
+    conf = np.concatenate(confs) if confs else np.zeros((0, P), np.float32)
+    pairs = engine.pairs + 1
+    if out_path is not None:
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out_path.with_name(out_path.name + ".tmp.npz")
+        np.savez(tmp, t=t, delay=delay, confidence=conf.astype(np.float16), pairs=pairs,
+                 sample_rate=sr)
+        os.replace(tmp, out_path)
+    stats = {"windows": len(t), "covered_s": len(t) * cfg["hop_s"], "audio_s": frames / float(sr),
+             "seconds": time.perf_counter() - t0}
+    return t, delay, conf, pairs, stats
+
+###############################################################################
+# READ BACK
+###############################################################################
+
+def delay_matrix(delay, pairs, channels):
+    """(W, pairs) delays + 1-based pairs → antisymmetric (W, channels, channels)."""
+    m = np.zeros((len(delay), channels, channels), dtype=delay.dtype)
+    i, j = pairs[:, 0] - 1, pairs[:, 1] - 1
+    m[:, i, j] = delay
+    m[:, j, i] = -delay
+    return m
+
+
+def load_day(out_dir, day):
+    """Concatenate one day's segment files → (t, delay, confidence, pairs), in time order."""
+    parts = [np.load(f) for f in sorted(Path(out_dir, day).glob("*_tdoa.npz"))]
+    if not parts:
+        return np.zeros(0), np.zeros((0, 0), np.float32), np.zeros((0, 0), np.float32), np.zeros((0, 2), int)
+    t = np.concatenate([p["t"] for p in parts])
+    order = np.argsort(t, kind="stable")
+    delay = np.concatenate([p["delay"] for p in parts])[order]
+    conf = np.concatenate([p["confidence"] for p in parts])[order]
+    return t[order], delay, conf, parts[0]["pairs"]
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def day_segments(audio_dir, day):
+    """
+    Segments under audio_dir (stored flat) whose capture start falls on
+    the UTC date 'day'; the name only pre-selects, the start is the
+    segment_timeline one (BEXT time_reference first).
+    """
+    t_day = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    candidates = []
+    for path in wav_header.iter_wavs([audio_dir]):
+        t = segment_timeline.parse_name_time(path)
+        if t is None or t_day - 86400 <= t < t_day + 2 * 86400:
+            candidates.append(path)
+    tl = segment_timeline.build_timeline(candidates)
+    start = tl["start"] / tl["sample_rate"].astype(np.float64)
+    keep = (start >= t_day) & (start < t_day + 86400) & (tl["frames"] > 0)
+    return list(tl["path"][keep]), start[keep]
+
+
+def _job(path, cfg, out_path, events_dir):
+    """Pool entry point: process one segment, return only its stats."""
+    return process_segment(path, cfg, out_path, events_dir)[4]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCC-PHAT delays for all mic pairs over sliding windows.")
+    parser.add_argument("paths", nargs="*", help="WAVs/directories (default: segments of --date in [analyticspi] to_audio_dir)")
+    parser.add_argument("--date", help="capture date YYYY-MM-DD (default: yesterday, UTC)")
+    parser.add_argument("--all-windows", action="store_true", help="every window, ignore the event index")
+    parser.add_argument("--workers", type=int, help="processes (default: [gcc_phat] workers)")
+    parser.add_argument("--out-dir", help="default: [gcc_phat] out_dir")
+    parser.add_argument("--print", action="store_true", help="print a per-pair summary, write nothing")
+    args = parser.parse_args()
+
+    cfg = read_gcc_config()
+    out_dir = Path(args.out_dir or cfg["out_dir"])
+    workers = args.workers or cfg["workers"]
+    day = args.date or (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+    if args.paths:
+        tl = segment_timeline.build_timeline(args.paths)
+        has_audio = tl["frames"] > 0
+        paths = list(tl["path"][has_audio])
+        starts = tl["start"][has_audio] / tl["sample_rate"][has_audio].astype(np.float64)
+    else:
+        paths, starts = day_segments(cfg["audio_dir"], day)
+    events_dir = None
+    if cfg["use_events"] and not args.all_windows:
+        events_dir = Path(f"/home/{getpass.getuser()}/logs/event_screen")
+
+    if args.print:
+        for path in paths:
+            t, delay, conf, pairs, stats = process_segment(path, cfg, None, events_dir)
+            print(f"{os.path.basename(path)}: {stats['windows']} windows in {stats['seconds']:.1f} s")
+            for p, (i, j) in enumerate(pairs):
+                good = conf[:, p] >= 0.3
+                med = np.median(delay[good, p]) * 1000 if good.any() else float("nan")
+                print(f"  {i}-{j}: median delay {med:+7.3f} ms over {good.sum()} windows "
+                      f"(confidence ≥ 0.3), mean confidence {conf[:, p].mean() if len(conf) else 0:.2f}")
+        return 0
+
+    jobs = []
+    for path, start in zip(paths, starts):
+        seg_day = datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m-%d")
+        out_path = out_dir / seg_day / (Path(path).name.split(".")[0] + "_tdoa.npz")
+        if not out_path.exists():
+            jobs.append((path, out_path))
+    print(f"{len(paths)} segments, {len(paths) - len(jobs)} done, {len(jobs)} to go on {workers} workers")
+
+    t0 = time.perf_counter()
+    audio = covered = 0.0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_job, p, cfg, o, events_dir): p for p, o in jobs}
+        for fut in as_completed(futures):
+            try:
+                stats = fut.result()
+            except (OSError, ValueError) as e:
+                print(f"{futures[fut]}: {e}")
+                continue
+            audio += stats["audio_s"]
+            covered += stats["covered_s"]
+            print(f"{os.path.basename(futures[fut])}: {stats['windows']} windows "
+                  f"({stats['covered_s']:.0f} of {stats['audio_s']:.0f} s), "
+                  f"{stats['covered_s'] / stats['seconds'] if stats['seconds'] else 0:.1f}x real time")
+    dt = time.perf_counter() - t0
+    if dt and audio:
+        print(f"Total: {covered / 3600:.2f} h analysed of {audio / 3600:.2f} h in {dt / 60:.1f} min "
+              f"({covered / dt:.1f}x real time on {workers} workers; a full day takes "
+              f"{86400 / (covered / dt) / 3600 if covered else 0:.1f} h)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+pool_logs.py
+
+Incremental, parallel replacement for pool_logs.sh. Pulls the logs of
+every Pi into
+    /home/analyticspi/logs/pooled/<pi>/            ← ~/logs/ of that Pi
+    /home/analyticspi/logs/pooled/<pi>/chrony/     ← /var/log/chrony/
+(same layout as before; [pool_logs] exclude, default *.gz, applies to
+~/logs only — chrony's compressed rotations are kept for
+chrony_analysis.py's multi-day windows), but
+
+  * all Pis at once (one thread each), and per Pi everything goes over a
+    single SSH connection: ssh/rsync run with ControlMaster=auto and
+    ControlPersist ([pool_logs] control_persist), so the listing, the
+    transfers and the next cron run 10 min later reuse the session
+  * only what changed: one `find` per Pi lists path, size and mtime of
+    all log files; a file is pulled if it is new or its size/mtime differs
+    from the cursor, i.e. what was pooled last time. Dated files
+    (YYYY-MM-DD in the name) are only considered for the last [pool_logs]
+    days (today and yesterday); undated ones — synced_files.log, chrony's
+    tracking.log and rotated *.log.1 … — are always compared. The changed
+    files go in one `rsync --files-from` per source
+  * the cursor is the manifest
+        /home/analyticspi/logs/pooled/manifest.json
+        {"updated": …, "cursor": {pi: POSIX time of its last good pull},
+         "files": {"<pi>/<path>": {"size", "mtime", "pooled_at"}}}
+    which summarize_daily_logs.py reads (inputs_changed()) to skip days
+    whose inputs were not touched since their summary was built
+
+A Pi that cannot be reached keeps its manifest entries and is retried on
+the next run. --local-root DIR reads <DIR>/<pi>/logs/ and
+<DIR>/<pi>/chrony/ from the local disk instead of over SSH (tests, or a
+copy of a Pi's SD card).
+
+Usage:
+    python3 pool_logs.py                       # all Pis, today + yesterday
+    python3 pool_logs.py --pi recordingpi --full
+    python3 pool_logs.py --local-root /tmp/pis --pooled-dir /tmp/pooled --dry-run
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import subprocess
+import configparser
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+PI_NAMES = ["clockpi", "recordingpi", "analyticspi"]
+DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+# the Analytics Pi's own outputs under ~/logs: never pooled into themselves
+OWN_OUTPUTS = ("pooled/", "daily_summaries/")
+# pooled, but not read by summarize_daily_logs.py (and rewritten by its cron job)
+NOT_SUMMARY_INPUTS = ("cron", "daily_summaries")
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_pool_config(config_path=CONFIG_PATH):
+    """Return the host entries + [pool_logs] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["pool_logs"] if config.has_section("pool_logs") else {}
+    local_user = config.get("analyticspi", "analyticspi_user", fallback="analyticspi")
+    hosts = {
+        "clockpi": (config.get("clockpi", "clockpi_user", fallback="clockpi"),
+                    config.get("clockpi", "clockpi_ip", fallback=None)),
+        "recordingpi": (config.get("recordingpi", "recordingpi_user", fallback="recordingpi"),
+                        config.get("recordingpi", "recordingpi_ip", fallback=None)),
+        "analyticspi": (local_user, None),            # local disk
+    }
+    return {
+        "hosts": hosts,
+        "pooled_dir": sec.get("pooled_dir", f"/home/{local_user}/logs/pooled"),
+        "days": int(sec.get("days", 2)),
+        "exclude": [p.strip() for p in sec.get("exclude", "*.gz").split(",") if p.strip()],
+        "control_dir": os.path.expanduser(sec.get("control_dir", "~/.ssh/cm")),
+        "control_persist": sec.get("control_persist", "15m"),
+        "connect_timeout": int(sec.get("connect_timeout", 10)),
+        "compress": sec.get("compress", "true").strip().lower() == "true",
+    }
+
+
+def sources(user):
+    """(source root on the Pi, subdirectory under pooled/<pi>/) pairs."""
+    return [(f"/home/{user}/logs", ""), ("/var/log/chrony", "chrony")]
+
+###############################################################################
+# TRANSPORTS
+###############################################################################
+
+class LocalTransport:
+    """Log trees on the local disk; also used for the Analytics Pi itself."""
+
+    def __init__(self, roots=None):
+        self.roots = roots or {}                      # source root → local directory
+
+    def list(self, roots):
+        """{root: [(rel, size, mtime), …]} of all regular files below each root."""
+        out = {}
+        for root in roots:
+            base = self.roots.get(root, root)
+            files = []
+            for dirpath, _, names in os.walk(base):
+                for name in names:
+                    full = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue                      # rotated away while listing
+                    files.append((os.path.relpath(full, base), st.st_size, int(st.st_mtime)))
+            out[root] = files
+        return out
+
+    def fetch(self, root, rels, dest):
+        """Copy rels (mtime kept) into dest; returns the ones copied."""
+        base = self.roots.get(root, root)
+        done = []
+        for rel in rels:
+            target = Path(dest) / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f".{target.name}.pooling")
+            try:
+                shutil.copy2(os.path.join(base, rel), tmp)
+                os.replace(tmp, target)
+            except OSError as e:
+                print(f"  copy {rel}: {e}", flush=True)
+                continue
+            done.append(rel)
+        return done
+
+
+class SshTransport:
+    """One Pi over SSH; every ssh/rsync call shares one ControlMaster connection."""
+
+    def __init__(self, user, host, cfg):
+        self.dest = f"{user}@{host}"
+        os.makedirs(cfg["control_dir"], mode=0o700, exist_ok=True)
+        self.ssh = ["ssh", "-o", "BatchMode=yes",
+                    "-o", f"ConnectTimeout={cfg['connect_timeout']}",
+                    "-o", "ControlMaster=auto",
+                    "-o", f"ControlPath={cfg['control_dir']}/%C",
+                    "-o", f"ControlPersist={cfg['control_persist']}"]
+        self.compress = cfg["compress"]
+
+    def list(self, roots):
+        """One remote find over all roots: {root: [(rel, size, mtime), …]}."""
+        cmd = " ; ".join(f"find {r}/ -type f -printf '{r}\\t%P\\t%s\\t%T@\\n' 2>/dev/null" for r in roots)
+        proc = subprocess.run(self.ssh + [self.dest, cmd + " ; true"],
+                              capture_output=True, text=True, timeout=300)
+        if proc.returncode != 0:
+            raise OSError(f"ssh {self.dest}: {proc.stderr.strip() or proc.returncode}")
+        out = {r: [] for r in roots}
+        for line in proc.stdout.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 4 and parts[0] in out:
+                out[parts[0]].append((parts[1], int(parts[2]), int(float(parts[3]))))
+        return out
+
+    def fetch(self, root, rels, dest):
+        """rsync --files-from over the shared connection; all or nothing."""
+        Path(dest).mkdir(parents=True, exist_ok=True)
+        cmd = ["rsync", "-rt", "--no-g", "--no-o", "--files-from=-",
+               "-e", " ".join(self.ssh)] + (["-z"] if self.compress else []) + \
+              [f"{self.dest}:{root}/", f"{dest}/"]
+        proc = subprocess.run(cmd, input="\n".join(rels) + "\n", capture_output=True, text=True)
+        if proc.returncode not in (0, 24):            # 24 = file vanished (rotated) meanwhile
+            print(f"  rsync {self.dest}:{root}: exit {proc.returncode}: {proc.stderr.strip()}", flush=True)
+            return []
+        return list(rels)
+
+###############################################################################
+# MANIFEST
+###############################################################################
+
+def manifest_path(pooled_dir):
+    return Path(pooled_dir) / "manifest.json"
+
+
+def load_manifest(pooled_dir):
+    """The cursor of the last run ({} → everything counts as changed)."""
+    try:
+        with open(manifest_path(pooled_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(pooled_dir, manifest):
+    path = manifest_path(pooled_dir)
+    tmp = path.with_suffix(".tmp")
+    manifest["updated"] = time.time()
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def inputs_changed(manifest, log_date, since, grace_s=3600):
+    """
+    True if a pooled file that can hold data of log_date was pooled after
+    'since' (POSIX time, e.g. the mtime of that day's summary): files named
+    with that date, and undated files last modified during the day (plus
+    grace_s). cron/ and daily_summaries/ are not summary inputs and are
+    ignored. Without a manifest (pool_logs.sh) always True.
+    """
+    files = manifest.get("files")
+    if not files:
+        return True
+    day_start = datetime.strptime(log_date, "%Y-%m-%d").timestamp()
+    day_end = day_start + 86400 + grace_s
+    for key, entry in files.items():
+        if entry["pooled_at"] <= since or key.split("/")[1] in NOT_SUMMARY_INPUTS:
+            continue
+        m = DATE_RE.search(os.path.basename(key))
+        if m:
+            if m.group(1) == log_date:
+                return True
+        elif day_start <= entry["mtime"] < day_end:
+            return True
+    return False
+
+###############################################################################
+# POOLING
+###############################################################################
+
+def select(listing, known, keep_dates, exclude):
+    """Files of one source that are new or changed and within the date window."""
+    picked = []
+    for rel, size, mtime in listing:
+        name = os.path.basename(rel)
+        if any(fnmatch.fnmatch(name, p) for p in exclude):
+            continue
+        m = DATE_RE.search(name)
+        if keep_dates is not None and m and m.group(1) not in keep_dates:
+            continue
+        old = known.get(rel)
+        if old is None or old["size"] != size or old["mtime"] != mtime:
+            picked.append((rel, size, mtime))
+    return picked
+
+
+def pool_pi(pi, transport, user, pooled_dir, manifest, keep_dates, exclude, dry_run=False):
+    """List, select, fetch one Pi. Returns (new manifest entries, stats)."""
+    t0 = time.perf_counter()
+    srcs = sources(user)
+    listing = transport.list([root for root, _ in srcs])
+    files = manifest.get("files", {})
+    entries, stats = {}, {"listed": 0, "changed": 0, "pulled": 0, "bytes": 0}
+    for root, sub in srcs:
+        prefix = "/".join(p for p in (pi, sub) if p) + "/"
+        known = {k[len(prefix):]: v for k, v in files.items() if k.startswith(prefix)}
+        if pi == "analyticspi" and not sub:
+            # do not pool the pooled tree (or the summaries built from it) into itself
+            listing[root] = [f for f in listing[root] if not f[0].startswith(OWN_OUTPUTS)]
+        picked = select(listing[root], known, keep_dates, [] if sub == "chrony" else exclude)
+        stats["listed"] += len(listing[root])
+        stats["changed"] += len(picked)
+        if not picked or dry_run:
+            for rel, size, _ in picked:
+                print(f"  {pi}: would pull {prefix}{rel} ({size} B)", flush=True)
+            continue
+        meta = {rel: (size, mtime) for rel, size, mtime in picked}
+        now = time.time()
+        for rel in transport.fetch(root, list(meta), Path(pooled_dir) / prefix.rstrip("/")):
+            size, mtime = meta[rel]
+            entries[prefix + rel] = {"size": size, "mtime": mtime, "pooled_at": now}
+            stats["pulled"] += 1
+            stats["bytes"] += size
+    stats["seconds"] = time.perf_counter() - t0
+    return entries, stats
+
+
+def make_transport(pi, cfg, local_root=None):
+    user, host = cfg["hosts"][pi]
+    if local_root:
+        base = Path(local_root) / pi
+        return LocalTransport({root: str(base / (sub or "logs")) for root, sub in sources(user)})
+    if host is None:
+        return LocalTransport()
+    return SshTransport(user, host, cfg)
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull changed logs from all Pis in parallel into the pooled tree.")
+    parser.add_argument("--pi", action="append", choices=PI_NAMES, help="only this Pi (repeatable)")
+    parser.add_argument("--full", action="store_true", help="compare dated files of every day, not only the last [pool_logs] days")
+    parser.add_argument("--pooled-dir", help="default: [pool_logs] pooled_dir")
+    parser.add_argument("--local-root", help="read <DIR>/<pi>/logs and <DIR>/<pi>/chrony instead of SSH")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be pulled")
+    args = parser.parse_args()
+
+    cfg = read_pool_config()
+    pooled_dir = args.pooled_dir or cfg["pooled_dir"]
+    Path(pooled_dir).mkdir(parents=True, exist_ok=True)
+    pis = args.pi or PI_NAMES
+    today = date.today()
+    keep_dates = None if args.full else {(today - timedelta(days=d)).isoformat() for d in range(cfg["days"])}
+    manifest = load_manifest(pooled_dir)
+
+    def job(pi):
+        transport = make_transport(pi, cfg, args.local_root)
+        return pool_pi(pi, transport, cfg["hosts"][pi][0], pooled_dir, manifest, keep_dates,
+                       cfg["exclude"], args.dry_run)
+
+    t0 = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(pis)) as pool:
+        futures = {pi: pool.submit(job, pi) for pi in pis}
+        results = {}
+        for pi, fut in futures.items():
+            try:
+                results[pi] = fut.result()
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"{pi}: {e}", flush=True)
+                failed.append(pi)
+
+    for pi, (entries, stats) in results.items():
+        print(f"{pi}: {stats['listed']} files, {stats['changed']} changed, {stats['pulled']} pulled "
+              f"({stats['bytes'] / 1e6:.2f} MB) in {stats['seconds']:.1f} s", flush=True)
+        if not args.dry_run:
+            manifest.setdefault("files", {}).update(entries)
+            if stats["pulled"] == stats["changed"]:
+                manifest.setdefault("cursor", {})[pi] = time.time()
+    if not args.dry_run:
+        save_manifest(pooled_dir, manifest)
+    print(f"Pooled into {pooled_dir} in {time.perf_counter() - t0:.1f} s"
+          + (f"; failed: {', '.join(failed)}" if failed else ""), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
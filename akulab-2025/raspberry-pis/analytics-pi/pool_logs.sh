@@ -64,6 +64,18 @@ rsync -avz \
   "${RECORDINGPI_USER}@${RECORDINGPI_IP}:/home/${RECORDINGPI_USER}/logs/" \
   "$RECORDINGPI_TARGET/"
 
+########################################
+# 4b) chrony logs (tracking/measurements/statistics) from every Pi
+########################################
+echo "=== Syncing chrony logs ==="
+# rotated *.gz included: chrony_analysis.py reads them for multi-day windows
+rsync -az \
+  "${CLOCKPI_USER}@${CLOCKPI_IP}:/var/log/chrony/" "$CLOCKPI_TARGET/chrony/" || true
+rsync -az \
+  "${RECORDINGPI_USER}@${RECORDINGPI_IP}:/var/log/chrony/" "$RECORDINGPI_TARGET/chrony/" || true
+rsync -a \
+  "/var/log/chrony/" "$ANALYTICSPI_TARGET/chrony/" || true
+
 ########################################
 # 5) Copy local logs from Analytics Pi
 ########################################
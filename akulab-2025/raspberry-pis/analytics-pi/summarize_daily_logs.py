@@ -20,12 +20,18 @@ It scans pooled logs under
      `chrony_selected_refid` if present).
 
 The rest of the script is unchanged from the original version you sent.
+
+A day whose summary exists is skipped when pool_logs.py's manifest shows
+no input for that day pooled since the summary was written (--force
+rebuilds anyway).
 """
 
 import sys
 import os
+import argparse
 import re
 import csv
+import json
 import statistics
 import collections
 from datetime import datetime, timedelta
@@ -38,13 +44,21 @@ PI_NAMES = ["clockpi", "analyticspi", "recordingpi"]
 # Entry‑point
 # ----------------------------------------------------------------------------
 
-def main(log_date: str) -> None:
+def main(log_date: str, force: bool = False) -> None:
     #log_date = sys.argv[1] if len(sys.argv) > 1 else datetime.now().strftime("%Y-%m-%d")
 
     LOG_BASE = "/home/analyticspi/logs/pooled"
     DAILY_SUM_DIR = "/home/analyticspi/logs/daily_summaries"
     os.makedirs(DAILY_SUM_DIR, exist_ok=True)
 
+    out_file = os.path.join(DAILY_SUM_DIR, f"{log_date}_summary.html")
+    if not force and os.path.exists(out_file):
+        import pool_logs
+        if not pool_logs.inputs_changed(pool_logs.load_manifest(LOG_BASE), log_date,
+                                        os.path.getmtime(out_file)):
+            print(f"Summary up to date: {out_file}")
+            return
+
     html_parts: List[str] = [
         "<html><head><meta charset='utf-8'><title>Daily Summary – "
         f"{log_date}</title></head><body>",
@@ -58,9 +72,15 @@ def main(log_date: str) -> None:
             html_parts.append(f"<p>No logs found for <b>{pi}</b> in {pi_folder}</p>")
             continue
 
+        # -------- alerts ------------------
+        alerts_log = os.path.join(pi_folder, "alerts", f"{log_date}_alerts.log")
+        html_parts.append(parse_alerts_log(alerts_log))
+
         # -------- health snapshot --------
         health_csv = os.path.join(pi_folder, "rpi_health_snapshot", f"{log_date}_rpi_health.csv")
         html_parts.append(parse_health_csv(health_csv, pi, log_date))
+        procs_csv = os.path.join(pi_folder, "rpi_health_snapshot", f"{log_date}_rpi_procs.csv")
+        html_parts.append(parse_process_csv(procs_csv, pi, log_date))
 
         # -------- backup recordings -------
         #backup_log = os.path.join(pi_folder, "backup_recordings", f"{log_date}_backup_recordings.log")
@@ -72,9 +92,14 @@ def main(log_date: str) -> None:
         watchdog_log = os.path.join(pi_folder, "mount_watchdog", f"{log_date}_mount_watchdog.log")
         html_parts.append(parse_mount_watchdog(watchdog_log, log_date))
 
+    # -------- chrony logs, all Pis -------
+    html_parts.append(parse_chrony_logs(LOG_BASE, log_date))
+
+    # -------- per-microphone acoustic QC --
+    html_parts.append(parse_acoustic_qc(os.path.join(LOG_BASE, "analyticspi", "acoustic_qc"), log_date))
+
     html_parts.append("</body></html>")
 
-    out_file = os.path.join(DAILY_SUM_DIR, f"{log_date}_summary.html")
     with open(out_file, "w", encoding="utf-8") as fh:
         fh.write("\n".join(html_parts))
     print(f"Summary generated: {out_file}")
@@ -85,15 +110,11 @@ def main(log_date: str) -> None:
 
 def parse_health_csv(csv_path: str, pi_name: str, log_date: str) -> str:
     """Return HTML snippet summarising a single Pi's health CSV."""
-    if not os.path.isfile(csv_path):
+    cols, rows = read_health_rows(csv_path)
+    if cols is None:
         return f"<p>No rpi_health_snapshot found for <b>{pi_name}</b> on {log_date}.</p>"
-
-    with open(csv_path, "r", encoding="utf-8") as fh:
-        reader = csv.DictReader(fh)
-        rows = list(reader)
-        if not rows:
-            return f"<p>Empty rpi_health_snapshot CSV for <b>{pi_name}</b> on {log_date}.</p>"
-        cols: List[str] = reader.fieldnames or []
+    if not rows:
+        return f"<p>Empty rpi_health_snapshot CSV for <b>{pi_name}</b> on {log_date}.</p>"
 
     # Gather column → list‑of‑values
     col_vals: Dict[str, List[str]] = {c: [r[c] for r in rows] for c in cols}
@@ -143,6 +164,89 @@ def parse_health_csv(csv_path: str, pi_name: str, log_date: str) -> str:
 
     return "\n".join(html)
 
+def read_health_rows(csv_path: str):
+    """
+    Return (columns, rows‑as‑dicts‑of‑str) for one day's health log.
+    Reads the CSV if present, otherwise the binary log parts written by
+    `rpi_health_snapshot.py --format bin` (<DATE>_rpi_health[.N].bin).
+    Returns (None, []) if neither exists.
+    """
+    if os.path.isfile(csv_path):
+        with open(csv_path, "r", encoding="utf-8") as fh:
+            reader = csv.DictReader(fh)
+            rows = list(reader)
+            return reader.fieldnames or [], rows
+
+    # raspberry-pis/binlog.py, only needed when the Pi logs in binary format
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import binlog
+
+    log_dir, name = os.path.split(csv_path)
+    parts = binlog.day_files(log_dir, name[:-len(".csv")])
+    if not parts:
+        return None, []
+
+    cols: List[str] = []
+    rows: List[Dict[str, str]] = []
+    for part in parts:
+        part_cols, part_rows = binlog.read_records(part)
+        cols.extend(c for c in part_cols if c not in cols)
+        for r in part_rows:
+            rows.append({c: ("" if v is None else str(v)) for c, v in zip(part_cols, r)})
+    rows.sort(key=lambda r: r.get("timestamp", ""))
+    for r in rows:
+        for c in cols:
+            r.setdefault(c, "")
+    return cols, rows
+
+# ----------------------------------------------------------------------------
+# Per‑process accounting → HTML
+# ----------------------------------------------------------------------------
+
+def parse_process_csv(csv_path: str, pi_name: str, log_date: str) -> str:
+    """Return HTML table with one row per tracked process (ffmpeg, rsync, …)."""
+    if not os.path.isfile(csv_path):
+        return ""
+
+    with open(csv_path, "r", encoding="utf-8") as fh:
+        rows = list(csv.DictReader(fh))
+    if not rows:
+        return ""
+
+    by_proc: Dict[str, List[Dict[str, str]]] = collections.OrderedDict()
+    for r in rows:
+        by_proc.setdefault(r["process"], []).append(r)
+
+    def nums(rs, col):
+        return [float(r[col]) for r in rs if _is_float(r.get(col))]
+
+    html: List[str] = [
+        f"<h4>Process Accounting for {pi_name}</h4>",
+        "<table border='1' cellpadding='4' cellspacing='0'>",
+        "<tr><th>Process</th><th>Samples running</th><th>Restarts</th>"
+        "<th>CPU % (avg / max)</th><th>RSS MB (max)</th>"
+        "<th>I/O read MB</th><th>I/O write MB</th><th>Ctx switches (vol / invol)</th></tr>"
+    ]
+    for proc, rs in by_proc.items():
+        running = sum(1 for r in rs if _is_float(r["n_procs"]) and float(r["n_procs"]) > 0)
+        restarts = int(sum(nums(rs, "restarts")))
+        cpu = nums(rs, "cpu_percent")
+        rss = nums(rs, "rss_mb")
+        cpu_s = f"{statistics.mean(cpu):.1f} / {max(cpu):.1f}" if cpu else "N/A"
+        rss_s = f"{max(rss):.1f}" if rss else "N/A"
+        io_r = nums(rs, "io_read_mb")
+        io_w = nums(rs, "io_write_mb")
+        io_r_s = f"{sum(io_r):.1f}" if io_r else "N/A"
+        io_w_s = f"{sum(io_w):.1f}" if io_w else "N/A"
+        ctx_s = f"{int(sum(nums(rs, 'ctx_voluntary')))} / {int(sum(nums(rs, 'ctx_involuntary')))}"
+        restart_s = f"<b>{restarts}</b>" if restarts else "0"
+        html.append(
+            f"<tr><td>{proc}</td><td>{running} / {len(rs)}</td><td>{restart_s}</td>"
+            f"<td>{cpu_s}</td><td>{rss_s}</td><td>{io_r_s}</td><td>{io_w_s}</td><td>{ctx_s}</td></tr>"
+        )
+    html.append("</table>")
+    return "\n".join(html)
+
 # ----------------------------------------------------------------------------
 # Chrony helpers
 # ----------------------------------------------------------------------------
@@ -174,6 +278,62 @@ def build_chrony_section(chrony_cols: List[str], col_vals: Dict[str, List[str]])
     return out
 
 
+def parse_chrony_logs(log_base: str, log_date: str) -> str:
+    """Cross‑Pi analysis of pooled chrony logs (see chrony_analysis.py)."""
+    try:
+        import chrony_analysis
+    except ImportError as e:   # numpy missing
+        return f"<p>Chrony analysis unavailable: {e}</p>"
+    return chrony_analysis.build_html(log_base, log_date)
+
+
+def parse_acoustic_qc(qc_dir: str, log_date: str) -> str:
+    """Per‑microphone status table from the acoustic_qc.py day index."""
+    try:
+        import acoustic_qc
+    except ImportError as e:   # numpy missing
+        return f"<p>Acoustic QC unavailable: {e}</p>"
+    cols, rows = acoustic_qc.read_index(qc_dir, log_date)
+    if not rows:
+        return f"<p>No acoustic QC index for {log_date}.</p>"
+    cfg = acoustic_qc.read_qc_config()
+    colours = {"OK": "#c8e6c9", "DC": "#fff9c4", "XTALK": "#ffe0b2", "SILENT": "#ffe0b2",
+               "CLIP": "#ffcdd2", "DEAD": "#ef9a9a"}
+
+    html: List[str] = [
+        f"<h2>Microphones (acoustic QC, {len(rows)} segments)</h2>",
+        "<table border='1' cellpadding='4' cellspacing='0'>",
+        "<tr><th>Mic</th><th>Status (worst)</th><th>Segments not OK</th>"
+        "<th>RMS dBFS (median)</th><th>Peak dBFS (max)</th><th>Clipped samples</th>"
+        "<th>DC (max |x|)</th><th>Silence (mean)</th><th>Max |r| other ch</th></tr>"
+    ]
+    for mic in acoustic_qc.day_mics(cols):
+        metrics = [{m: r.get(f"{m}_{mic}") for m in acoustic_qc.METRICS} for r in rows]
+        statuses = [acoustic_qc.mic_status(m, cfg) for m in metrics]
+        worst = min(statuses, key=acoustic_qc.STATUS_ORDER.index)
+        counts = collections.Counter(s for s in statuses if s != "OK")
+        not_ok = ", ".join(f"{s} {n}" for s, n in counts.most_common()) or "–"
+
+        def vals(k):
+            return [m[k] for m in metrics if m[k] is not None]
+
+        def cell(values, fn, fmt):
+            return f"<td>{fmt.format(fn(values))}</td>" if values else "<td>–</td>"
+
+        html.append(
+            f"<tr><td>{mic}</td><td style='background:{colours[worst]}'>{worst}</td><td>{not_ok}</td>"
+            + cell(vals("rms_db"), statistics.median, "{:.1f}")
+            + cell(vals("peak_db"), max, "{:.1f}")
+            + cell(vals("clips"), lambda v: sum(int(x) for x in v), "{}")
+            + cell(vals("dc"), lambda v: max(abs(x) for x in v), "{:.4f}")
+            + cell(vals("silence"), statistics.mean, "{:.2f}")
+            + cell(vals("xcorr"), max, "{:.2f}")
+            + "</tr>"
+        )
+    html.append("</table>")
+    return "\n".join(html)
+
+
 def _is_float(x: str) -> bool:
     try:
         float(x)
@@ -285,6 +445,32 @@ def parse_backup_log(log_path: str, pi_name: str, log_date: str):
     return html
 
 
+def parse_alerts_log(log_path: str) -> str:
+    """List alerts raised by health_alerts.py (JSON lines) for this day."""
+    if not os.path.isfile(log_path):
+        return ""
+
+    alerts = []
+    with open(log_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                alerts.append(json.loads(line))
+            except ValueError:
+                continue
+    if not alerts:
+        return ""
+
+    firing = sum(1 for a in alerts if a.get("state") == "firing")
+    html: List[str] = [f"<h4>Alerts ({firing} fired)</h4><ul>"]
+    for a in alerts:
+        html.append(
+            f"<li>{a.get('time')} <b>{a.get('state', '').upper()}</b> "
+            f"[{a.get('severity')}] {a.get('rule')}: {a.get('column')} = {a.get('value')}</li>"
+        )
+    html.append("</ul>")
+    return "\n".join(html)
+
+
 def parse_mount_watchdog(log_path: str, log_date: str) -> str:
     if not os.path.isfile(log_path):
         return f"<p>No mount_watchdog log found for analytics-pi on {log_date}.</p>"
@@ -308,8 +494,15 @@ def parse_mount_watchdog(log_path: str, log_date: str) -> str:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build daily HTML summaries from pooled logs.")
+    parser.add_argument("--date", action="append",
+                        help="YYYY-MM-DD to summarise (repeatable; default: yesterday and today)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild even if no pooled input changed since the last summary")
+    args = parser.parse_args()
+
     # Always generate for both yesterday and today to catch late-synced files
     today = datetime.now().strftime("%Y-%m-%d")
     yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    for date in [yesterday, today]:
-        main(date)
\ No newline at end of file
+    for date in args.date or [yesterday, today]:
+        main(date, args.force)
\ No newline at end of file
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+audio_blocks.py
+
+Bounded-memory block reader for the recorded segments.
+
+An hour of 8-ch float32 is 1.4 GB (2.8 GB once libsndfile hands it back as
+float64), more than a Pi can hold, so every tool that touches samples reads
+them through here instead of sf.read(path):
+
+    for block in iter_blocks(path):                  # (n, channels) float32
+        ...
+
+32-bit float files are read straight from the data chunk located by
+wav_header (so >4 GB files with a stale RIFF header work too), into one
+reused buffer, or as slices of a read-only memory map with use_mmap=True.
+Other formats go through libsndfile block by block, float_codec archives
+through their own block decoder (archive block size). Blocks are views into
+that buffer: copy anything you need to keep past the next iteration.
+
+iter_windows() cuts the same stream into fixed (optionally overlapping)
+analysis windows per channel, in chunks of a few dozen, for batched work.
+"""
+
+import os
+
+import numpy as np
+
+import wav_header
+
+BLOCK_FRAMES = 1 << 16          # 64 Ki frames = 2 MiB for 8-ch float32
+
+
+def iter_blocks(path, hdr=None, start_frame=0, stop_frame=None, block_frames=BLOCK_FRAMES,
+                use_mmap=False):
+    """Yield (n, channels) float32 blocks of frames [start_frame, stop_frame)."""
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    ch = hdr["channels"]
+    total = hdr["frames_on_disk"] or 0
+    stop_frame = total if stop_frame is None else min(stop_frame, total)
+    if stop_frame <= start_frame:
+        return
+
+    if hdr.get("archive"):
+        import float_codec
+        yield from float_codec.iter_frames(hdr["archive"], start_frame, stop_frame,
+                                           meta=hdr["archive_meta"])
+        return
+
+    if hdr["subtype"] != "FLOAT":
+        import soundfile as sf
+        with sf.SoundFile(path) as f:
+            f.seek(start_frame)
+            remaining = stop_frame - start_frame
+            while remaining > 0:
+                block = f.read(min(block_frames, remaining), dtype="float32", always_2d=True)
+                if not len(block):
+                    break
+                remaining -= len(block)
+                yield block
+        return
+
+    frame_bytes = 4 * ch
+    if use_mmap:
+        data = np.memmap(path, dtype="<f4", mode="r", offset=hdr["data_offset"],
+                         shape=(total, ch))
+        for pos in range(start_frame, stop_frame, block_frames):
+            yield data[pos:min(pos + block_frames, stop_frame)]
+        del data
+        return
+
+    buf = np.empty((block_frames, ch), dtype="<f4")
+    view = memoryview(buf).cast("B")
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        f.seek(hdr["data_offset"] + start_frame * frame_bytes)
+        remaining = stop_frame - start_frame
+        while remaining > 0:
+            want = min(block_frames, remaining) * frame_bytes
+            got = f.readinto(view[:want])
+            if not got:
+                break
+            n = got // frame_bytes
+            remaining -= n
+            yield buf[:n]
+
+
+def read_frames(path, start_frame, n_frames, hdr=None):
+    """Read n_frames from start_frame into a new (n, channels) float32 array."""
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    parts = [b.copy() for b in iter_blocks(path, hdr, start_frame, start_frame + n_frames,
+                                           block_frames=max(1, n_frames))]
+    if not parts:
+        return np.zeros((0, hdr["channels"]), dtype=np.float32)
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def iter_windows(path, window_frames, hop_frames, hdr=None, start_frame=0, stop_frame=None, chunk=64):
+    """
+    Yield (first_window_index, windows) for frames [start_frame, stop_frame):
+    windows (n, channels, window_frames) float32 (own memory), n ≤ chunk,
+    window i starting at start_frame + i * hop_frames. A trailing partial
+    window is dropped.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    buf = np.zeros((0, hdr["channels"]), dtype=np.float32)
+    index = 0
+    skip = 0                                   # frames between windows not yet read (hop > window)
+    for block in iter_blocks(path, hdr, start_frame, stop_frame):
+        if skip >= len(block):
+            skip -= len(block)
+            continue
+        buf = np.concatenate((buf, block[skip:]))
+        skip = 0
+        n = (len(buf) - window_frames) // hop_frames + 1 if len(buf) >= window_frames else 0
+        if n:
+            view = np.lib.stride_tricks.sliding_window_view(buf, window_frames, axis=0)
+        for i in range(0, n, chunk):
+            m = min(chunk, n - i)
+            yield index, np.ascontiguousarray(view[i * hop_frames:(i + m - 1) * hop_frames + 1:hop_frames])
+            index += m
+        skip = max(0, n * hop_frames - len(buf))
+        buf = buf[n * hop_frames:]
@@ -11,6 +11,9 @@ A single script to handle audio backup:
         * Verification that from_audio_dir and to_audio_dir are mounted
         * rsync of complete .wav files
         * Optionally, sha256 verification if configured (verify_sha256 = true)
+        * Optionally (compress = true), lossless float_codec archives written
+          to the NAS on a worker pool instead of rsync copies; each archive is
+          decoded and checked bit-exact before the file counts as synced
         * Skips SMART checks and local file-removal routine
 
 General Steps in Both Modes:
@@ -23,12 +26,12 @@ General Steps in Both Modes:
 import sys
 import os
 import time
+import shutil
 import subprocess
 import logging
 import configparser
 import argparse
 import getpass
-import hashlib  # <-- NEW
 from pathlib import Path
 from datetime import datetime
 
@@ -140,6 +143,11 @@ def is_file_complete(filepath, modification_threshold):
     return False
 
 
+def sidecar_of(rel_path: str) -> str:
+    """Timing sidecar written next to a segment by recording-pi/segment_writer.py."""
+    return rel_path[:-len(".wav")] + ".timing.csv"
+
+
 def run_rsync_list(from_dir: str, to_dir: str, file_list: list, script_dir: Path, synced_files_log: Path):
     """
     Use rsync with --files-from to transfer the listed files from from_dir to to_dir.
@@ -149,6 +157,8 @@ def run_rsync_list(from_dir: str, to_dir: str, file_list: list, script_dir: Path
     with open(temp_list_path, "w", encoding="utf-8") as tf:
         for rp in file_list:
             tf.write(rp + "\n")
+            if (Path(from_dir) / sidecar_of(rp)).is_file():
+                tf.write(sidecar_of(rp) + "\n")
 
     rsync_command = [
         "rsync",
@@ -184,6 +194,34 @@ def run_rsync_list(from_dir: str, to_dir: str, file_list: list, script_dir: Path
     except OSError:
         pass
 
+def run_compress_list(from_dir: str, to_dir: str, file_list: list, synced_files_log: Path,
+                      report_path: Path, workers: int = 2, level: int = 1):
+    """
+    Compress the listed files from from_dir into <to_dir>/<rel>.f32z (float_codec.py)
+    on a process pool, verify each archive, and append verified ones to synced_files_log.
+    One CSV row per file (ratio, throughput) goes to report_path.
+    """
+    import float_codec  # only needed when compress is enabled
+
+    jobs = []
+    for rp in file_list:
+        dst = Path(to_dir) / (rp + float_codec.SUFFIX)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        jobs.append((str(Path(from_dir) / rp), str(dst)))
+    rel_of = {src: rp for (src, _), rp in zip(jobs, file_list)}
+
+    for res in float_codec.compress_batch(jobs, workers, level, check=True):
+        float_codec.append_report(report_path, res)
+        rp = rel_of[res["file"]]
+        if "error" in res or not res.get("verified"):
+            logging.warning(f"Compression of {rp} failed: {res.get('error', 'archive did not verify')}")
+            continue
+        logging.info(f"Archived {rp}: {res['ratio']:.2f}x, {res['mb_s']:.1f} MB/s, verified bit-exact")
+        if (Path(from_dir) / sidecar_of(rp)).is_file():
+            shutil.copy2(Path(from_dir) / sidecar_of(rp), Path(to_dir) / sidecar_of(rp))
+        with open(synced_files_log, "a", encoding="utf-8") as sf:
+            sf.write(rp + "\n")
+
 ###############################################################################
 # NEW HELPERS FOR SHA256 VERIFICATION
 ###############################################################################
@@ -194,6 +232,7 @@ def compute_local_sha256(filepath):
     Compute the sha256 of a local file (e.g., on the NFS mount).
     Return hex digest as string, or None if error.
     """
+    import hashlib  # only needed when verify_sha256 is enabled
     sha = hashlib.sha256()
     try:
         with open(filepath, "rb") as f:
@@ -300,6 +339,11 @@ def main():
 
     if not complete_unsynced_files:
         logging.info("No new complete .wav files found to sync at this time.")
+    elif rpi_mode == "analyticspi" and config.getboolean("analyticspi", "compress", fallback=False):
+        report_path = log_dir / f"{datetime.now().strftime('%Y-%m-%d')}_compression.csv"
+        run_compress_list(from_audio_dir, to_audio_dir, complete_unsynced_files, synced_files_log,
+                          report_path, config.getint("analyticspi", "compress_workers", fallback=2),
+                          config.getint("analyticspi", "compress_level", fallback=1))
     else:
         run_rsync_list(from_audio_dir, to_audio_dir, complete_unsynced_files, script_dir, synced_files_log)
 
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+binlog.py
+
+Append-only, block-compressed binary log for high-rate health/chrony samples.
+
+Text CSV is fine at one row per 10 minutes, but at one row per second it
+becomes the main write load on the SD card. This format buffers rows in
+memory, packs them as fixed-width little-endian records and writes one
+zlib-compressed block per flush.
+
+File layout
+-----------
+    b"AKBL" | u16 version | u32 schema_len | schema JSON
+    block*
+
+    block = b"BLK1" | u32 n_records | u32 comp_len | u32 crc32(compressed)
+            | zlib(payload)
+
+    schema = [[column_name, type], ...]   type ∈ f8 | i8 | u1 | s<N>
+      f8  float64, None stored as NaN
+      i8  int64,   None stored as INT64_MIN
+      u1  bool,    None stored as 255
+      sN  N-byte utf-8 string, zero padded (e.g. s16, s20)
+
+A block is only visible to readers once it has been written completely and
+its CRC matches, so a power cut mid-write loses at most the block in
+flight. BinLogWriter truncates such a torn tail before appending again.
+A damaged block in the middle of a file is skipped by readers (they
+resynchronise on the next block magic) and never truncated; the writer
+leaves that file alone and appends to a new part instead.
+
+A file holds a single schema. When the columns change (e.g. a different
+--mount-check list) the writer rotates to <stem>.1.bin, <stem>.2.bin, …
+
+Usage
+-----
+    python3 binlog.py to-csv 2025-05-20_rpi_health.bin [-o out.csv]
+    python3 binlog.py info   2025-05-20_rpi_health.bin
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import zlib
+import struct
+import argparse
+from pathlib import Path
+
+MAGIC = b"AKBL"
+BLOCK_MAGIC = b"BLK1"
+VERSION = 1
+FILE_HEAD = struct.Struct("<4sHI")
+BLOCK_HEAD = struct.Struct("<4sIII")
+
+TYPE_FORMATS = {"f8": "d", "i8": "q", "u1": "B"}
+NUMPY_TYPES = {"f8": "<f8", "i8": "<i8", "u1": "u1"}
+INT_NONE = -(2**63)
+BOOL_NONE = 255
+
+
+def infer_type(value):
+    """Pick a column type from a sample value (first row decides)."""
+    if isinstance(value, bool):
+        return "u1"
+    if isinstance(value, int):
+        return "i8"
+    if isinstance(value, float) or value is None:
+        return "f8"
+    return "s16"
+
+
+def struct_format(typ):
+    return TYPE_FORMATS.get(typ) or f"{int(typ[1:])}s"
+
+
+def numpy_type(typ):
+    return NUMPY_TYPES.get(typ) or f"S{int(typ[1:])}"
+
+
+def record_struct(schema):
+    return struct.Struct("<" + "".join(struct_format(t) for _, t in schema))
+
+
+def encode_value(value, typ):
+    if typ == "f8":
+        try:
+            return float("nan") if value is None else float(value)
+        except (TypeError, ValueError):
+            return float("nan")
+    if typ == "i8":
+        return INT_NONE if value is None else int(value)
+    if typ == "u1":
+        return BOOL_NONE if value is None else int(bool(value))
+    return ("" if value is None else str(value)).encode("utf-8")[:int(typ[1:])]
+
+
+def decode_value(value, typ):
+    if typ == "f8":
+        return None if math.isnan(value) else value
+    if typ == "i8":
+        return None if value == INT_NONE else value
+    if typ == "u1":
+        return None if value == BOOL_NONE else bool(value)
+    return value.rstrip(b"\0").decode("utf-8", "replace") or None
+
+###############################################################################
+# READER
+###############################################################################
+
+def read_schema(f):
+    """Read the file header; return (schema, offset of first block)."""
+    head = f.read(FILE_HEAD.size)
+    if len(head) < FILE_HEAD.size:
+        raise ValueError("truncated header")
+    magic, version, schema_len = FILE_HEAD.unpack(head)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a binlog file (magic={magic!r}, version={version})")
+    schema = [tuple(c) for c in json.loads(f.read(schema_len))]
+    return schema, FILE_HEAD.size + schema_len
+
+
+def next_magic(f, pos, size, chunk=1 << 16):
+    """Offset of the next BLOCK_MAGIC at or after 'pos' (size if none)."""
+    while pos < size:
+        f.seek(pos)
+        buf = f.read(chunk + len(BLOCK_MAGIC) - 1)
+        i = buf.find(BLOCK_MAGIC)
+        if i >= 0:
+            return pos + i
+        pos += chunk
+    return size
+
+
+def walk_blocks(f, pos, size):
+    """
+    Yield (offset, n_records, compressed) for every intact block and
+    (offset, None, None) for the start of every damaged stretch. After
+    damage the walk resynchronises on the next block magic; the CRC
+    rejects false matches inside compressed data.
+    """
+    while pos < size:
+        f.seek(pos)
+        head = f.read(BLOCK_HEAD.size)
+        if len(head) == BLOCK_HEAD.size:
+            magic, n, length, crc = BLOCK_HEAD.unpack(head)
+            if magic == BLOCK_MAGIC and pos + BLOCK_HEAD.size + length <= size:
+                comp = f.read(length)
+                if zlib.crc32(comp) == crc:
+                    yield pos, n, comp
+                    pos += BLOCK_HEAD.size + length
+                    continue
+        yield pos, None, None
+        pos = next_magic(f, pos + 1, size)
+
+
+def iter_blocks(path):
+    """
+    Yield (schema, n_records, payload) for every intact block.
+    Torn or corrupt blocks are skipped silently.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        schema, pos = read_schema(f)
+        for _, n, comp in walk_blocks(f, pos, size):
+            if n is not None:
+                yield schema, n, zlib.decompress(comp)
+
+
+def check_blocks(path):
+    """
+    Return (torn_at, damaged). 'torn_at' is the offset of a damaged tail
+    with no intact block after it (None if the file ends cleanly); that
+    tail is what a power cut mid-write leaves behind. 'damaged' counts
+    damaged stretches before it, followed by intact blocks.
+    """
+    size = os.path.getsize(path)
+    torn_at, damaged = None, 0
+    with open(path, "rb") as f:
+        _, pos = read_schema(f)
+        for offset, n, _ in walk_blocks(f, pos, size):
+            if n is None:
+                torn_at = offset
+            elif torn_at is not None:
+                damaged += 1
+                torn_at = None
+    return torn_at, damaged
+
+
+def read_schema_of(path):
+    with open(path, "rb") as f:
+        return read_schema(f)[0]
+
+
+def read_records(path):
+    """Return (columns, rows) with rows as lists of Python values."""
+    schema = read_schema_of(path)
+    rec = record_struct(schema)
+    rows = []
+    for _, n, payload in iter_blocks(path):
+        for values in rec.iter_unpack(payload[:n * rec.size]):
+            rows.append([decode_value(v, t) for v, (_, t) in zip(values, schema)])
+    return [c for c, _ in schema], rows
+
+
+def read_array(path):
+    """Return all records as a numpy structured array (one field per column)."""
+    import numpy as np
+    schema = read_schema_of(path)
+    dtype = np.dtype([(c, numpy_type(t)) for c, t in schema])
+    parts = [np.frombuffer(payload, dtype=dtype, count=n) for _, n, payload in iter_blocks(path)]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def to_csv(path, out):
+    """Write the log as CSV (same layout rpi_health_snapshot writes)."""
+    columns, rows = read_records(path)
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return len(rows)
+
+
+def day_files(log_dir, stem):
+    """All rotated parts of one day's log, in write order."""
+    log_dir = Path(log_dir)
+    first = log_dir / f"{stem}.bin"
+    parts = [first] if first.exists() else []
+    i = 1
+    while (log_dir / f"{stem}.{i}.bin").exists():
+        parts.append(log_dir / f"{stem}.{i}.bin")
+        i += 1
+    return parts
+
+###############################################################################
+# WRITER
+###############################################################################
+
+class BinLogWriter:
+    """
+    Buffer rows for one day's log and append them as compressed blocks.
+
+        w = BinLogWriter(log_dir, "2025-05-20_rpi_health")
+        w.append(header, row)      # buffered
+        w.flush()                  # one block, one write()
+    """
+
+    def __init__(self, log_dir, stem, level=6):
+        self.log_dir = Path(log_dir)
+        self.stem = stem
+        self.level = level
+        self.schema = None
+        self.path = None
+        self.pending = []
+
+    def _open_for(self, schema):
+        """
+        Find (or create) the rotated file whose schema matches. A torn tail
+        is truncated; a file damaged before its last intact block is left
+        as it is and a new part is started.
+        """
+        for path in day_files(self.log_dir, self.stem):
+            try:
+                if read_schema_of(path) != schema:
+                    continue
+                torn_at, damaged = check_blocks(path)
+            except ValueError:
+                continue
+            if damaged:
+                continue
+            if torn_at is not None:
+                with open(path, "r+b") as f:
+                    f.truncate(torn_at)
+            return path
+        parts = day_files(self.log_dir, self.stem)
+        path = self.log_dir / (f"{self.stem}.bin" if not parts else f"{self.stem}.{len(parts)}.bin")
+        blob = json.dumps(schema).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(FILE_HEAD.pack(MAGIC, VERSION, len(blob)) + blob)
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def append(self, header, row, types=None):
+        """
+        Buffer one row. 'types' (column → type) pins columns whose first
+        value may be None; other columns are inferred from the value.
+        """
+        types = types or {}
+        schema = [(c, types.get(c) or infer_type(v)) for c, v in zip(header, row)]
+        if self.schema is not None and [c for c, _ in schema] != [c for c, _ in self.schema]:
+            self.flush()
+            self.schema = None
+        if self.schema is None:
+            # Types are fixed by the first row; later None values still fit.
+            self.schema = schema
+            self.path = None
+        self.pending.append(row)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.path is None:
+            self.path = self._open_for(self.schema)
+        rec = record_struct(self.schema)
+        payload = b"".join(
+            rec.pack(*(encode_value(v, t) for v, (_, t) in zip(row, self.schema)))
+            for row in self.pending
+        )
+        comp = zlib.compress(payload, self.level)
+        block = BLOCK_HEAD.pack(BLOCK_MAGIC, len(self.pending), len(comp), zlib.crc32(comp)) + comp
+        with open(self.path, "ab") as f:
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending = []
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or convert binlog files.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_csv = sub.add_parser("to-csv", help="convert to CSV")
+    p_csv.add_argument("path")
+    p_csv.add_argument("-o", "--output", help="output CSV (default: stdout)")
+    p_info = sub.add_parser("info", help="print schema and block statistics")
+    p_info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.cmd == "to-csv":
+        if args.output:
+            with open(args.output, "w", newline="") as out:
+                n = to_csv(args.path, out)
+            print(f"Wrote {n} rows to {args.output}")
+        else:
+            to_csv(args.path, sys.stdout)
+        return
+
+    schema = read_schema_of(args.path)
+    blocks = records = raw = 0
+    for _, n, payload in iter_blocks(args.path):
+        blocks += 1
+        records += n
+        raw += len(payload)
+    size = os.path.getsize(args.path)
+    print(f"{args.path}: {len(schema)} columns, {blocks} blocks, {records} records")
+    print(f"  file {size} B, raw records {raw} B, ratio {raw / max(size, 1):.1f}x")
+    torn_at, damaged = check_blocks(args.path)
+    if damaged:
+        print(f"  WARNING: {damaged} damaged block(s) mid-file (skipped; appends go to a new part)")
+    if torn_at is not None:
+        print(f"  WARNING: torn tail block at {torn_at} (will be truncated on next append)")
+    for name, typ in schema:
+        print(f"  {name:32s} {typ}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+catalog.py
+
+SQLite catalog of every recorded segment on the NAS, and time-range reads
+across segment boundaries.
+
+One row per segment:
+    path          relative to the audio root (as in synced_files.log)
+    start_sample  capture start, samples since the epoch (segment_timeline:
+                  BEXT time_reference, else origination time, else file name)
+    start_time    the same in POSIX seconds (UTC), indexed
+    frames, sample_rate, channels, size, mtime
+    checksum      sha256 of the file (same as backup_recordings.py), or NULL;
+                  for a float_codec archive, that of the original WAV
+    qc_flags      non-OK microphones from acoustic_qc, e.g. "FAR3=CLIP", ''
+                  if all OK, NULL until acoustic_qc.py has seen the segment
+
+plus, once ltc_decode.py has read a segment's timecode channel, its runs
+of consecutive LTC frames (table timecode: sample ↔ timecode frame count,
+linear within a run); timecode_at() looks a sample up.
+
+'update' (cron, after backup and acoustic QC) adds the segments listed in
+synced_files.log that are not in the catalog yet and fills in QC flags;
+'scan' back-fills from directories.
+
+    read_range(start, end, channels)   → (frames, channels) float32 array
+    iter_range(start, end, channels)   → yields (t, block) pieces
+
+seek straight into the segments that overlap [start, end) and read only
+those frames (audio_blocks), so five minutes across a segment join cost
+five minutes of I/O. Samples not covered by any segment are NaN.
+
+The database lives on the Analytics Pi's own disk ([catalog] db_path):
+SQLite locking is unreliable on NFS. Copy it next to the NAS mount to use
+read_range elsewhere, passing audio_dir= for the local mount point.
+
+Usage:
+    python3 catalog.py update
+    python3 catalog.py scan /media/nas/Audio
+    python3 catalog.py query 2025-05-20T04:58 2025-05-20T05:03 --channels 1,2 --wav out.wav
+"""
+
+import os
+import sys
+import time
+import getpass
+import sqlite3
+import hashlib
+import argparse
+import calendar
+import configparser
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+
+import wav_header
+import segment_timeline
+from audio_blocks import BLOCK_FRAMES, iter_blocks
+
+CONFIG_PATH = Path(__file__).resolve().parent / "config.ini"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    path         TEXT PRIMARY KEY,
+    start_sample INTEGER NOT NULL,
+    start_time   REAL NOT NULL,
+    frames       INTEGER NOT NULL,
+    sample_rate  INTEGER NOT NULL,
+    channels     INTEGER NOT NULL,
+    size         INTEGER,
+    mtime        REAL,
+    time_source  INTEGER,
+    checksum     TEXT,
+    qc_flags     TEXT
+);
+CREATE INDEX IF NOT EXISTS segments_start ON segments (start_time);
+CREATE TABLE IF NOT EXISTS timecode_scans (
+    path         TEXT PRIMARY KEY,
+    channel      INTEGER NOT NULL,
+    fps          TEXT NOT NULL,
+    runs         INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS timecode (
+    path         TEXT NOT NULL,
+    first_sample REAL NOT NULL,
+    last_sample  REAL NOT NULL,
+    first_frame  INTEGER NOT NULL,
+    last_frame   INTEGER NOT NULL,
+    fps          TEXT NOT NULL,
+    drop_frame   INTEGER NOT NULL,
+    PRIMARY KEY (path, first_sample)
+);
+"""
+
+###############################################################################
+# CONFIG / DATABASE
+###############################################################################
+
+def read_catalog_config(config_path=CONFIG_PATH):
+    """Return the [catalog] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    user = getpass.getuser()
+    return {
+        "db_path": config.get("catalog", "db_path", fallback=f"/home/{user}/catalog/recordings.sqlite"),
+        "checksum": config.getboolean("catalog", "checksum", fallback=True),
+        "audio_dir": config.get("analyticspi", "to_audio_dir", fallback="/media/nas/Audio"),
+    }
+
+
+def connect(db_path):
+    """Open (and create if needed) the catalog database."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def file_sha256(path, chunk=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+###############################################################################
+# UPDATE
+###############################################################################
+
+def add_segment(conn, rel_path, audio_dir, checksum=True):
+    """Insert or refresh one segment (headers only, plus sha256 if asked)."""
+    path = os.path.join(audio_dir, rel_path)
+    hdr = wav_header.read_header(path)
+    if hdr["data_offset"] is None or not hdr["channels"]:
+        raise ValueError(f"{path}: no audio ({'; '.join(hdr['problems']) or 'no data chunk'})")
+    tl = segment_timeline.build_timeline([path])
+    if not len(tl["path"]):
+        raise ValueError(f"{path}: no start time")
+    st = os.stat(hdr.get("archive", path))
+    sr = int(tl["sample_rate"][0])
+    start = int(tl["start"][0])
+    conn.execute(
+        "INSERT OR REPLACE INTO segments (path, start_sample, start_time, frames, sample_rate, "
+        "channels, size, mtime, time_source, checksum, qc_flags) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+        (rel_path, start, start / float(sr), int(tl["frames"][0]), sr, hdr["channels"],
+         st.st_size, st.st_mtime, int(tl["source"][0]),
+         (hdr.get("sha256") or file_sha256(path)) if checksum else None))
+
+
+def update_from_manifest(conn, cfg, synced_log, max_files=0):
+    """Add every synced segment that is not catalogued yet. Returns the count."""
+    if not Path(synced_log).is_file():
+        return 0
+    known = {r[0] for r in conn.execute("SELECT path FROM segments")}
+    todo = []
+    for line in Path(synced_log).read_text(encoding="utf-8").splitlines():
+        rel = line.strip()
+        if rel and rel not in known and rel.lower().endswith(".wav"):
+            todo.append(rel)
+            known.add(rel)
+    if max_files:
+        todo = todo[:max_files]
+    n = 0
+    for rel in todo:
+        try:
+            add_segment(conn, rel, cfg["audio_dir"], cfg["checksum"])
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"{rel}: {e}")
+            conn.rollback()
+            continue
+        conn.commit()
+        n += 1
+    return n
+
+
+def update_qc_flags(conn, qc_log_dir):
+    """Fill qc_flags of segments that have none yet from the acoustic_qc index."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "analytics-pi"))
+    import acoustic_qc
+    cfg = acoustic_qc.read_qc_config()
+    pending = conn.execute("SELECT path, start_time FROM segments WHERE qc_flags IS NULL").fetchall()
+    by_day = {}
+    for rel, t in pending:
+        day = datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d")
+        by_day.setdefault(day, []).append(rel)
+
+    n = 0
+    for day, rels in by_day.items():
+        cols, rows = acoustic_qc.read_index(qc_log_dir, day)
+        if not rows:
+            continue
+        mics = acoustic_qc.day_mics(cols)
+        index = {r["file"]: r for r in rows}
+        for rel in rels:
+            row = index.get(os.path.basename(rel))
+            if row is None:
+                continue
+            flags = []
+            for mic in mics:
+                status = acoustic_qc.mic_status({m: row.get(f"{m}_{mic}") for m in acoustic_qc.METRICS}, cfg)
+                if status != "OK":
+                    flags.append(f"{mic}={status}")
+            conn.execute("UPDATE segments SET qc_flags = ? WHERE path = ?", (",".join(flags), rel))
+            n += 1
+    conn.commit()
+    return n
+
+###############################################################################
+# TIMECODE
+###############################################################################
+
+def store_timecode(conn, rel_path, channel, fps, runs):
+    """Replace the LTC runs of one segment (see ltc_decode.timecode_runs)."""
+    conn.execute("DELETE FROM timecode WHERE path = ?", (rel_path,))
+    conn.executemany(
+        "INSERT INTO timecode (path, first_sample, last_sample, first_frame, last_frame, fps, drop_frame) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(rel_path, s0, s1, c0, c1, str(fps), int(drop)) for s0, s1, c0, c1, drop in runs])
+    conn.execute("INSERT OR REPLACE INTO timecode_scans (path, channel, fps, runs) VALUES (?, ?, ?, ?)",
+                 (rel_path, channel, str(fps), len(runs)))
+
+
+def timecode_at(conn, rel_path, sample):
+    """
+    Timecode frame count (float) at a sample index of a segment, from the
+    nearest run (linear, extrapolated at most one run length); None if the
+    segment has no LTC.
+    """
+    rows = conn.execute(
+        "SELECT first_sample, last_sample, first_frame, last_frame FROM timecode "
+        "WHERE path = ? AND last_frame > first_frame ORDER BY first_sample", (rel_path,)).fetchall()
+    if not rows:
+        return None
+    dist = [0.0 if s0 <= sample <= s1 else min(abs(sample - s0), abs(sample - s1)) for s0, s1, _, _ in rows]
+    s0, s1, c0, c1 = rows[int(np.argmin(dist))]
+    if min(dist) > s1 - s0:
+        return None
+    return c0 + (sample - s0) * (c1 - c0) / (s1 - s0)
+
+###############################################################################
+# TIME-RANGE READS
+###############################################################################
+
+def find_segments(conn, start, end):
+    """Rows (path, start_sample, frames, sample_rate, channels) overlapping [start, end)."""
+    # start_time is indexed; a segment is never longer than a day
+    return conn.execute(
+        "SELECT path, start_sample, frames, sample_rate, channels FROM segments "
+        "WHERE start_time < ? AND start_time > ? AND start_time + CAST(frames AS REAL) / sample_rate > ? "
+        "ORDER BY start_sample",
+        (end, start - 86400, start)).fetchall()
+
+
+def iter_range(start, end, channels=None, db_path=None, audio_dir=None, block_frames=BLOCK_FRAMES):
+    """
+    Yield (offset, block) for [start, end) (POSIX seconds, UTC): offset is
+    the frame index of block[0] within the range, block is (n, channels)
+    float32 read directly from the overlapping segments. Gaps are skipped
+    (read_range fills them with NaN). channels: 1-based list, default all.
+    """
+    cfg = read_catalog_config()
+    audio_dir = audio_dir or cfg["audio_dir"]
+    conn = sqlite3.connect(db_path or cfg["db_path"])
+    try:
+        rows = find_segments(conn, start, end)
+    finally:
+        conn.close()
+    if not rows:
+        return
+    rates = {r[3] for r in rows}
+    if len(rates) > 1:
+        raise ValueError(f"segments in range have different sample rates: {sorted(rates)}")
+    sr = rates.pop()
+    first = int(round(start * sr))
+    last = int(round(end * sr))
+    cols = None if channels is None else [c - 1 for c in channels]
+
+    covered = first
+    for rel, s0, frames, _, _ in rows:
+        lo = max(first, s0, covered)             # overlapping segments: earlier one wins
+        hi = min(last, s0 + frames)
+        if hi <= lo:
+            continue
+        path = os.path.join(audio_dir, rel)
+        pos = lo - first
+        for block in iter_blocks(path, None, lo - s0, hi - s0, block_frames):
+            yield pos, (block if cols is None else block[:, cols])
+            pos += len(block)
+        covered = hi
+
+
+def read_range(start, end, channels=None, db_path=None, audio_dir=None):
+    """
+    Return (data, sample_rate): the frames of [start, end) as one contiguous
+    (frames, channels) float32 array; samples no segment covers are NaN.
+    """
+    cfg = read_catalog_config()
+    conn = sqlite3.connect(db_path or cfg["db_path"])
+    try:
+        rows = find_segments(conn, start, end)
+    finally:
+        conn.close()
+    if not rows:
+        raise LookupError(f"no recordings between {start} and {end}")
+    sr = rows[0][3]
+    n_ch = len(channels) if channels else rows[0][4]
+    data = np.full((int(round(end * sr)) - int(round(start * sr)), n_ch), np.nan, dtype=np.float32)
+    for pos, block in iter_range(start, end, channels, db_path, audio_dir):
+        data[pos:pos + len(block)] = block
+    return data, sr
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def parse_time(value):
+    """ISO date-time (UTC) → POSIX seconds."""
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite catalog of recorded segments.")
+    parser.add_argument("--db", help="catalog database (default: [catalog] db_path)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_up = sub.add_parser("update", help="add new segments from synced_files.log, then QC flags")
+    p_up.add_argument("--max-files", type=int, default=0, help="stop after N segments (0 = all)")
+    p_scan = sub.add_parser("scan", help="add every WAV under the given directories")
+    p_scan.add_argument("paths", nargs="+")
+    p_scan.add_argument("--no-checksum", action="store_true", help="skip sha256 (headers only)")
+    p_q = sub.add_parser("query", help="list segments of a time range, optionally extract it")
+    p_q.add_argument("start", help="ISO date-time, UTC")
+    p_q.add_argument("end", help="ISO date-time, UTC")
+    p_q.add_argument("--channels", help="comma-separated, 1-based (default: all)")
+    p_q.add_argument("--wav", help="write the range to this WAV file (float32)")
+    p_q.add_argument("--audio-dir", help="override the audio root (e.g. a laptop mount)")
+    args = parser.parse_args()
+
+    cfg = read_catalog_config()
+    db_path = args.db or cfg["db_path"]
+    conn = connect(db_path)
+    user = getpass.getuser()
+
+    if args.cmd == "update":
+        t0 = time.perf_counter()
+        synced_log = Path(f"/home/{user}/logs/backup_recordings/synced_files/synced_files.log")
+        n = update_from_manifest(conn, cfg, synced_log, args.max_files)
+        q = update_qc_flags(conn, Path(f"/home/{user}/logs/acoustic_qc"))
+        total = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        print(f"Added {n} segments, QC flags for {q}; {total} in catalog ({time.perf_counter() - t0:.1f} s)")
+        return 0
+
+    if args.cmd == "scan":
+        n = 0
+        for path in wav_header.iter_wavs(args.paths):
+            rel = os.path.relpath(os.path.abspath(path), cfg["audio_dir"])
+            root = cfg["audio_dir"]
+            if rel.startswith(".."):
+                rel, root = os.path.abspath(path), "/"
+            try:
+                add_segment(conn, rel, root, cfg["checksum"] and not args.no_checksum)
+            except (OSError, ValueError) as e:
+                print(f"{path}: {e}")
+                continue
+            conn.commit()
+            n += 1
+        print(f"Catalogued {n} segments")
+        return 0
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    for rel, s0, frames, sr, ch in find_segments(conn, start, end):
+        t = datetime.fromtimestamp(s0 / sr, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        print(f"{t}  {frames / sr:7.1f} s  {ch} ch  {rel}")
+    conn.close()
+    if args.wav:
+        import soundfile as sf
+        channels = [int(c) for c in args.channels.split(",")] if args.channels else None
+        t0 = time.perf_counter()
+        data, sr = read_range(start, end, channels, db_path, args.audio_dir)
+        dt = time.perf_counter() - t0
+        gaps = int(np.isnan(data[:, 0]).sum()) if len(data) else 0
+        sf.write(args.wav, np.nan_to_num(data), sr, subtype="FLOAT")
+        print(f"Wrote {len(data)} frames x {data.shape[1]} ch to {args.wav} in {dt:.2f} s"
+              + (f" ({gaps} frames not recorded, written as 0)" if gaps else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+channel_store.py
+
+Chunked, channel-major archive of the recordings, so reading one
+microphone pulls one microphone off the NAS instead of all eight.
+
+Layout, one directory per UTC day:
+
+    <store>/<YYYY-MM-DD>/meta.json      channels, sample_rate, chunk_frames, codec
+    <store>/<YYYY-MM-DD>/ch01.dat       chunk payloads of channel 1, appended
+    <store>/<YYYY-MM-DD>/ch01.idx       one <IQII> record per write:
+                                        chunk, offset, bytes, frames filled
+    …                                   ch02 … ch08
+
+Chunk k of a day holds chunk_frames samples (default 60 s) starting at
+k·chunk_frames after midnight, on the segment_timeline sample grid, so a
+time range maps straight to chunk numbers. Payloads are raw float32
+(--codec none, the default: reads are I/O-bound) or float_codec-compressed
+per chunk (--codec float_codec: smaller, but decoding costs CPU on a Pi).
+Files are append-only: a chunk that straddles two segments is written again
+once the second arrives, and the last index record wins, so an interrupted
+conversion never leaves a half-written chunk in use. Samples that no
+segment covered read back as NaN.
+
+    read(store, start, end, channels)  → (frames, len(channels)) float32
+
+opens only the requested channels' files and decodes only the chunks that
+overlap [start, end). 'bench' times that against reading the same range
+from the interleaved WAVs.
+
+Usage:
+    python3 channel_store.py convert /media/nas/Audio/2025-06-01 --store /media/nas/Channels
+    python3 channel_store.py update --store /media/nas/Channels      # new synced segments
+    python3 channel_store.py read  2025-06-01T04:00 2025-06-01T04:10 --channels 3 --store /media/nas/Channels
+    python3 channel_store.py bench /media/nas/Audio/2025-06-01 2025-06-01T04:00 2025-06-01T05:00 --channels 3
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import getpass
+import argparse
+import calendar
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import wav_header
+import float_codec
+import segment_timeline
+from audio_blocks import iter_blocks, read_frames
+
+IDX = struct.Struct("<IQII")
+IDX_DTYPE = np.dtype([("chunk", "<u4"), ("offset", "<u8"), ("nbytes", "<u4"), ("filled", "<u4")])
+CHUNK_SECONDS = 60
+DAY = 86400
+
+###############################################################################
+# STORE FILES
+###############################################################################
+
+def day_dir(store, day_id):
+    return os.path.join(store, datetime.fromtimestamp(day_id * DAY, timezone.utc).strftime("%Y-%m-%d"))
+
+
+def read_meta(ddir):
+    with open(os.path.join(ddir, "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ensure_day(ddir, channels, sample_rate, chunk_frames, codec):
+    """Create a day directory (or check it matches) and return its meta."""
+    path = os.path.join(ddir, "meta.json")
+    if os.path.exists(path):
+        meta = read_meta(ddir)
+        if (meta["channels"], meta["sample_rate"], meta["chunk_frames"]) != (channels, sample_rate, chunk_frames):
+            raise ValueError(f"{ddir}: existing store has {meta}, segment needs "
+                             f"{channels} ch @ {sample_rate} Hz, chunk {chunk_frames}")
+        return meta
+    os.makedirs(ddir, exist_ok=True)
+    meta = {"channels": channels, "sample_rate": sample_rate, "chunk_frames": chunk_frames, "codec": codec}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+    return meta
+
+
+def load_index(ddir, ch):
+    """{chunk: (offset, nbytes, filled)} of one channel, last write wins."""
+    path = os.path.join(ddir, f"ch{ch + 1:02d}.idx")
+    if not os.path.exists(path):
+        return {}
+    raw = open(path, "rb").read()
+    rec = np.frombuffer(raw[:len(raw) // IDX.size * IDX.size], dtype=IDX_DTYPE)   # ignore a torn record
+    return {int(r["chunk"]): (int(r["offset"]), int(r["nbytes"]), int(r["filled"])) for r in rec}
+
+
+def _encode(x, codec):
+    raw = np.ascontiguousarray(x, dtype="<f4").tobytes()
+    return float_codec.encode_block(raw, 1) if codec == "float_codec" else raw
+
+
+def _decode(payload, n, codec):
+    if codec == "float_codec":
+        return float_codec.decode_block(payload, n, 1)[:, 0]
+    return np.frombuffer(payload, dtype="<f4")
+
+
+def read_chunk(ddir, meta, ch, chunk, index=None):
+    """One chunk of one channel (chunk_frames float32, NaN where unfilled), or None."""
+    index = load_index(ddir, ch) if index is None else index
+    if chunk not in index:
+        return None
+    offset, nbytes, _ = index[chunk]
+    with open(os.path.join(ddir, f"ch{ch + 1:02d}.dat"), "rb") as f:
+        f.seek(offset)
+        payload = f.read(nbytes)
+    return _decode(payload, meta["chunk_frames"], meta["codec"])
+
+
+def write_chunk(ddir, meta, ch, chunk, x, filled):
+    """Append one chunk of one channel and its index record."""
+    payload = _encode(x, meta["codec"])
+    with open(os.path.join(ddir, f"ch{ch + 1:02d}.dat"), "ab") as f:
+        offset = f.tell()
+        f.write(payload)
+    with open(os.path.join(ddir, f"ch{ch + 1:02d}.idx"), "ab") as f:
+        f.write(IDX.pack(chunk, offset, len(payload), filled))
+
+###############################################################################
+# CONVERSION
+###############################################################################
+
+def _store_channel(ddir, meta, k, chunk, column, offset, filled_all):
+    """Write channel k of one chunk; column covers [offset, offset + len) of it."""
+    cf = meta["chunk_frames"]
+    if filled_all:
+        x, filled = column, cf
+    else:
+        x = read_chunk(ddir, meta, k, chunk)
+        x = np.full(cf, np.nan, dtype=np.float32) if x is None else x.copy()
+        x[offset:offset + len(column)] = column
+        filled = int(np.count_nonzero(~np.isnan(x)))
+    write_chunk(ddir, meta, k, chunk, x, filled)
+
+
+def convert_segment(path, store, chunk_seconds=CHUNK_SECONDS, codec="none", workers=4):
+    """
+    Add one segment to the store: each chunk it touches is read once
+    (all channels), split into channels and written, merged with whatever
+    an earlier segment left in a shared edge chunk. Channels are encoded on
+    a thread pool (zlib releases the GIL; each channel has its own files).
+    Returns chunks written.
+    """
+    hdr = wav_header.read_header(path)
+    tl = segment_timeline.build_timeline([path], default_rate=hdr["sample_rate"])
+    if not len(tl["path"]):
+        raise ValueError(f"{path}: no start time")
+    sr, ch = int(tl["sample_rate"][0]), hdr["channels"]
+    s0, frames = int(tl["start"][0]), int(tl["frames"][0])
+    cf = int(chunk_seconds * sr)
+    day_frames = DAY * sr
+    if day_frames % cf:
+        raise ValueError(f"chunk of {chunk_seconds} s does not divide a day")
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for c in range(s0 // cf, (s0 + frames - 1) // cf + 1):
+            lo, hi = max(c * cf, s0), min((c + 1) * cf, s0 + frames)
+            day_id = c * cf // day_frames
+            chunk = c - day_id * (day_frames // cf)
+            ddir = day_dir(store, day_id)
+            meta = ensure_day(ddir, ch, sr, cf, codec)
+            block = read_frames(path, lo - s0, hi - lo, hdr)          # (n, ch)
+            full = lo == c * cf and hi == (c + 1) * cf
+            list(pool.map(lambda k: _store_channel(ddir, meta, k, chunk, block[:, k], lo - c * cf, full),
+                          range(ch)))
+            written += 1
+    return written
+
+###############################################################################
+# READER
+###############################################################################
+
+def read(store, start, end, channels=None, stats=None):
+    """
+    Return (data, sample_rate) for [start, end) (POSIX s, UTC): (frames,
+    len(channels)) float32, NaN where nothing was stored. channels is a
+    1-based list (default all). Bytes read are added to stats['bytes'].
+    """
+    out, sr = None, None
+    for day_id in range(int(start // DAY), int(np.ceil(end / DAY))):
+        ddir = day_dir(store, day_id)
+        if not os.path.exists(os.path.join(ddir, "meta.json")):
+            continue
+        meta = read_meta(ddir)
+        sr, cf = meta["sample_rate"], meta["chunk_frames"]
+        cols = [c - 1 for c in channels] if channels else list(range(meta["channels"]))
+        first, last = int(round(start * sr)), int(round(end * sr))
+        if out is None:
+            out = np.full((last - first, len(cols)), np.nan, dtype=np.float32)
+        base = day_id * DAY * sr
+        lo, hi = max(first, base), min(last, base + DAY * sr)
+        for j, k in enumerate(cols):
+            index = load_index(ddir, k)
+            with open(os.path.join(ddir, f"ch{k + 1:02d}.dat"), "rb") as f:
+                for chunk in range((lo - base) // cf, (hi - base - 1) // cf + 1):
+                    if chunk not in index:
+                        continue
+                    offset, nbytes, _ = index[chunk]
+                    f.seek(offset)
+                    x = _decode(f.read(nbytes), cf, meta["codec"])
+                    if stats is not None:
+                        stats["bytes"] = stats.get("bytes", 0) + nbytes
+                    c0 = base + chunk * cf
+                    a, b = max(lo, c0), min(hi, c0 + cf)
+                    out[a - first:b - first, j] = x[a - c0:b - c0]
+    if out is None:
+        raise LookupError(f"nothing stored in {store} between {start} and {end}")
+    return out, sr
+
+
+def read_interleaved(paths, start, end, channels=None, stats=None):
+    """The same range read from the WAV segments themselves (for 'bench')."""
+    tl = segment_timeline.build_timeline(paths)
+    sr = int(tl["sample_rate"][0])
+    first, last = int(round(start * sr)), int(round(end * sr))
+    cols = [c - 1 for c in channels] if channels else None
+    out = None
+    for path, s0, frames in zip(tl["path"], tl["start"], tl["frames"]):
+        lo, hi = max(first, s0), min(last, s0 + frames)
+        if hi <= lo:
+            continue
+        pos = lo - first
+        for block in iter_blocks(path, None, lo - s0, hi - s0):
+            if stats is not None:
+                stats["bytes"] = stats.get("bytes", 0) + block.nbytes
+            b = block if cols is None else block[:, cols]
+            if out is None:
+                out = np.full((last - first, b.shape[1]), np.nan, dtype=np.float32)
+            out[pos:pos + len(b)] = b
+            pos += len(b)
+    return out, sr
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def parse_time(value):
+    """ISO date-time (UTC) → POSIX seconds."""
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+def _convert(jobs, store, chunk_seconds, codec, workers, checked_log=None):
+    t0 = time.perf_counter()
+    audio_s = 0.0
+    for key, path in jobs:
+        try:
+            n = convert_segment(path, store, chunk_seconds, codec, workers)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            continue
+        hdr = wav_header.read_header(path)
+        audio_s += (hdr["frames_on_disk"] or 0) / float(hdr["sample_rate"] or 1)
+        if checked_log:
+            with open(checked_log, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+        print(f"{os.path.basename(path)}: {n} chunks")
+    dt = time.perf_counter() - t0
+    print(f"{len(jobs)} segments, {audio_s / 3600:.2f} h in {dt:.1f} s "
+          f"({audio_s / dt if dt else 0:.0f}x real time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked channel-major archive store.")
+    parser.add_argument("--store", default="/media/nas/Channels", help="store root (default: /media/nas/Channels)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("convert", help="add WAV segments (files or directories)")
+    p_c.add_argument("paths", nargs="+")
+    p_u = sub.add_parser("update", help="add synced segments not converted yet")
+    for p in (p_c, p_u):
+        p.add_argument("--chunk-seconds", type=int, default=CHUNK_SECONDS)
+        p.add_argument("--codec", choices=["none", "float_codec"], default="none",
+                       help="per-chunk compression (default: none)")
+        p.add_argument("--workers", type=int, default=4, help="encoder threads (default: 4)")
+    p_r = sub.add_parser("read", help="read a time range and print per-channel stats")
+    p_b = sub.add_parser("bench", help="time store reads against interleaved WAV reads")
+    p_b.add_argument("wavs", nargs="+", help="the WAV segments the store was built from")
+    for p in (p_r, p_b):
+        p.add_argument("start", help="ISO date-time, UTC")
+        p.add_argument("end", help="ISO date-time, UTC")
+        p.add_argument("--channels", help="comma-separated, 1-based (default: all)")
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        jobs = [(p, p) for p in wav_header.iter_wavs(args.paths)]
+        _convert(jobs, args.store, args.chunk_seconds, args.codec, args.workers)
+        return 0
+
+    if args.cmd == "update":
+        sys.path.insert(0, str(Path(__file__).resolve().parent / "analytics-pi"))
+        import acoustic_qc
+        user = getpass.getuser()
+        log_dir = Path(f"/home/{user}/logs/channel_store")
+        log_dir.mkdir(parents=True, exist_ok=True)
+        synced_log = Path(f"/home/{user}/logs/backup_recordings/synced_files/synced_files.log")
+        jobs = acoustic_qc.new_segments(acoustic_qc.read_qc_config(), log_dir / "checked_files.log", synced_log)
+        _convert(jobs, args.store, args.chunk_seconds, args.codec, args.workers,
+                 log_dir / "checked_files.log")
+        return 0
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    channels = [int(c) for c in args.channels.split(",")] if args.channels else None
+    stats = {}
+    t0 = time.perf_counter()
+    data, sr = read(args.store, start, end, channels, stats)
+    dt = time.perf_counter() - t0
+    audio_s = len(data) / float(sr)
+    print(f"store:       {data.shape[0]} frames x {data.shape[1]} ch, {stats.get('bytes', 0) / 1e6:.1f} MB "
+          f"read in {dt:.3f} s ({audio_s / dt if dt else 0:.0f}x real time), "
+          f"{np.isnan(data).mean() * 100:.1f} % not stored")
+    if args.cmd == "bench":
+        ref_stats = {}
+        t0 = time.perf_counter()
+        ref, _ = read_interleaved(args.wavs, start, end, channels, ref_stats)
+        dt_ref = time.perf_counter() - t0
+        print(f"interleaved: {ref.shape[0]} frames x {ref.shape[1]} ch, {ref_stats.get('bytes', 0) / 1e6:.1f} MB "
+              f"read in {dt_ref:.3f} s ({audio_s / dt_ref if dt_ref else 0:.0f}x real time)")
+        same = np.array_equal(np.nan_to_num(ref).view("<u4"), np.nan_to_num(data).view("<u4"))
+        print(f"speed-up {dt_ref / dt if dt else 0:.1f}x, {ref_stats.get('bytes', 0) / max(stats.get('bytes', 0), 1):.1f}x "
+              f"fewer bytes, identical samples: {same}")
+        print("(warm page cache times; on the NAS link the byte ratio dominates)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
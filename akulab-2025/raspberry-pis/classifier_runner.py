@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+classifier_runner.py
+
+Batched, windowed runner for bird classifiers (Perch, BirdNET, …) over the
+archive, without loading whole files or running one window at a time.
+
+Per segment (from the catalog or given paths):
+
+    reader thread   audio_blocks → fixed windows per channel → prefetch queue
+    main thread     windows → (batch, window_frames) float32 → model(batch)
+                    → (batch, classes) scores → detections ≥ --threshold
+
+so disk/NFS reads overlap with compute. Segments run on a process pool
+(--workers, one model instance per worker); the parent appends each
+finished segment's detections to a per-day table (binlog.py format)
+    <out_dir>/<DATE>_detections.bin
+    columns timestamp, t_start, channel, label, score, file
+and then the segment to <out_dir>/checkpoint.log, so an interrupted run
+resumes with the next unfinished segment.
+
+Model interface (--model module:factory, module on sys.path or a .py path):
+    model = factory(sample_rate=48000)
+    model.window_s, model.labels, model.sample_rate
+    model(batch) → (len(batch), len(labels)) scores in [0, 1]
+The built-in 'dummy' model is a numpy stand-in (band energies through a
+sigmoid) for testing and throughput measurements.
+
+Usage:
+    python3 classifier_runner.py /media/nas/Audio/2025-06-01 --model dummy --workers 4
+    python3 classifier_runner.py --start 2025-06-01T04:00 --end 2025-06-01T06:00 \\
+        --model perch_model:load --batch 32 --threshold 0.8
+"""
+
+import os
+import sys
+import time
+import queue
+import getpass
+import argparse
+import importlib
+import threading
+import importlib.util
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import binlog
+import wav_header
+import segment_timeline
+from audio_blocks import iter_windows
+
+HEADER = ["timestamp", "t_start", "channel", "label", "score", "file"]
+TYPES = {"timestamp": "s24", "t_start": "f8", "channel": "i8", "label": "s32",
+         "score": "f8", "file": "s48"}
+
+###############################################################################
+# MODELS
+###############################################################################
+
+class DummyModel:
+    """numpy stand-in: log band energy of each window, squashed to [0, 1]."""
+
+    labels = ["low_0.5-2k", "mid_2-8k", "high_8-16k"]
+
+    def __init__(self, sample_rate=48000, window_s=3.0):
+        self.sample_rate = sample_rate
+        self.window_s = window_s
+        n = int(sample_rate * window_s)
+        freqs = np.fft.rfftfreq(n, 1.0 / sample_rate)
+        bands = [(500, 2000), (2000, 8000), (8000, 16000)]
+        self.masks = np.stack([(freqs >= lo) & (freqs < hi) for lo, hi in bands], axis=1).astype(np.float32)
+        self.taper = np.hanning(n).astype(np.float32)
+
+    def __call__(self, batch):
+        spec = np.fft.rfft(batch * self.taper, axis=1)
+        power = (spec.real**2 + spec.imag**2).astype(np.float32) @ self.masks
+        db = 10.0 * np.log10(power / batch.shape[1] + 1e-20)
+        return 1.0 / (1.0 + np.exp(-(db + 60.0) / 6.0))          # 0.5 at -60 dB
+
+
+def load_model(spec, sample_rate):
+    """'dummy' or 'module:factory' (module importable, or a path to a .py file)."""
+    if spec == "dummy":
+        return DummyModel(sample_rate)
+    module_name, _, factory = spec.partition(":")
+    if module_name.endswith(".py"):
+        mod_spec = importlib.util.spec_from_file_location(Path(module_name).stem, module_name)
+        module = importlib.util.module_from_spec(mod_spec)
+        mod_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, factory or "load")(sample_rate=sample_rate)
+
+###############################################################################
+# PIPELINE
+###############################################################################
+
+_MODEL = None
+
+
+def _worker_model(spec, sample_rate):
+    """One model per worker process, loaded on first use."""
+    global _MODEL
+    if _MODEL is None or _MODEL.sample_rate != sample_rate:
+        _MODEL = load_model(spec, sample_rate)
+    return _MODEL
+
+
+def classify_segment(path, model_spec, batch_size=64, hop_s=None, threshold=0.5, prefetch=8):
+    """
+    Run the model over every window of every channel of one segment.
+    Returns (path, detections, stats): detections are (offset_s, channel
+    1-based, label, score); stats has windows, audio_s, seconds, wait_s.
+    """
+    t0 = time.perf_counter()
+    hdr = wav_header.read_header(path)
+    sr, ch = hdr["sample_rate"], hdr["channels"]
+    model = _worker_model(model_spec, sr)
+    if getattr(model, "sample_rate", sr) != sr:
+        raise ValueError(f"{path}: model expects {model.sample_rate} Hz, file is {sr} Hz")
+    window = int(model.window_s * sr)
+    hop = int((hop_s or model.window_s) * sr)
+
+    q = queue.Queue(maxsize=prefetch)
+    failure = []
+
+    def reader():
+        try:
+            for item in iter_windows(path, window, hop, hdr):
+                q.put(item)
+        except Exception as e:          # surfaced in the consumer
+            failure.append(e)
+        finally:
+            q.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    detections = []
+    pending, pending_idx = [], []
+    windows = 0
+    wait = 0.0
+
+    def run(batch, idx):
+        scores = np.asarray(model(batch))                      # (B, classes)
+        hits = np.argwhere(scores >= threshold)
+        for r, c in hits:
+            w, k = idx[r]
+            detections.append((w * hop / float(sr), k + 1, model.labels[c], float(scores[r, c])))
+
+    while True:
+        tw = time.perf_counter()
+        item = q.get()
+        wait += time.perf_counter() - tw
+        if item is None:
+            break
+        first, win = item                                      # (n, ch, window)
+        n = len(win)
+        windows += n * ch
+        pending.append(win.reshape(n * ch, window))
+        pending_idx.extend((first + i, k) for i in range(n) for k in range(ch))
+        while len(pending_idx) >= batch_size:
+            flat = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            run(flat[:batch_size], pending_idx[:batch_size])
+            pending, pending_idx = [flat[batch_size:]], pending_idx[batch_size:]
+    if failure:
+        raise failure[0]
+    if pending_idx:
+        run(np.concatenate(pending), pending_idx)
+
+    detections.sort()
+    stats = {"windows": windows, "audio_s": (hdr["frames_on_disk"] or 0) / float(sr), "channels": ch,
+             "seconds": time.perf_counter() - t0, "wait_s": wait}
+    return str(path), detections, stats
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def catalog_paths(start, end, db_path=None, audio_dir=None):
+    """Segment paths overlapping [start, end) (ISO, UTC) from the recording catalog."""
+    import sqlite3
+    import catalog
+    cfg = catalog.read_catalog_config()
+    start, end = catalog.parse_time(start), catalog.parse_time(end)
+    conn = sqlite3.connect(db_path or cfg["db_path"])
+    try:
+        rows = catalog.find_segments(conn, start, end)
+    finally:
+        conn.close()
+    return [os.path.join(audio_dir or cfg["audio_dir"], r[0]) for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched windowed classifier runner.")
+    parser.add_argument("paths", nargs="*", help="WAVs/directories (default: --start/--end from the catalog)")
+    parser.add_argument("--start", help="ISO date-time (UTC), with --end: segments from the catalog")
+    parser.add_argument("--end", help="ISO date-time (UTC)")
+    parser.add_argument("--db", help="catalog database (default: [catalog] db_path)")
+    parser.add_argument("--audio-dir", help="where catalog paths are mounted here (default: [analyticspi] to_audio_dir)")
+    parser.add_argument("--model", default="dummy", help="'dummy' or module:factory (default: dummy)")
+    parser.add_argument("--batch", type=int, default=64, help="windows per model call (default: 64)")
+    parser.add_argument("--hop", type=float, default=None, help="window hop, s (default: window length)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="min score to record (default: 0.5)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--prefetch", type=int, default=8, help="window chunks queued ahead per worker")
+    parser.add_argument("--out-dir", default=f"/home/{getpass.getuser()}/logs/classifier",
+                        help="detections tables + checkpoint (default: ~/logs/classifier)")
+    args = parser.parse_args()
+
+    if args.paths:
+        paths = list(wav_header.iter_wavs(args.paths))
+    elif args.start and args.end:
+        paths = catalog_paths(args.start, args.end, args.db, args.audio_dir)
+    else:
+        parser.error("give WAV paths or --start and --end")
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = out_dir / "checkpoint.log"
+    done = set()
+    if checkpoint.is_file():
+        done = {l.strip() for l in checkpoint.read_text(encoding="utf-8").splitlines() if l.strip()}
+    todo = [p for p in paths if str(p) not in done]
+    print(f"{len(paths)} segments, {len(paths) - len(todo)} already done, "
+          f"running {len(todo)} on {args.workers} workers (model {args.model}, batch {args.batch})")
+    # same start as event_screen.py / catalog.py: BEXT time_reference first
+    tl = segment_timeline.build_timeline(todo)
+    starts = {p: s / float(sr) for p, s, sr in zip(tl["path"], tl["start"], tl["sample_rate"])}
+    if len(starts) < len(todo):
+        # unreadable or undatable (reported by build_timeline): left for the next run
+        print(f"{len(todo) - len(starts)} of them without a start time, skipped")
+        todo = [p for p in todo if p in starts]
+
+    writers = {}
+    t0 = time.perf_counter()
+    audio = channel_s = windows = 0.0
+    n_det = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(classify_segment, p, args.model, args.batch, args.hop,
+                               args.threshold, args.prefetch): p for p in todo}
+        for fut in as_completed(futures):
+            try:
+                path, dets, stats = fut.result()
+            except Exception as e:   # one bad file must not stop a run
+                print(f"{futures[fut]}: ERROR {e!r}")
+                continue
+            seg_t0 = starts[path]
+            for offset, ch, label, score in dets:
+                t = seg_t0 + offset
+                stamp = datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                day = stamp[:10]
+                if day not in writers:
+                    writers[day] = binlog.BinLogWriter(out_dir, f"{day}_detections")
+                writers[day].append(HEADER, [stamp, t, ch, label, score, os.path.basename(path)], TYPES)
+            for w in writers.values():
+                w.flush()
+            with open(checkpoint, "a", encoding="utf-8") as f:
+                f.write(path + "\n")
+            audio += stats["audio_s"]
+            channel_s += stats["audio_s"] * stats["channels"]
+            windows += stats["windows"]
+            n_det += len(dets)
+            rtf = stats["audio_s"] / stats["seconds"] if stats["seconds"] else 0.0
+            print(f"{os.path.basename(path)}: {len(dets)} detections, {stats['windows']} windows, "
+                  f"{rtf:.0f}x real time, waited {stats['wait_s']:.1f} s on I/O")
+
+    dt = time.perf_counter() - t0
+    if dt and audio:
+        print(f"Total: {n_det} detections, {windows / dt:.0f} windows/s, "
+              f"{audio / dt:.0f}x real time ({channel_s / dt:.0f} channel-seconds/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+float_codec.py
+
+Lossless archive codec for the 32-bit float segments, so the NAS stores
+less than the ~160 GB/day of raw pcm_f32le (see storage_calculation.html).
+
+FLAC cannot hold float and WavPack is not installed on the Pis, so this is
+a small numpy + zlib codec. Each block of 64 Ki frames is stored as one of
+
+  mode 1  samples that are exactly k / 2^23 (24-bit converter values):
+          int32 → first difference per channel → zig-zag → byte planes
+  mode 0  anything else: raw float32 bit patterns → byte planes
+          (sign/exponent bytes compress, mantissa noise does not)
+
+and zlib-compressed; the mode is chosen per block by an exact round trip,
+so decoding is always bit-exact. Everything before the data chunk (RIFF /
+ds64 / fmt / BEXT) and after it is kept verbatim, so decompressing gives
+back the original file byte for byte (same sha256, which is stored).
+
+File  <name>.wav.f32z:
+    b"F32Z1\\n", u32 n, JSON (channels, frame_bytes, block_frames, head_len)
+    original header bytes
+    blocks           u8 mode + zlib payload
+    trailer JSON     frames, data bytes, tail length, sha256, sizes
+    tail bytes, block offsets (u64), footer <QQQ8s> (trailer offset,
+    trailer length, index offset, b"F32ZEND\\n")
+
+Transparent decode: wav_header.read_header() and audio_blocks.iter_blocks()
+accept an archive, or the plain '<name>.wav' path when only the archive
+exists, and iter_wavs() lists archives under their .wav name; every tool
+that reads through them (segment_timeline, acoustic_qc, spectrogram,
+tone_detect, catalog, …) works unchanged. Random access decodes only the
+blocks it needs.
+
+Usage:
+    python3 float_codec.py compress /media/nas/Audio/2025-06-01 --workers 3 --report ratio.csv
+    python3 float_codec.py verify   seg.wav seg.wav.f32z
+    python3 float_codec.py decompress seg.wav.f32z [-o seg.wav]
+    python3 float_codec.py info     seg.wav.f32z
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import wav_header
+
+SUFFIX = wav_header.ARCHIVE_SUFFIX
+MAGIC = b"F32Z1\n"
+END_MAGIC = b"F32ZEND\n"
+FOOTER = struct.Struct("<QQQ8s")
+BLOCK_FRAMES = 1 << 16
+SCALE = np.float32(2 ** 23)
+
+###############################################################################
+# BLOCK CODEC
+###############################################################################
+
+def _planes(u, n, ch):
+    """(n, ch) uint32 → byte planes (4, ch, n) as bytes."""
+    return u.astype("<u4", copy=False).view(np.uint8).reshape(n, ch, 4).transpose(2, 1, 0).tobytes()
+
+
+def _unplanes(raw, n, ch):
+    planes = np.frombuffer(raw, np.uint8).reshape(4, ch, n)
+    return np.ascontiguousarray(planes.transpose(2, 1, 0)).view("<u4").reshape(n, ch)
+
+
+def encode_block(raw, ch, level=1):
+    """Compress one block of interleaved float32 bytes (whole frames)."""
+    n = len(raw) // (4 * ch)
+    bits = np.frombuffer(raw, "<u4").reshape(n, ch)
+    x = bits.view("<f4")
+    with np.errstate(invalid="ignore", over="ignore"):
+        i = (x * SCALE).astype(np.int32)
+        exact = np.array_equal((i.astype(np.float32) / SCALE).view("<u4"), bits)
+    if exact:
+        d = np.diff(i, axis=0, prepend=np.zeros((1, ch), np.int32))
+        z = ((d << 1) ^ (d >> 31)).view(np.uint32)
+        return b"\x01" + zlib.compress(_planes(z, n, ch), level)
+    return b"\x00" + zlib.compress(_planes(bits, n, ch), level)
+
+
+def decode_block(payload, n, ch):
+    """Inverse of encode_block → (n, ch) float32."""
+    u = _unplanes(zlib.decompress(payload[1:]), n, ch)
+    if payload[:1] == b"\x01":
+        z = u.view(np.int32)
+        d = (u >> 1).view(np.int32) ^ -(z & 1)
+        i = np.cumsum(d, axis=0, dtype=np.int32)
+        return i.astype(np.float32) / SCALE
+    return u.view("<f4")
+
+###############################################################################
+# FILES
+###############################################################################
+
+def compress_file(src, dst=None, level=1, block_frames=BLOCK_FRAMES):
+    """
+    Compress one WAV to dst (default src + SUFFIX), written as .part and
+    renamed. Returns a stats dict (sizes, ratio, seconds, sha256, modes).
+    """
+    dst = dst or str(src) + SUFFIX
+    t0 = time.perf_counter()
+    hdr = wav_header.read_header(src)
+    if hdr["subtype"] != "FLOAT" or hdr["data_offset"] is None:
+        raise ValueError(f"{src}: not a 32-bit float WAV ({'; '.join(hdr['problems']) or hdr['subtype']})")
+    ch = hdr["channels"]
+    frame_bytes = 4 * ch
+    size = hdr["file_size"]
+    frames = hdr["frames_on_disk"]
+    if not hdr["problems"] and hdr["frames"] is not None:
+        frames = min(frames, hdr["frames"])     # trailing chunks after 'data' go to the tail
+    data_bytes = frames * frame_bytes
+
+    sha = hashlib.sha256()
+    offsets, modes = [], [0, 0]
+    part = dst + ".part"
+    with open(src, "rb") as f, open(part, "wb") as out:
+        head = f.read(hdr["data_offset"])
+        sha.update(head)
+        meta = json.dumps({"channels": ch, "frame_bytes": frame_bytes,
+                           "block_frames": block_frames, "head_len": len(head)}).encode()
+        out.write(MAGIC + struct.pack("<I", len(meta)) + meta + head)
+        remaining = data_bytes
+        while remaining > 0:
+            raw = f.read(min(block_frames * frame_bytes, remaining))
+            if not raw:
+                break
+            sha.update(raw)
+            remaining -= len(raw)
+            payload = encode_block(raw, ch, level)
+            modes[payload[0]] += 1
+            offsets.append(out.tell())
+            out.write(payload)
+        tail = f.read()
+        sha.update(tail)
+        trailer = json.dumps({"frames": (data_bytes - remaining) // frame_bytes,
+                              "data_bytes": data_bytes - remaining, "tail_len": len(tail),
+                              "file_size": size, "sha256": sha.hexdigest()}).encode()
+        trailer_off = out.tell()
+        out.write(trailer + tail)
+        index_off = out.tell()
+        offsets.append(trailer_off)                  # end of the last block
+        out.write(np.asarray(offsets, dtype="<u8").tobytes())
+        out.write(FOOTER.pack(trailer_off, len(trailer), index_off, END_MAGIC))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(part, dst)
+
+    out_size = os.path.getsize(dst)
+    dt = time.perf_counter() - t0
+    return {"file": str(src), "archive": dst, "in_bytes": size, "out_bytes": out_size,
+            "ratio": size / float(out_size), "seconds": dt, "mb_s": size / 1e6 / dt if dt else 0.0,
+            "sha256": sha.hexdigest(), "int_blocks": modes[1], "float_blocks": modes[0]}
+
+
+def open_archive(path):
+    """Return archive metadata: header JSON + trailer JSON, head bytes, block offsets."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a {SUFFIX} archive")
+        meta = json.loads(f.read(struct.unpack("<I", f.read(4))[0]))
+        meta["head"] = f.read(meta["head_len"])
+        f.seek(-FOOTER.size, os.SEEK_END)
+        trailer_off, trailer_len, index_off, magic = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != END_MAGIC:
+            raise ValueError(f"{path}: truncated archive (no footer)")
+        f.seek(trailer_off)
+        meta.update(json.loads(f.read(trailer_len)))
+        meta["tail_offset"] = trailer_off + trailer_len
+        f.seek(index_off)
+        end = os.fstat(f.fileno()).st_size - FOOTER.size
+        meta["offsets"] = np.frombuffer(f.read(end - index_off), dtype="<u8").astype(np.int64)
+    meta["path"] = str(path)
+    return meta
+
+
+def archive_path(path):
+    """The archive behind a .wav path (or the path itself), else None."""
+    path = str(path)
+    if path.endswith(SUFFIX):
+        return path
+    if not os.path.exists(path) and os.path.exists(path + SUFFIX):
+        return path + SUFFIX
+    return None
+
+
+def read_header(path):
+    """wav_header.read_header() of the original file, from the archive."""
+    meta = open_archive(path)
+    hdr = wav_header.parse_header_bytes(meta["head"], meta["file_size"])
+    hdr["path"] = path[:-len(SUFFIX)] if path.endswith(SUFFIX) else path
+    hdr["archive"] = path
+    hdr["sha256"] = meta["sha256"]
+    hdr["archive_meta"] = meta
+    return hdr
+
+
+def iter_frames(path, start_frame=0, stop_frame=None, meta=None):
+    """Yield decoded (n, channels) float32 blocks of [start_frame, stop_frame)."""
+    meta = meta or open_archive(path)
+    bf, ch = meta["block_frames"], meta["channels"]
+    total = meta["frames"]
+    stop_frame = total if stop_frame is None else min(stop_frame, total)
+    if stop_frame <= start_frame:
+        return
+    offsets = meta["offsets"]
+    with open(path, "rb") as f:
+        for b in range(start_frame // bf, (stop_frame - 1) // bf + 1):
+            f.seek(offsets[b])
+            payload = f.read(offsets[b + 1] - offsets[b])
+            n = min(bf, total - b * bf)
+            block = decode_block(payload, n, ch)
+            lo = max(start_frame - b * bf, 0)
+            hi = min(stop_frame - b * bf, n)
+            yield block[lo:hi]
+
+
+def iter_bytes(path):
+    """Yield the original file's bytes: header, audio, tail."""
+    meta = open_archive(path)
+    yield meta["head"]
+    for block in iter_frames(path, meta=meta):
+        yield block.tobytes()
+    with open(path, "rb") as f:
+        f.seek(meta["tail_offset"])
+        yield f.read(meta["tail_len"])
+
+
+def decompress_file(src, dst):
+    with open(dst + ".part", "wb") as out:
+        for chunk in iter_bytes(src):
+            out.write(chunk)
+    os.replace(dst + ".part", dst)
+
+
+def verify(archive, original=None):
+    """
+    True if the archive decodes to its stored sha256 and, when given, to
+    the original file's sha256.
+    """
+    sha = hashlib.sha256()
+    for chunk in iter_bytes(archive):
+        sha.update(chunk)
+    ok = sha.hexdigest() == open_archive(archive)["sha256"]
+    if ok and original is not None:
+        orig = hashlib.sha256()
+        with open(original, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                orig.update(chunk)
+        ok = orig.hexdigest() == sha.hexdigest()
+    return ok
+
+###############################################################################
+# BATCH
+###############################################################################
+
+def compress_and_verify(src, dst=None, level=1, check=True):
+    """Worker job: compress, then prove the archive decodes bit-exactly."""
+    res = compress_file(src, dst, level)
+    if check:
+        t0 = time.perf_counter()
+        res["verified"] = verify(res["archive"])
+        res["verify_seconds"] = time.perf_counter() - t0
+        if not res["verified"]:
+            os.remove(res["archive"])
+    return res
+
+
+def compress_batch(jobs, workers=2, level=1, check=True):
+    """
+    Compress [(src, dst)] on a process pool; yields one result dict per
+    job as it finishes ('error' set on failure).
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(compress_and_verify, s, d, level, check): (s, d) for s, d in jobs}
+        for fut in as_completed(futures):
+            src, dst = futures[fut]
+            try:
+                yield fut.result()
+            except Exception as e:   # one bad file must not stop a batch
+                yield {"file": str(src), "archive": dst, "error": repr(e)}
+
+
+REPORT_FIELDS = ["file", "in_bytes", "out_bytes", "ratio", "seconds", "mb_s",
+                 "int_blocks", "float_blocks", "verified", "verify_seconds", "error"]
+
+
+def append_report(report_path, res):
+    new = not os.path.exists(report_path)
+    with open(report_path, "a", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        if new:
+            w.writeheader()
+        w.writerow({k: (f"{v:.3f}" if isinstance(v, float) else v) for k, v in res.items()})
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Lossless float32 WAV archive codec.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("compress", help="compress WAVs (files or directories)")
+    p_c.add_argument("paths", nargs="+")
+    p_c.add_argument("--out-dir", help="write archives here (default: next to each WAV)")
+    p_c.add_argument("--workers", type=int, default=2)
+    p_c.add_argument("--level", type=int, default=1, help="zlib level (default: 1)")
+    p_c.add_argument("--no-verify", action="store_true", help="skip the decode check")
+    p_c.add_argument("--remove", action="store_true", help="delete each WAV once its archive verified")
+    p_c.add_argument("--report", help="append one CSV row per file")
+    p_v = sub.add_parser("verify", help="check an archive against its stored or the original sha256")
+    p_v.add_argument("original", nargs="?", help="original WAV (optional)")
+    p_v.add_argument("archive")
+    p_d = sub.add_parser("decompress", help="restore the original WAV")
+    p_d.add_argument("archive")
+    p_d.add_argument("-o", "--output", help="output path (default: archive name without suffix)")
+    p_i = sub.add_parser("info", help="print archive metadata")
+    p_i.add_argument("archive")
+    args = parser.parse_args()
+
+    if args.cmd == "compress":
+        srcs = [p for p in wav_header.iter_wavs(args.paths) if os.path.exists(p)]
+        jobs = [(s, os.path.join(args.out_dir, os.path.basename(s) + SUFFIX) if args.out_dir else None)
+                for s in srcs]
+        if args.out_dir:
+            os.makedirs(args.out_dir, exist_ok=True)
+        t0 = time.perf_counter()
+        tot_in = tot_out = bad = 0
+        for res in compress_batch(jobs, args.workers, args.level, not args.no_verify):
+            if args.report:
+                append_report(args.report, res)
+            if "error" in res or res.get("verified") is False:
+                bad += 1
+                print(f"{res['file']}: FAILED {res.get('error', 'verification')}")
+                continue
+            tot_in += res["in_bytes"]
+            tot_out += res["out_bytes"]
+            print(f"{os.path.basename(res['file'])}: {res['ratio']:.2f}x, {res['mb_s']:.0f} MB/s "
+                  f"({res['int_blocks']} int / {res['float_blocks']} float blocks)"
+                  + (", verified" if res.get("verified") else ""))
+            if args.remove and res.get("verified"):
+                os.remove(res["file"])
+        dt = time.perf_counter() - t0
+        if tot_out:
+            print(f"{len(jobs)} files: {tot_in / 1e9:.2f} GB → {tot_out / 1e9:.2f} GB "
+                  f"({tot_in / tot_out:.2f}x) in {dt:.1f} s ({tot_in / 1e6 / dt:.0f} MB/s)")
+        return 1 if bad else 0
+
+    if args.cmd == "verify":
+        ok = verify(args.archive, args.original)
+        print(f"{args.archive}: {'OK (bit-exact)' if ok else 'MISMATCH'}")
+        return 0 if ok else 1
+
+    if args.cmd == "decompress":
+        out = args.output or args.archive[:-len(SUFFIX)]
+        decompress_file(args.archive, out)
+        print(f"Wrote {out}")
+        return 0
+
+    meta = open_archive(args.archive)
+    size = os.path.getsize(args.archive)
+    print(f"{args.archive}: {meta['channels']} ch, {meta['frames']} frames, "
+          f"{len(meta['offsets']) - 1} blocks of {meta['block_frames']}")
+    print(f"  original {meta['file_size']} B, archive {size} B, ratio {meta['file_size'] / size:.2f}x")
+    print(f"  sha256 {meta['sha256']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+health_alerts.py
+
+Streaming threshold alerts on rpi_health_snapshot samples.
+
+rpi_health_snapshot.py calls evaluate() with every new sample, so an alert is
+raised in the same cron run that observed the problem instead of showing up
+in the next HTML summary.
+
+Rules live in config.ini, one section per rule:
+
+    [alert_throttled]
+    column    = throttled_flags
+    trigger   = above          # above | below | deviation
+    threshold = 0
+    clear     = 0              # hysteresis: must fall back past this to clear
+    samples   = 1              # consecutive bad samples before firing
+    absolute  = false          # compare abs(value)
+    mask      = 0xF            # integer columns: compare value & mask
+                               # (throttled_flags bits 16-19 stick until reboot)
+
+'deviation' rules compare the value with an EWMA baseline: the alert fires
+when |value - mean| > threshold * std and clears below clear * std. The std
+is floored at the rule's min_std (column units), so a column that was
+constant during warm-up does not fire on its first change. While a value
+is out of band the baseline keeps adapting at [alerts] ewma_alpha_active,
+so a permanent level shift eventually becomes the new normal and clears.
+
+Alerts are appended as JSON lines to
+    /home/<user>/logs/alerts/<DATE>_alerts.log
+and, if [alerts] outbox = true, also written as .eml files to
+    /home/<user>/logs/alerts/outbox/
+for a mailer (or a local SMTP stand-in) to pick up.
+
+An alert fires once when a rule becomes active and once when it resolves
+(dedup). While active, it is repeated at most every repeat_after seconds,
+and no more than [alerts] max_per_hour messages are written in total.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import socket
+import getpass
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime
+
+DEFAULTS = {
+    "ewma_alpha": 0.1,
+    "ewma_alpha_active": 0.01,
+    "warmup": 12,
+    "max_per_hour": 20,
+    "repeat_after": 3600,
+}
+
+###############################################################################
+# RULES
+###############################################################################
+
+def load_rules(config):
+    """
+    Return list of rule dicts from every [alert_*] section. A section
+    without column / threshold, with an unknown trigger or a non-numeric
+    value (mask: any int literal, e.g. 0xF) is skipped with a warning on
+    stderr, not fatal.
+    """
+    rules = []
+    for section in config.sections():
+        if not section.startswith("alert_"):
+            continue
+        sec = config[section]
+        try:
+            threshold = sec.getfloat("threshold")
+            if not sec.get("column") or threshold is None:
+                raise ValueError("needs column and threshold")
+            if sec.get("trigger", "above") not in ("above", "below", "deviation"):
+                raise ValueError(f"unknown trigger {sec.get('trigger')!r}")
+            rule = {
+                "name": section[len("alert_"):],
+                "column": sec.get("column"),
+                "trigger": sec.get("trigger", "above"),
+                "threshold": threshold,
+                "clear": sec.getfloat("clear", fallback=threshold),
+                "samples": sec.getint("samples", fallback=1),
+                "absolute": sec.getboolean("absolute", fallback=False),
+                "mask": int(sec["mask"], 0) if sec.get("mask") else None,
+                "min_std": sec.getfloat("min_std", fallback=0.0),
+                "repeat_after": sec.getfloat("repeat_after",
+                                             fallback=config.getfloat("alerts", "repeat_after",
+                                                                      fallback=DEFAULTS["repeat_after"])),
+                "severity": sec.get("severity", "warning"),
+            }
+        except ValueError as e:
+            print(f"health_alerts: [{section}] skipped: {e}", file=sys.stderr)
+            continue
+        rules.append(rule)
+    return rules
+
+
+def to_number(value):
+    """Sample values arrive as bool / float / str / None; map to float or None."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, str):
+        if value.lower() in {"true", "false"}:
+            return 1.0 if value.lower() == "true" else 0.0
+        if value == "":
+            return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def check_rule(rule, x, st, alpha, warmup, alpha_active=DEFAULTS["ewma_alpha_active"]):
+    """
+    Update per-rule state 'st' with value x and return True if the value is
+    'bad', False if it is 'good', None if undecided (hysteresis band or
+    EWMA warm-up). Hysteresis: while active, only a value past 'clear'
+    counts as good.
+    """
+    if rule.get("mask") is not None and math.isfinite(x):
+        x = float(int(x) & rule["mask"])
+    if rule["absolute"]:
+        x = abs(x)
+    active = st.get("active", False)
+
+    if rule["trigger"] == "deviation":
+        n = st.get("n", 0)
+        mean, var = st.get("mean", x), st.get("var", 0.0)
+        verdict = None
+        if n >= warmup:
+            std = max(math.sqrt(var), rule.get("min_std", 0.0), 1e-12)
+            z = abs(x - mean) / std
+            if z > rule["threshold"]:
+                verdict = True
+            elif z < rule["clear"] or not active:
+                verdict = False
+        # Outliers only nudge the baseline, so a short spike does not drag
+        # it but a lasting level shift is absorbed and the alert clears.
+        a = alpha_active if verdict is True else alpha
+        diff = x - mean
+        mean += a * diff
+        var = (1 - a) * (var + a * diff * diff)
+        st.update(n=n + 1, mean=mean, var=var)
+        return verdict
+
+    if rule["trigger"] == "below":
+        if x < rule["threshold"]:
+            return True
+        return False if (x >= rule["clear"] or not active) else None
+
+    if x > rule["threshold"]:
+        return True
+    return False if (x <= rule["clear"] or not active) else None
+
+###############################################################################
+# SPOOL
+###############################################################################
+
+def spool_dir():
+    user = getpass.getuser()
+    d = Path(f"/home/{user}/logs/alerts")
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def write_alert(alert, outbox):
+    """Append alert to today's JSON-lines log, optionally drop an .eml file."""
+    d = spool_dir()
+    today = datetime.now().strftime("%Y-%m-%d")
+    with open(d / f"{today}_alerts.log", "a", encoding="utf-8") as f:
+        f.write(json.dumps(alert) + "\n")
+
+    if outbox:
+        from email.message import EmailMessage
+        box = d / "outbox"
+        box.mkdir(exist_ok=True)
+        msg = EmailMessage()
+        msg["Subject"] = f"[{alert['host']}] {alert['state'].upper()} {alert['rule']}"
+        msg["From"] = f"{getpass.getuser()}@{alert['host']}"
+        msg["To"] = "root@localhost"
+        msg.set_content(json.dumps(alert, indent=2))
+        name = f"{int(time.time() * 1000)}_{alert['rule']}.eml"
+        tmp = box / (name + ".tmp")
+        tmp.write_bytes(bytes(msg))
+        os.replace(tmp, box / name)
+
+###############################################################################
+# ENGINE
+###############################################################################
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, state_path):
+    tmp = Path(str(state_path) + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def evaluate(sample, config, state_path, now=None, spool=True):
+    """
+    Run every rule against one health sample (column → value).
+    Persist rule state in 'state_path' and return the list of alerts raised
+    (written to the spool unless spool=False).
+    """
+    state = load_state(state_path)
+    fired = evaluate_state(sample, config, state, now=now, spool=spool)
+    save_state(state, state_path)
+    return fired
+
+
+def evaluate_state(sample, config, state, now=None, spool=True):
+    """
+    Same as evaluate() but with the rule state held by the caller, so a
+    long-running sampler does not rewrite the state file every second.
+    """
+    rules = load_rules(config)
+    if not rules:
+        return []
+    now = now if now is not None else time.time()
+    alpha = config.getfloat("alerts", "ewma_alpha", fallback=DEFAULTS["ewma_alpha"])
+    alpha_active = config.getfloat("alerts", "ewma_alpha_active", fallback=DEFAULTS["ewma_alpha_active"])
+    warmup = config.getint("alerts", "warmup", fallback=DEFAULTS["warmup"])
+    max_per_hour = config.getint("alerts", "max_per_hour", fallback=DEFAULTS["max_per_hour"])
+    outbox = config.getboolean("alerts", "outbox", fallback=False)
+
+    rule_state = state.setdefault("rules", {})
+    sent = [t for t in state.get("sent", []) if now - t < 3600]
+
+    host = socket.gethostname()
+    fired = []
+    for rule in rules:
+        x = to_number(sample.get(rule["column"]))
+        if x is None:
+            continue
+        st = rule_state.setdefault(rule["name"], {})
+        verdict = check_rule(rule, x, st, alpha, warmup, alpha_active)
+
+        if verdict is True:
+            st["bad"] = st.get("bad", 0) + 1
+        elif verdict is False:
+            st["bad"] = 0
+
+        new_state = None
+        if not st.get("active") and st.get("bad", 0) >= rule["samples"]:
+            st["active"], new_state = True, "firing"
+        elif st.get("active") and verdict is False:
+            st["active"], new_state = False, "resolved"
+        elif st.get("active") and rule["repeat_after"] > 0 \
+                and now - st.get("last_sent", 0) >= rule["repeat_after"]:
+            new_state = "repeat"
+
+        if new_state is None:
+            continue
+        if len(sent) >= max_per_hour:
+            st["suppressed"] = st.get("suppressed", 0) + 1
+            continue
+
+        alert = {
+            "time": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            "host": host,
+            "rule": rule["name"],
+            "state": new_state,
+            "severity": rule["severity"],
+            "column": rule["column"],
+            "value": sample.get(rule["column"]),
+            "threshold": rule["threshold"],
+            "suppressed_before": st.pop("suppressed", 0),
+        }
+        if rule["trigger"] == "deviation":
+            alert["baseline_mean"] = st.get("mean")
+            alert["baseline_std"] = math.sqrt(st.get("var", 0.0))
+        if spool:
+            write_alert(alert, outbox)
+        st["last_sent"] = now
+        sent.append(now)
+        fired.append(alert)
+
+    state["sent"] = sent
+    return fired
+
+###############################################################################
+# MAIN  (replay a health CSV through the rules, e.g. to tune thresholds)
+###############################################################################
+
+def main():
+    import csv
+    parser = argparse.ArgumentParser(description="Replay a health CSV through the alert rules.")
+    parser.add_argument("csv_file", help="rpi_health_snapshot CSV to replay")
+    parser.add_argument("--config", default=str(Path(__file__).resolve().parent / "config.ini"))
+    parser.add_argument("--state", default="/tmp/health_alerts_replay.json")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    if os.path.exists(args.state):
+        os.remove(args.state)
+
+    with open(args.csv_file, newline="") as f:
+        for row in csv.DictReader(f):
+            t = datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+            for a in evaluate(row, config, args.state, now=t, spool=False):
+                print(f"{a['time']} {a['state']:8s} {a['rule']} = {a['value']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
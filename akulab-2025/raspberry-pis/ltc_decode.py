@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+ltc_decode.py
+
+SMPTE LTC decoder for sample-accurate timestamps. File names and BEXT
+times come from the Recording Pi's wall clock (aux-history/
+f3_timestamp_experiments.md, notes.txt); a channel carrying LTC from a
+timecode generator (aux-scripts/timecode.sh: ltcgen, 29.97 drop-frame)
+says exactly which sample belongs to which timecode frame.
+
+The chosen channel of a segment is streamed once (audio_blocks) and
+demodulated with numpy, one block at a time:
+
+  transitions   Schmitt trigger at ±30 % of the block's level (blocks below
+                min_dbfs are skipped), sub-sample crossing positions
+  biphase mark  intervals ≈ 1 bit period → 0, two ≈ ½ period → 1
+  frames        the 16-bit sync word 0011111111111101 ends every 80-bit
+                frame; the 64 bits before it are BCD hh:mm:ss:ff + flags,
+                kept only if the frame spans 80 bit periods (±5 %)
+
+Consecutive frames whose timecode advances by one are joined into runs;
+each run is a linear map sample index ↔ timecode frame count, stored in the
+catalog (catalog.py, table timecode) next to the segment:
+
+    path, first_sample, last_sample, first_frame, last_frame, fps, drop_frame
+
+catalog.timecode_at(conn, path, sample) interpolates within the runs.
+
+Usage:
+    python3 ltc_decode.py decode /media/nas/Audio/2025-06-01/auklab_20250601T040000.wav --channel 8
+    python3 ltc_decode.py update                # catalogued segments not decoded yet
+"""
+
+import os
+import sys
+import time
+import argparse
+import configparser
+from pathlib import Path
+from fractions import Fraction
+
+import numpy as np
+
+import wav_header
+import catalog
+from audio_blocks import iter_blocks
+
+CONFIG_PATH = Path(__file__).resolve().parent / "config.ini"
+
+SYNC = np.array([0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1], dtype=np.uint8)
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_ltc_config(config_path=CONFIG_PATH):
+    """Return the [timecode] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["timecode"] if config.has_section("timecode") else {}
+    channel = sec.get("channel", "").strip()
+    return {
+        "channel": int(channel) if channel else None,
+        "fps": Fraction(sec.get("fps", "30000/1001").strip()),
+        "min_dbfs": float(sec.get("min_dbfs", -50)),
+    }
+
+###############################################################################
+# DEMODULATION
+###############################################################################
+
+def transitions(path, channel, hdr=None, min_dbfs=-50.0):
+    """Sub-sample positions (float64, frames) of the polarity changes on one 1-based channel."""
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    floor = 10.0 ** (min_dbfs / 20.0)
+    out = []
+    state, last, pos = -1, 0.0, 0
+    for block in iter_blocks(path, hdr):
+        x = block[:, channel - 1]
+        n = len(x)
+        level = float(np.percentile(np.abs(x[::16]), 95)) if n else 0.0
+        if level < floor:
+            state, pos = -1, pos + n
+            continue
+        h = 0.3 * level
+        mark = np.where(x > h, 1, np.where(x < -h, 0, -1))
+        idx = np.maximum.accumulate(np.where(mark >= 0, np.arange(n), -1))
+        cur = np.where(idx >= 0, mark[np.maximum(idx, 0)], state)
+        prev = np.concatenate(([state], cur[:-1]))
+        i = np.flatnonzero((cur != prev) & (prev >= 0))
+        if len(i):
+            xp = np.concatenate(([last], x))
+            before, after = xp[i], xp[i + 1]                  # x[i-1], x[i]
+            lvl = np.where(cur[i] == 1, h, -h)
+            frac = np.clip((lvl - before) / np.where(after != before, after - before, 1.0), 0.0, 1.0)
+            out.append(pos + i - 1 + frac)
+        state, last, pos = int(cur[-1]), float(x[-1]), pos + n
+    return np.concatenate(out) if out else np.zeros(0)
+
+
+def bits_from_transitions(t, bit_period):
+    """
+    Biphase-mark decode. Returns (bits uint8, starts, ends, epoch): each
+    bit's value, the positions of its leading and trailing transitions, and
+    the number of bad intervals before it. Intervals that are neither ~½ nor
+    ~1 bit period restart the decoder.
+    """
+    d = np.diff(t)
+    r = d / bit_period
+    long_ = (r > 0.75) & (r < 1.3)
+    short = (r > 0.3) & (r <= 0.75)
+    bad = ~(long_ | short)
+    # position of each short interval within its run of shorts: pairs → one 1
+    run_start = np.maximum.accumulate(np.where(~short, np.arange(len(d)), -1))
+    in_run = np.arange(len(d)) - run_start              # 1, 2, 3, … inside a run
+    second_short = short & (in_run % 2 == 0)
+    emit = long_ | second_short
+    bits = np.where(long_, 0, 1)[emit].astype(np.uint8)
+    # a bit starts one (long) or two (short pair) intervals before its end
+    end_idx = np.flatnonzero(emit) + 1
+    ends = t[end_idx]
+    starts = t[end_idx - np.where(long_, 1, 2)[emit]]
+    # bits across a glitch must not join into one frame: mark each bit with
+    # the count of bad intervals before it so frames can be checked
+    epoch = np.cumsum(bad)[end_idx - 1]
+    return bits, starts, ends, epoch
+
+
+def bcd(bits, lo, n):
+    """Little-endian BCD/binary field of n bits starting at lo, for each row."""
+    return bits[:, lo:lo + n] @ (1 << np.arange(n))
+
+
+def decode_frames(bits, starts, ends, epoch, bit_period):
+    """
+    Frames in a bit stream. Returns a dict of arrays: sample (frame start,
+    float), hh, mm, ss, ff, drop (bool).
+    """
+    empty = {k: np.zeros(0, int) for k in ("hh", "mm", "ss", "ff")}
+    empty.update(sample=np.zeros(0), drop=np.zeros(0, bool))
+    if len(bits) < 80:
+        return empty
+    win = np.lib.stride_tricks.sliding_window_view(bits, 16)
+    k = np.flatnonzero((win == SYNC).all(axis=1))            # sync word starts
+    k = k[k >= 64]
+    first, last = k - 64, k + 15
+    ok = (epoch[first] == epoch[last])
+    span = (ends[last] - starts[first]) / bit_period
+    ok &= np.abs(span - 80) < 4
+    first = first[ok]
+    if not len(first):
+        return empty
+    f = bits[first[:, None] + np.arange(64)].astype(np.int64)    # (frames, 64)
+    return {
+        "sample": starts[first],
+        "ff": bcd(f, 0, 4) + 10 * bcd(f, 8, 2),
+        "ss": bcd(f, 16, 4) + 10 * bcd(f, 24, 3),
+        "mm": bcd(f, 32, 4) + 10 * bcd(f, 40, 3),
+        "hh": bcd(f, 48, 4) + 10 * bcd(f, 56, 2),
+        "drop": f[:, 10].astype(bool),
+    }
+
+
+def frame_count(fr, fps):
+    """Timecode → frames since 00:00:00:00 (drop-frame numbering where flagged)."""
+    nominal = int(round(float(fps)))
+    count = ((fr["hh"] * 60 + fr["mm"]) * 60 + fr["ss"]) * nominal + fr["ff"]
+    minutes = fr["hh"] * 60 + fr["mm"]
+    dropped = (nominal // 15) * (minutes - minutes // 10)          # 2 per minute at 30
+    return np.where(fr["drop"], count - dropped, count)
+
+
+def timecode_runs(fr, fps, bit_period):
+    """
+    Join frames whose count advances by one (and whose sample distance is
+    one frame) into runs: list of (first_sample, last_sample, first_frame,
+    last_frame, drop).
+    """
+    if not len(fr["sample"]):
+        return []
+    count = frame_count(fr, fps)
+    step_ok = (np.diff(count) == 1) & (np.abs(np.diff(fr["sample"]) / (80 * bit_period) - 1) < 0.05)
+    breaks = np.flatnonzero(~step_ok) + 1
+    runs = []
+    for a, b in zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(count)]))):
+        b -= 1
+        runs.append((float(fr["sample"][a]), float(fr["sample"][b]), int(count[a]), int(count[b]),
+                     bool(fr["drop"][a])))
+    return runs
+
+
+def decode_segment(path, channel, fps=Fraction(30000, 1001), min_dbfs=-50.0, hdr=None):
+    """
+    Decode LTC on one 1-based channel. Returns (runs, frames): runs as in
+    timecode_runs(), frames the decoded frame dict.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    if not 1 <= channel <= hdr["channels"]:
+        raise ValueError(f"{path}: no channel {channel} ({hdr['channels']} channels)")
+    bit_period = hdr["sample_rate"] / (80.0 * float(fps))
+    t = transitions(path, channel, hdr, min_dbfs)
+    bits, starts, ends, epoch = bits_from_transitions(t, bit_period)
+    fr = decode_frames(bits, starts, ends, epoch, bit_period)
+    return timecode_runs(fr, fps, bit_period), fr
+
+
+def format_tc(count, fps, drop):
+    """Frame count → 'hh:mm:ss:ff' (';' before ff for drop-frame)."""
+    nominal = int(round(float(fps)))
+    if drop:
+        per10 = nominal * 600 - 9 * (nominal // 15)
+        d, m = divmod(count, per10)
+        skip = nominal // 15
+        per_min = nominal * 60 - skip
+        count += 9 * skip * d + (skip * ((m - skip) // per_min) if m > skip else 0)
+    ff = count % nominal
+    s = count // nominal
+    return f"{s // 3600 % 24:02d}:{s // 60 % 60:02d}:{s % 60:02d}{';' if drop else ':'}{ff:02d}"
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode SMPTE LTC → sample/timecode map in the catalog.")
+    parser.add_argument("--db", help="catalog database (default: [catalog] db_path)")
+    parser.add_argument("--channel", type=int, help="1-based LTC channel (default: [timecode] channel)")
+    parser.add_argument("--fps", help="frame rate, e.g. 30000/1001, 25 (default: [timecode] fps)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_dec = sub.add_parser("decode", help="decode files, print the runs (and store them with --store)")
+    p_dec.add_argument("paths", nargs="+")
+    p_dec.add_argument("--store", action="store_true", help="write the runs to the catalog")
+    p_up = sub.add_parser("update", help="decode catalogued segments that have no timecode map yet")
+    p_up.add_argument("--max-files", type=int, default=0, help="stop after N segments (0 = all)")
+    args = parser.parse_args()
+
+    cfg = read_ltc_config()
+    channel = args.channel or cfg["channel"]
+    fps = Fraction(args.fps) if args.fps else cfg["fps"]
+    if channel is None:
+        print("No LTC channel: set [timecode] channel in config.ini or pass --channel.")
+        return 1
+    cat_cfg = catalog.read_catalog_config()
+
+    if args.cmd == "decode":
+        conn = catalog.connect(args.db or cat_cfg["db_path"]) if args.store else None
+        for path in wav_header.iter_wavs(args.paths):
+            t0 = time.perf_counter()
+            hdr = wav_header.read_header(path)
+            try:
+                runs, fr = decode_segment(path, channel, fps, cfg["min_dbfs"], hdr)
+            except (OSError, ValueError) as e:
+                print(f"{path}: {e}")
+                continue
+            dt = time.perf_counter() - t0
+            audio = (hdr["frames_on_disk"] or 0) / float(hdr["sample_rate"])
+            print(f"{os.path.basename(path)}: {len(fr['sample'])} frames in {len(runs)} runs, "
+                  f"{audio / dt if dt else 0:.0f}x real time")
+            for s0, s1, c0, c1, drop in runs:
+                spf = (s1 - s0) / (c1 - c0) if c1 > c0 else float("nan")
+                print(f"  samples {s0:12.1f} … {s1:12.1f}  {format_tc(c0, fps, drop)} … "
+                      f"{format_tc(c1, fps, drop)}  ({spf:.3f} samples/frame)")
+            if conn is not None:
+                rel = os.path.relpath(os.path.abspath(path), cat_cfg["audio_dir"])
+                if rel.startswith(".."):
+                    rel = os.path.abspath(path)
+                catalog.store_timecode(conn, rel, channel, fps, runs)
+                conn.commit()
+        return 0
+
+    conn = catalog.connect(args.db or cat_cfg["db_path"])
+    todo = [r[0] for r in conn.execute(
+        "SELECT path FROM segments WHERE path NOT IN (SELECT path FROM timecode_scans) "
+        "ORDER BY start_time")]
+    if args.max_files:
+        todo = todo[:args.max_files]
+    t0 = time.perf_counter()
+    audio = 0.0
+    for rel in todo:
+        path = os.path.join(cat_cfg["audio_dir"], rel)
+        try:
+            hdr = wav_header.read_header(path)
+            runs, fr = decode_segment(path, channel, fps, cfg["min_dbfs"], hdr)
+        except (OSError, ValueError) as e:
+            print(f"{rel}: {e}")
+            continue
+        catalog.store_timecode(conn, rel, channel, fps, runs)
+        conn.commit()
+        audio += (hdr["frames_on_disk"] or 0) / float(hdr["sample_rate"])
+        print(f"{rel}: {len(fr['sample'])} LTC frames, {len(runs)} runs")
+    dt = time.perf_counter() - t0
+    print(f"Decoded {len(todo)} segments" + (f", {audio / dt:.0f}x real time" if dt and audio else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
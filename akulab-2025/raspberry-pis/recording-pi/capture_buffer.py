@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+capture_buffer.py
+
+Ring-buffer shim for the capture pipe in record_zoom.sh
+([recordingpi] capture_buffer = true):
+
+    arecord … | capture_buffer.py | ffmpeg … (or segment_writer.py)
+
+Between arecord and the segment writer there is otherwise only a 64 KiB
+pipe: when the USB HDD stalls for a few seconds, arecord blocks, ALSA
+overruns and samples are lost without a trace. Here a reader thread
+drains stdin continuously into a large RAM ring ([capture_buffer]
+ring_mib, anonymous mmap) and a writer thread feeds stdout from it, so a
+stall only fills the ring. Only if the ring is full are incoming frames
+dropped (whole frames, so channels stay aligned) — and counted.
+
+Every interval_s it logs one row to
+    /home/<user>/logs/capture_buffer/<DATE>_capture_buffer.csv
+    timestamp, fill_pct, hwm_pct, hwm_s, in_mb_s, out_mb_s, stalls,
+    max_stall_s, dropped_frames, dropped_total
+(hwm = highest fill in the interval, a stall = one write to stdout
+blocking ≥ stall_s) and rewrites status.json in the same directory with
+the values over the last status_window_s, which rpi_health_snapshot.py
+turns into capture_* columns (and alerts).
+
+Usage:
+    arecord -D hw:2,0 -f FLOAT_LE -c 8 -r 48000 -t raw | python3 capture_buffer.py | ffmpeg …
+    python3 capture_buffer.py --ring-mib 16 < producer > slow_consumer
+"""
+
+import os
+import sys
+import csv
+import json
+import mmap
+import time
+import signal
+import getpass
+import argparse
+import threading
+import configparser
+from pathlib import Path
+from collections import deque
+from datetime import datetime
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+
+HEADER = ["timestamp", "fill_pct", "hwm_pct", "hwm_s", "in_mb_s", "out_mb_s",
+          "stalls", "max_stall_s", "dropped_frames", "dropped_total"]
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_buffer_config(config_path=CONFIG_PATH):
+    """Return the [capture_buffer] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["capture_buffer"] if config.has_section("capture_buffer") else {}
+    get = lambda k, d: float(sec.get(k, d))
+    return {
+        "ring_mib": int(get("ring_mib", 256)),
+        "channels": int(get("channels", 8)),
+        "sample_rate": config.getint("recordingpi", "sample_rate", fallback=48000),
+        "read_kib": int(get("read_kib", 64)),
+        "write_kib": int(get("write_kib", 1024)),
+        "stall_s": get("stall_s", 0.5),
+        "interval_s": get("interval_s", 5),
+        "status_window_s": get("status_window_s", 600),
+    }
+
+###############################################################################
+# RING
+###############################################################################
+
+class Ring:
+    """
+    Single-producer / single-consumer byte ring. put() never blocks (drops
+    whole frames when full); get_view() blocks until data or EOF.
+    """
+
+    def __init__(self, size, frame_bytes):
+        self.size = size // frame_bytes * frame_bytes
+        self.frame_bytes = frame_bytes
+        self.buf = mmap.mmap(-1, self.size)
+        self.mv = memoryview(self.buf)
+        self.head = 0            # bytes ever written
+        self.tail = 0            # bytes ever consumed
+        self.eof = False
+        self.cond = threading.Condition()
+        # statistics, reset by take_stats()
+        self.hwm = 0
+        self.bytes_in = self.bytes_out = 0
+        self.dropped = 0
+        self.stalls = []
+
+    def put(self, data):
+        """Append whole frames; returns the number of frames dropped."""
+        n = len(data)
+        with self.cond:
+            if n > self.size - (self.head - self.tail):
+                self.dropped += n // self.frame_bytes
+                return n // self.frame_bytes
+        pos = self.head % self.size
+        first = min(n, self.size - pos)
+        self.mv[pos:pos + first] = data[:first]
+        if first < n:
+            self.mv[:n - first] = data[first:]
+        with self.cond:
+            self.head += n
+            self.bytes_in += n
+            self.hwm = max(self.hwm, self.head - self.tail)
+            self.cond.notify()
+        return 0
+
+    def get_view(self, max_bytes):
+        """Contiguous readable view (empty at EOF)."""
+        with self.cond:
+            while self.head == self.tail and not self.eof:
+                self.cond.wait()
+            avail = self.head - self.tail
+        pos = self.tail % self.size
+        return self.mv[pos:pos + min(avail, max_bytes, self.size - pos)]
+
+    def consume(self, n, seconds, stall_s):
+        with self.cond:
+            self.tail += n
+            self.bytes_out += n
+            if seconds >= stall_s:
+                self.stalls.append(seconds)
+
+    def close(self):
+        with self.cond:
+            self.eof = True
+            self.cond.notify()
+
+    def take_stats(self):
+        """Counters since the last call, then reset them."""
+        with self.cond:
+            s = {"fill": self.head - self.tail, "hwm": self.hwm, "in": self.bytes_in,
+                 "out": self.bytes_out, "dropped": self.dropped, "stalls": list(self.stalls)}
+            self.hwm = self.head - self.tail
+            self.bytes_in = self.bytes_out = self.dropped = 0
+            self.stalls = []
+        return s
+
+###############################################################################
+# RELAY
+###############################################################################
+
+def reader(src, ring, read_bytes):
+    """stdin → ring, never blocking on the ring; keeps partial frames for the next read."""
+    fb = ring.frame_bytes
+    buf = bytearray(read_bytes + fb)
+    view = memoryview(buf)
+    carry = 0
+    try:
+        while True:
+            got = src.readinto(view[carry:carry + read_bytes])
+            if not got:
+                break
+            have = carry + got
+            whole = have // fb * fb
+            ring.put(view[:whole])
+            carry = have - whole
+            if carry:
+                buf[:carry] = buf[whole:have]
+    finally:
+        ring.close()
+
+
+def writer(ring, out_fd, write_bytes, stall_s):
+    """ring → stdout; times every write so stalls downstream show up."""
+    while True:
+        view = ring.get_view(write_bytes)
+        if not len(view):
+            return
+        t0 = time.monotonic()
+        try:
+            n = os.write(out_fd, view)
+        except BrokenPipeError:
+            return
+        ring.consume(n, time.monotonic() - t0, stall_s)
+
+
+def report(ring, cfg, log_dir, stop):
+    """Every interval_s: one CSV row, and status.json over the last status_window_s."""
+    bytes_per_s = 4 * cfg["channels"] * cfg["sample_rate"]
+    window = deque()
+    dropped_total = 0
+    status_path = Path(log_dir) / "status.json"
+    last = time.monotonic()
+    while True:
+        stopping = stop.wait(cfg["interval_s"])
+        now = time.monotonic()
+        dt, last = now - last, now
+        s = ring.take_stats()
+        dropped_total += s["dropped"]
+        row = [datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+               round(100.0 * s["fill"] / ring.size, 2), round(100.0 * s["hwm"] / ring.size, 2),
+               round(s["hwm"] / bytes_per_s, 3), round(s["in"] / dt / 1e6, 3), round(s["out"] / dt / 1e6, 3),
+               len(s["stalls"]), round(max(s["stalls"], default=0.0), 3), s["dropped"], dropped_total]
+        log_path = Path(log_dir) / f"{row[0][:10]}_capture_buffer.csv"
+        new = not log_path.exists()
+        with open(log_path, "a", newline="") as f:
+            out = csv.writer(f)
+            if new:
+                out.writerow(HEADER)
+            out.writerow(row)
+
+        window.append((now, s))
+        while window and now - window[0][0] > cfg["status_window_s"]:
+            window.popleft()
+        stalls = [x for _, w in window for x in w["stalls"]]
+        status = {
+            "updated": time.time(),
+            "ring_mb": round(ring.size / 1e6, 1),
+            "ring_s": round(ring.size / bytes_per_s, 1),
+            "fill_pct": row[1],
+            "hwm_pct": round(100.0 * max(w["hwm"] for _, w in window) / ring.size, 2),
+            "stalls": len(stalls),
+            "max_stall_s": round(max(stalls, default=0.0), 3),
+            "dropped_frames": sum(w["dropped"] for _, w in window),
+            "dropped_total": dropped_total,
+            "window_s": cfg["status_window_s"],
+        }
+        tmp = status_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(status))
+        os.replace(tmp, status_path)
+        if stopping:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ring-buffer relay stdin → stdout with occupancy/stall/drop stats.")
+    parser.add_argument("--ring-mib", type=int, help="ring size (default: [capture_buffer] ring_mib)")
+    parser.add_argument("--interval", type=float, help="seconds between stats rows (default: [capture_buffer] interval_s)")
+    parser.add_argument("--log-dir", default=f"/home/{getpass.getuser()}/logs/capture_buffer")
+    args = parser.parse_args()
+
+    cfg = read_buffer_config()
+    if args.ring_mib:
+        cfg["ring_mib"] = args.ring_mib
+    if args.interval:
+        cfg["interval_s"] = args.interval
+    Path(args.log_dir).mkdir(parents=True, exist_ok=True)
+
+    ring = Ring(cfg["ring_mib"] << 20, 4 * cfg["channels"])
+    stop = threading.Event()
+    # SIGTERM: stop reading; what is in the ring is still written out
+    signal.signal(signal.SIGTERM, lambda *_: ring.close())
+    src = sys.stdin.buffer.raw if hasattr(sys.stdin.buffer, "raw") else sys.stdin.buffer
+    threads = [
+        threading.Thread(target=reader, args=(src, ring, cfg["read_kib"] << 10), daemon=True),
+        threading.Thread(target=report, args=(ring, cfg, args.log_dir, stop), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+    writer(ring, sys.stdout.fileno(), cfg["write_kib"] << 10, cfg["stall_s"])
+    stop.set()
+    threads[1].join()          # final stats row
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,9 +28,13 @@ read_config () {
 LOCAL_RECORDING_DIR=$(read_config recordingpi to_audio_dir)
 SEGMENT_TIME=$(read_config recordingpi segment_time)
 SAMPLE_RATE=$(read_config recordingpi sample_rate)
+WRITER=$(read_config recordingpi writer)
+CAPTURE_BUFFER=$(read_config recordingpi capture_buffer)
 
 SEGMENT_TIME=${SEGMENT_TIME:-3600}
 SAMPLE_RATE=${SAMPLE_RATE:-48000}
+WRITER=${WRITER:-ffmpeg}
+CAPTURE_BUFFER=${CAPTURE_BUFFER:-false}
 
 # ───────────────────────── 3.  Wait for USB‑HDD mount ───────────────────────────
 USB_MOUNT_DIR=$(dirname "$(readlink -f "$LOCAL_RECORDING_DIR")")  # /home/…/usb_hdd
@@ -54,20 +58,34 @@ FILENAME_PATTERN="${LOCAL_RECORDING_DIR}/auklab_%Y%m%dT%H%M%S.wav"
 
 export ALSA_PCM_DEBUG=0          # set to 1 if you want kernel ring‑buffer stats
 
-arecord -D hw:2,0           \
-        -f FLOAT_LE -c 8 -r "$SAMPLE_RATE" \
-        -t raw              \
-        -B 250000 -F 20000 -v |
-ffmpeg  -loglevel info \
-        -f f32le -ar "$SAMPLE_RATE" -ac 8 \
-        -use_wallclock_as_timestamps 1 -i pipe:0 \
-        -c:a pcm_f32le -rf64 always       \
-        -f segment -segment_time "$SEGMENT_TIME" \
-        -segment_atclocktime 1 -reset_timestamps 1 \
-        -segment_format wav -strftime 1 \
-        -write_bext 1        \
-        -metadata coding_history="ZoomF8Pro USB ${SAMPLE_RATE}Hz/8ch float via arecord pipe" \
-        -metadata comment="Ch1=BOND6; Ch2=FAR3; Ch3=TRI6; Ch4=TRI7C; Ch5=BOND1; Ch6=ROST2; Ch7=TRI2; Ch8=Bjorn1" \
-        "$FILENAME_PATTERN"
+ARECORD=(arecord -D hw:2,0
+         -f FLOAT_LE -c 8 -r "$SAMPLE_RATE"
+         -t raw
+         -B 250000 -F 20000 -v)
+
+if [[ "$WRITER" == "python" ]]; then
+  # segment_writer.py: sample-exact clock-aligned RF64+BEXT + timing sidecar
+  SEGMENTER=(python3 "$(dirname "$0")/segment_writer.py")
+else
+  SEGMENTER=(ffmpeg  -loglevel info
+             -f f32le -ar "$SAMPLE_RATE" -ac 8
+             -use_wallclock_as_timestamps 1 -i pipe:0
+             -c:a pcm_f32le -rf64 always
+             -f segment -segment_time "$SEGMENT_TIME"
+             -segment_atclocktime 1 -reset_timestamps 1
+             -segment_format wav -strftime 1
+             -write_bext 1
+             -metadata coding_history="ZoomF8Pro USB ${SAMPLE_RATE}Hz/8ch float via arecord pipe"
+             -metadata comment="Ch1=BOND6; Ch2=FAR3; Ch3=TRI6; Ch4=TRI7C; Ch5=BOND1; Ch6=ROST2; Ch7=TRI2; Ch8=Bjorn1"
+             "$FILENAME_PATTERN")
+fi
+
+# Optional RAM ring between arecord and the segmenter (occupancy/stall/drop
+# stats). Off by default: the pipe is then plain arecord | segmenter.
+if [[ "$CAPTURE_BUFFER" == "true" ]]; then
+  "${ARECORD[@]}" | python3 "$(dirname "$0")/capture_buffer.py" | "${SEGMENTER[@]}"
+else
+  "${ARECORD[@]}" | "${SEGMENTER[@]}"
+fi
 
 echo "🎙  Recording started — files will roll every ${SEGMENT_TIME}s."
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+segment_writer.py
+
+Optional replacement for ffmpeg's segment muxer in record_zoom.sh
+([recordingpi] writer = python). Reads raw interleaved f32le frames from
+stdin (the arecord pipe, or any generator for testing) and writes
+
+    <to_audio_dir>/auklab_%Y%m%dT%H%M%S.wav          RF64 + BEXT, float32
+    <to_audio_dir>/auklab_%Y%m%dT%H%M%S.timing.csv   clock sidecar
+
+Unlike `-f segment -segment_atclocktime 1 -use_wallclock_as_timestamps 1`:
+
+  * sample-exact segments: the first segment of a stream is placed on
+    CLOCK_REALTIME by the sample ↔ clock map below; after that the sample
+    clock is carried forward (next start = start + frames), so BEXT
+    time_references join without gaps or overlaps. A segment's length is
+    the number of samples until the next segment_time boundary, so
+    segments roll over close to the clock marks; if the carried time and
+    the clock map drift apart by more than resync_ms the next segment is
+    re-anchored on the map (logged; resync_ms = 0: never). BEXT and the
+    file name (local time, like ffmpeg's strftime pattern) therefore hold
+    the carried sample clock; the wall clock is in the sidecar, which
+    segment_timeline.py and estimate_sample_rate.py prefer when present
+  * the header is complete before the first sample: RF64 with ds64 sizes
+    for the planned length, BEXT (origination date/time, time_reference =
+    samples since UTC midnight), and a JUNK pad so the data starts on a
+    4 KiB boundary; the file is preallocated (posix_fallocate) to its final
+    size. A segment cut short (EOF, SIGTERM) is truncated and its ds64
+    rewritten (wav_header.repair)
+  * fixed buffering: samples go through one page-aligned buffer of
+    write_kib and are written in whole multiples of 4 KiB
+  * the sidecar logs, every second of audio,
+        sample, stream_sample, realtime_ns, monotonic_ns, map_ns
+    (sample index within the segment / since capture start, both clocks
+    when that sample arrived, and the clock map's estimate for it), so
+    drift and pipe latency can be corrected later; the map takes the
+    smallest (realtime − sample / rate) of the last minute, i.e. the least
+    delayed arrival
+  * files are created with O_EXCL: a name that already exists (e.g. a
+    stream fed faster than real time) gets a _1, _2 … suffix
+
+Usage:
+    arecord -D hw:2,0 -f FLOAT_LE -c 8 -r 48000 -t raw | python3 segment_writer.py
+    python3 segment_writer.py --out-dir /tmp/seg --segment-time 10 --resync-ms 0 < test.f32
+"""
+
+import os
+import sys
+import mmap
+import time
+import signal
+import struct
+import argparse
+import configparser
+from pathlib import Path
+from collections import deque
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import wav_header
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.ini"
+PAGE = 4096
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+def read_writer_config(config_path=CONFIG_PATH):
+    """Return the [recordingpi] + [segment_writer] settings as a dict (with defaults)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    sec = config["segment_writer"] if config.has_section("segment_writer") else {}
+    return {
+        "out_dir": config.get("recordingpi", "to_audio_dir", fallback="/media/recordingpi/usb_hdd/Audio"),
+        "segment_time": config.getint("recordingpi", "segment_time", fallback=600),
+        "sample_rate": config.getint("recordingpi", "sample_rate", fallback=48000),
+        "channels": int(sec.get("channels", 8)),
+        "write_kib": int(sec.get("write_kib", 1024)),
+        "read_ms": int(sec.get("read_ms", 100)),
+        "resync_ms": float(sec.get("resync_ms", 1000)),
+        "description": sec.get("description", ""),
+        "coding_history": sec.get("coding_history", ""),
+    }
+
+###############################################################################
+# HEADER
+###############################################################################
+
+def _chunk(cid, body):
+    return cid + struct.pack("<I", len(body)) + body + (b"\0" if len(body) & 1 else b"")
+
+
+def build_header(channels, sample_rate, frames, start_time, description="", coding_history="",
+                 originator="auklab segment_writer"):
+    """
+    RF64 header for 'frames' float32 frames starting at POSIX time
+    start_time, padded so the data begins on a PAGE boundary.
+    """
+    align = 4 * channels
+    data_size = frames * align
+    fmt = struct.pack("<HHIIHHH", wav_header.WAVE_FORMAT_IEEE_FLOAT, channels, sample_rate,
+                      sample_rate * align, align, 32, 0)
+    start = datetime.fromtimestamp(int(start_time), timezone.utc)
+    midnight = int(start_time) - (start.hour * 3600 + start.minute * 60 + start.second)
+    tref = int(round(start_time * sample_rate)) - midnight * sample_rate
+    bext = struct.pack("<256s32s32s10s8sQH64s190s",
+                       description.encode("ascii", "replace")[:256],
+                       originator.encode("ascii")[:32], b"",
+                       start.strftime("%Y-%m-%d").encode(), start.strftime("%H:%M:%S").encode(),
+                       tref, 1, b"", b"")
+    bext += coding_history.encode("ascii", "replace") + b"\r\n" if coding_history else b""
+    chunks = _chunk(b"fmt ", fmt) + _chunk(b"bext", bext)
+    head_len = 12 + 36 + len(chunks) + 8          # RF64/WAVE + ds64 + … + data header
+    pad = -(head_len + 8) % PAGE                  # JUNK header + body
+    total = head_len + 8 + pad + data_size
+    ds64 = _chunk(b"ds64", struct.pack("<QQQI", total - 8, data_size, frames, 0))
+    head = (b"RF64" + struct.pack("<I", wav_header.U32_MAX) + b"WAVE" + ds64 + chunks
+            + b"JUNK" + struct.pack("<I", pad) + b"\0" * pad
+            + b"data" + struct.pack("<I", wav_header.U32_MAX))
+    assert len(head) % PAGE == 0
+    return head
+
+###############################################################################
+# WRITER
+###############################################################################
+
+class ClockMap:
+    """Sample index ↔ CLOCK_REALTIME from read arrivals (least delayed of the last window)."""
+
+    def __init__(self, sample_rate, window_s=60):
+        self.sr = sample_rate
+        self.offsets = deque(maxlen=max(1, int(window_s * 10)))
+
+    def observe(self, sample, realtime_ns):
+        self.offsets.append(realtime_ns / 1e9 - sample / self.sr)
+
+    def time_of(self, sample):
+        return sample / self.sr + min(self.offsets)
+
+
+class Segment:
+    """One preallocated RF64 file, written through a page-aligned buffer."""
+
+    def __init__(self, path, header, frames, frame_bytes, buf):
+        self.path = path
+        self.frames = frames
+        self.frame_bytes = frame_bytes
+        self.written = 0                       # frames handed to write()
+        self.buf, self.fill = buf, 0
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.posix_fallocate(self.fd, 0, len(header) + frames * frame_bytes)
+        except (AttributeError, OSError):
+            pass                               # not supported here: plain growth
+        os.write(self.fd, header)
+
+    @property
+    def remaining(self):
+        return self.frames - self.written
+
+    def write(self, data):
+        """Append whole frames (bytes-like); full buffers go out in PAGE multiples."""
+        mv = memoryview(data)
+        self.written += len(mv) // self.frame_bytes
+        while len(mv):
+            n = min(len(mv), len(self.buf) - self.fill)
+            self.buf[self.fill:self.fill + n] = mv[:n]
+            self.fill += n
+            mv = mv[n:]
+            if self.fill == len(self.buf):
+                os.write(self.fd, self.buf)
+                self.fill = 0
+
+    def close(self):
+        """Flush, and if cut short truncate and fix the header sizes."""
+        if self.fill:
+            os.write(self.fd, memoryview(self.buf)[:self.fill])
+            self.fill = 0
+        short = self.written < self.frames
+        if short:
+            os.ftruncate(self.fd, os.lseek(self.fd, 0, os.SEEK_CUR))
+        os.close(self.fd)
+        if short:
+            wav_header.repair(self.path)
+        return short
+
+
+def segment_plan(t0, segment_time, sample_rate):
+    """Frames of a segment starting at POSIX time t0: up to the next segment_time mark."""
+    boundary = (int(t0 // segment_time) + 1) * segment_time
+    if boundary - t0 < 1.0:                    # just before a mark: take the next one
+        boundary += segment_time
+    return int(round((boundary - t0) * sample_rate))
+
+
+def open_segment(out_dir, t0, header, frames, frame_bytes, buf):
+    """
+    Segment + sidecar named after POSIX time t0 in local time, as
+    ffmpeg's segment muxer names them; _1, _2 … if that name is taken.
+    """
+    name = datetime.fromtimestamp(round(t0)).strftime("auklab_%Y%m%dT%H%M%S")
+    for n in range(1000):
+        stem = name if n == 0 else f"{name}_{n}"
+        try:
+            seg = Segment(str(out_dir / f"{stem}.wav"), header, frames, frame_bytes, buf)
+        except FileExistsError:
+            continue
+        sidecar = open(out_dir / f"{stem}.timing.csv", "w", encoding="utf-8")
+        sidecar.write("sample,stream_sample,realtime_ns,monotonic_ns,map_ns\n")
+        return seg, sidecar, stem
+    raise FileExistsError(f"{out_dir}/{name}.wav: no free name")
+
+
+def run(stream, cfg, out_dir, max_segments=0, log=print):
+    """Read frames from 'stream' until EOF (or max_segments closed). Returns segment paths."""
+    ch, sr = cfg["channels"], cfg["sample_rate"]
+    frame_bytes = 4 * ch
+    read_frames = max(1, sr * cfg["read_ms"] // 1000)
+    write_bytes = max(PAGE, cfg["write_kib"] * 1024 // PAGE * PAGE)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    wbuf = mmap.mmap(-1, write_bytes)          # page-aligned
+    rbuf = bytearray(read_frames * frame_bytes)
+    rview = memoryview(rbuf)
+    clock = ClockMap(sr)
+    seg, sidecar, done = None, None, []
+    stream_sample = 0
+    next_abs = None                            # carried start of the next segment, samples since the epoch
+    next_log = 0
+    carry = 0                                  # bytes of an incomplete frame at the start of rbuf
+
+    try:
+        while True:
+            got = stream.readinto(rview[carry:])
+            if not got:
+                break
+            rt, mono = time.clock_gettime_ns(time.CLOCK_REALTIME), time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+            have = carry + got
+            n = have // frame_bytes
+            carry = have - n * frame_bytes
+            clock.observe(stream_sample + n, rt)
+            pos = 0
+            while pos < n:
+                if seg is None:
+                    mapped = int(round(clock.time_of(stream_sample + pos) * sr))
+                    if (next_abs is not None and cfg["resync_ms"] > 0
+                            and abs(mapped - next_abs) > cfg["resync_ms"] * sr / 1000):
+                        log(f"sample clock {(next_abs - mapped) / sr:+.3f} s off the clock map: re-anchored")
+                        next_abs = None
+                    if next_abs is None:
+                        next_abs = mapped
+                    t0 = next_abs / sr
+                    frames = segment_plan(t0, cfg["segment_time"], sr)
+                    header = build_header(ch, sr, frames, t0, cfg["description"], cfg["coding_history"])
+                    seg, sidecar, name = open_segment(out_dir, t0, header, frames, frame_bytes, wbuf)
+                    seg.first_sample = stream_sample + pos
+                    next_abs += frames
+                    log(f"{name}.wav: {frames} frames ({frames / sr:.3f} s)")
+                take = min(n - pos, seg.remaining)
+                seg.write(rview[pos * frame_bytes:(pos + take) * frame_bytes])
+                pos += take
+                if seg.remaining == 0:
+                    seg.close()
+                    sidecar.close()
+                    done.append(seg.path)
+                    seg = None
+                    if max_segments and len(done) >= max_segments:
+                        return done
+            stream_sample += n
+            if seg is not None and stream_sample >= next_log:
+                sidecar.write(f"{stream_sample - seg.first_sample},{stream_sample},{rt},{mono},"
+                              f"{int(clock.time_of(stream_sample) * 1e9)}\n")
+                next_log = (stream_sample // sr + 1) * sr
+            if carry:
+                rbuf[:carry] = rbuf[n * frame_bytes:n * frame_bytes + carry]
+    finally:
+        if seg is not None:
+            short = seg.close()
+            sidecar.close()
+            done.append(seg.path)
+            log(f"{os.path.basename(seg.path)}: stopped after {seg.written} of {seg.frames} frames"
+                + (", header fixed" if short else ""))
+        wbuf.close()
+    return done
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Clock-aligned RF64+BEXT segmenter for raw f32le on stdin.")
+    parser.add_argument("--out-dir", help="default: [recordingpi] to_audio_dir")
+    parser.add_argument("--channels", type=int, help="default: [segment_writer] channels")
+    parser.add_argument("--sample-rate", type=int, help="default: [recordingpi] sample_rate")
+    parser.add_argument("--segment-time", type=int, help="seconds, default: [recordingpi] segment_time")
+    parser.add_argument("--max-segments", type=int, default=0, help="exit after N complete segments")
+    parser.add_argument("--resync-ms", type=float, help="default: [segment_writer] resync_ms (0 = never, e.g. for files)")
+    args = parser.parse_args()
+
+    cfg = read_writer_config()
+    for key in ("channels", "sample_rate", "segment_time"):
+        if getattr(args, key):
+            cfg[key] = getattr(args, key)
+    if args.resync_ms is not None:
+        cfg["resync_ms"] = args.resync_ms
+
+    # systemd stops the service with SIGTERM: finish the open segment cleanly
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    done = run(sys.stdin.buffer.raw if hasattr(sys.stdin.buffer, "raw") else sys.stdin.buffer, cfg,
+               args.out_dir or cfg["out_dir"], args.max_segments, log=lambda m: print(m, flush=True))
+    print(f"Wrote {len(done)} segments", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,16 @@ import argparse
 import logging
 import psutil
 import subprocess
+import sys
 import time
 import re
 import os
 import csv
 from datetime import datetime
 import getpass
-import shlex
+import json
+import configparser
+import health_alerts
 
 # --- NEW helper -----------------------------------------
 def get_chrony_stats():
@@ -96,6 +99,33 @@ def get_network_traffic(interface="eth0"):
     except Exception:
         return None, None
 
+def get_network_rates(interface, state):
+    """
+    --loop mode: kB/s since the previous sample, from the counters kept in
+    state (no 1 s sleep); None on the first sample.
+    """
+    try:
+        curr = psutil.net_io_counters(pernic=True).get(interface)
+    except Exception:
+        return None, None
+    now = time.monotonic()
+    prev = state.get("net")
+    state["net"] = (now, curr)
+    if not curr or not prev or not prev[1] or now <= prev[0]:
+        return None, None
+    dt = now - prev[0]
+    return ((curr.bytes_sent - prev[1].bytes_sent) / 1024.0 / dt,
+            (curr.bytes_recv - prev[1].bytes_recv) / 1024.0 / dt)
+
+def cached_probe(state, key, every, probe):
+    """Result of probe(), re-run at most every 'every' seconds (subprocess probes in --loop mode)."""
+    now = time.monotonic()
+    hit = state.get(key)
+    if hit is None or now - hit[0] >= every:
+        hit = (now, probe())
+        state[key] = hit
+    return hit[1]
+
 def get_disk_usage(path="/"):
     du = psutil.disk_usage(path)
     return du.percent, du.free / (1024**3)
@@ -143,30 +173,221 @@ def check_zoom_hw2():
     except:
         return False
 
-def main():
-    parser = argparse.ArgumentParser(description="Raspberry Pi health snapshot for cron.")
-    parser.add_argument("--interface", type=str, default="eth0", help="Network interface (default: eth0)")
-    parser.add_argument("--mount-check", nargs="*", default=[], help="Mount paths to check")
-    args = parser.parse_args()
+# --- Capture ring buffer (recording-pi/capture_buffer.py) ---
+CAPTURE_HEADER = ["capture_hwm_pct", "capture_stalls", "capture_max_stall_s", "capture_dropped_frames"]
 
-    user = getpass.getuser()
-    today = datetime.now().strftime("%Y-%m-%d")
-    log_dir = pathlib.Path(f"/home/{user}/logs/rpi_health_snapshot")
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_path = log_dir / f"{today}_rpi_health.csv"
 
+def get_capture_buffer_stats(status_path, max_age=60):
+    """
+    High-water mark (%), stalls, longest stall (s) and dropped frames over
+    the shim's status window, from its status.json. None if the shim never
+    ran on this Pi; a list of None if its status is stale (not running).
+    """
+    try:
+        with open(status_path) as f:
+            st = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        return [None] * len(CAPTURE_HEADER)
+    if time.time() - st.get("updated", 0) > max_age:
+        return [None] * len(CAPTURE_HEADER)
+    return [st.get("hwm_pct"), st.get("stalls"), st.get("max_stall_s"), st.get("dropped_frames")]
+
+# --- Per-process accounting -----------------------------
+DEFAULT_PROCESS_NAMES = ["ffmpeg", "arecord", "rsync", "sshfs"]
+
+PROC_HEADER = [
+    "timestamp", "process", "n_procs", "restarts", "interval_s",
+    "cpu_user_s", "cpu_system_s", "cpu_percent",
+    "rss_mb", "io_read_mb", "io_write_mb",
+    "ctx_voluntary", "ctx_involuntary",
+]
+
+
+def read_process_names(config):
+    """
+    Process names to account for, from [health] process_names in config.ini
+    (comma separated). Falls back to DEFAULT_PROCESS_NAMES.
+    """
+    raw = config.get("health", "process_names", fallback="")
+    names = [n.strip() for n in raw.split(",") if n.strip()]
+    return names or DEFAULT_PROCESS_NAMES
+
+
+def read_proc_io(pid):
+    """
+    Return (read_bytes, write_bytes) from /proc/<pid>/io, or (None, None)
+    if the file is missing or not readable (other user's process).
+    """
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def sample_processes(names):
+    """
+    Cumulative counters for every running process whose name (or argv[0]
+    basename) is in 'names'.
+
+    Returns {name: {"<pid>:<create_time>": {counter: value, ...}}}.
+    The pid+create_time key survives pid reuse, so a restarted ffmpeg shows
+    up as a new key.
+    """
+    wanted = set(names)
+    snap = {n: {} for n in names}
+    attrs = ["pid", "name", "cmdline", "create_time",
+             "cpu_times", "memory_info", "num_ctx_switches"]
+    for proc in psutil.process_iter(attrs):
+        info = proc.info
+        cmd = info.get("cmdline") or []
+        argv0 = os.path.basename(cmd[0]) if cmd else None
+        name = info.get("name")
+        match = name if name in wanted else argv0 if argv0 in wanted else None
+        if match is None or info.get("cpu_times") is None:
+            continue
+        read_b, write_b = read_proc_io(info["pid"])
+        ctx = info.get("num_ctx_switches")
+        mem = info.get("memory_info")
+        key = f"{info['pid']}:{info['create_time']:.2f}"
+        snap[match][key] = {
+            "cpu_user": info["cpu_times"].user,
+            "cpu_system": info["cpu_times"].system,
+            "rss": mem.rss if mem else 0,
+            "io_read": read_b,
+            "io_write": write_b,
+            "ctx_vol": ctx.voluntary if ctx else 0,
+            "ctx_invol": ctx.involuntary if ctx else 0,
+        }
+    return snap
+
+
+def process_rows(prev, curr, interval, now):
+    """
+    Turn two cumulative snapshots into one CSV row per process name.
+
+    Counters of processes already present in 'prev' are differenced;
+    processes that appeared since then contribute their full counters
+    (they started inside the interval) and count as a restart.
+    On the very first run (no 'prev') nothing is counted as a restart
+    and interval-based columns are left empty.
+    """
+    rows = []
+    for name, procs in curr.items():
+        old = prev.get(name, {}) if prev is not None else {}
+        totals = dict.fromkeys(["cpu_user", "cpu_system", "io_read",
+                                "io_write", "ctx_vol", "ctx_invol"], 0)
+        io_known = True
+        restarts = 0
+        for key, c in procs.items():
+            p = old.get(key)
+            if p is None and prev is not None and name in prev:
+                restarts += 1
+            for field in totals:
+                cur_v = c[field]
+                if cur_v is None:
+                    io_known = False
+                    continue
+                base = p[field] if p is not None and p[field] is not None else 0
+                totals[field] += max(cur_v - base, 0)
+
+        rss_mb = sum(c["rss"] for c in procs.values()) / (1024**2)
+        if prev is None or not interval:
+            cpu_pct = None
+            deltas = [None] * 6
+        else:
+            cpu_s = totals["cpu_user"] + totals["cpu_system"]
+            cpu_pct = round(100.0 * cpu_s / interval, 2)
+            deltas = [
+                round(totals["cpu_user"], 2), round(totals["cpu_system"], 2),
+                round(totals["io_read"] / (1024**2), 2) if io_known else None,
+                round(totals["io_write"] / (1024**2), 2) if io_known else None,
+                totals["ctx_vol"], totals["ctx_invol"],
+            ]
+        cpu_u, cpu_sy, io_r, io_w, ctx_v, ctx_i = deltas
+        rows.append([now, name, len(procs), restarts,
+                     round(interval, 1) if interval else None,
+                     cpu_u, cpu_sy, cpu_pct, round(rss_mb, 1),
+                     io_r, io_w, ctx_v, ctx_i])
+    return rows
+
+
+def log_process_accounting(log_dir, names, now, today):
+    """
+    Sample the configured processes, diff against the state saved by the
+    previous cron run and append the per-process rows to
+    <date>_rpi_procs.csv next to the health CSV.
+    """
+    state_path = log_dir / ".proc_state.json"
+    prev, prev_t = None, None
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        prev, prev_t = state["procs"], state["time"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    t = time.time()
+    curr = sample_processes(names)
+    interval = (t - prev_t) if prev_t else None
+    rows = process_rows(prev, curr, interval, now)
+
+    tmp = state_path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"time": t, "procs": curr}, f)
+    os.replace(tmp, state_path)
+
+    proc_path = log_dir / f"{today}_rpi_procs.csv"
+    write_header = not os.path.exists(proc_path)
+    with open(proc_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(PROC_HEADER)
+        writer.writerows(rows)
+# ----------------------------------------------------------
+
+
+# Column types for the binary log; anything not listed is stored as float64.
+BINLOG_TYPES = {"timestamp": "s20", "chrony_src": "s16",
+                "throttled_flags": "i8", "root_readonly": "u1", "zoom_hw2_ok": "u1"}
+
+
+def binlog_types(header):
+    """Pin every column so the schema does not depend on which values are None."""
+    types = {c: "f8" for c in header}
+    types.update({c: "u1" for c in header if c.startswith("mount_ok_")})
+    types.update({c: t for c, t in BINLOG_TYPES.items() if c in types})
+    return types
+
+
+def take_snapshot(args, state=None):
+    """
+    Collect one sample; return (header, row). With a state dict (--loop)
+    network rates come from the previous sample and the vcgencmd /
+    arecord / chronyc probes are re-run only every --probe-every seconds.
+    """
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if state is None:
+        probe = lambda key, fn: fn()
+    else:
+        probe = lambda key, fn: cached_probe(state, key, args.probe_every, fn)
 
     cpu = get_cpu_usage()
     mem_percent, mem_used, mem_available = get_memory_usage()
-    temp = get_temperature()
-    volts = get_voltage()
-    sent_kbps, recv_kbps = get_network_traffic(args.interface)
+    temp = probe("temp", get_temperature)
+    volts = probe("volts", get_voltage)
+    if state is None:
+        sent_kbps, recv_kbps = get_network_traffic(args.interface)
+    else:
+        sent_kbps, recv_kbps = get_network_rates(args.interface, state)
     disk_percent, disk_free = get_disk_usage()
     cpu_freq = get_cpu_freq()
-    throttled = get_throttled_flags()
+    throttled = probe("throttled", get_throttled_flags)
     root_ro = is_root_fs_readonly()
-    zoom_hw2_ok = check_zoom_hw2()  # new
+    zoom_hw2_ok = probe("zoom", check_zoom_hw2)  # new
 
 
     mount_statuses = [check_mount(m) for m in args.mount_check]
@@ -193,19 +414,144 @@ def main():
         zoom_hw2_ok  # new
     ] + mount_statuses
 
-    chrony_src, chrony_last, chrony_rms, chrony_skew = get_chrony_stats()
+    chrony_src, chrony_last, chrony_rms, chrony_skew = probe("chrony", get_chrony_stats)
 
     header += ["chrony_src", "chrony_last_offset_s",
                "chrony_rms_offset_s", "chrony_freq_skew_ppm"]
     row    += [chrony_src, chrony_last, chrony_rms, chrony_skew]
 
+    # always present (empty while the relay is off) so the day's CSV keeps one schema
+    capture = get_capture_buffer_stats(f"/home/{getpass.getuser()}/logs/capture_buffer/status.json")
+    header += CAPTURE_HEADER
+    row    += capture if capture is not None else [None] * len(CAPTURE_HEADER)
+    return header, row
+
+
+def write_csv_row(log_path, header, row):
     write_header = not os.path.exists(log_path)
+    if not write_header:
+        with open(log_path, newline="") as f:
+            old_header = next(csv.reader(f), [])
+        if old_header != header:
+            # columns changed during the day (upgrade, mount list): rewrite
+            # the file under the union of both headers
+            with open(log_path, newline="") as f:
+                old_rows = list(csv.DictReader(f))
+            header_all = header + [c for c in old_header if c not in header]
+            row = dict(zip(header, row))
+            tmp = f"{log_path}.tmp"
+            with open(tmp, "w", newline="") as f:
+                writer = csv.DictWriter(f, header_all, restval="", extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(old_rows)
+                writer.writerow(row)
+            os.replace(tmp, log_path)
+            return
     with open(log_path, "a", newline="") as f:
         writer = csv.writer(f)
         if write_header:
             writer.writerow(header)
         writer.writerow(row)
 
+
+def run_loop(args, log_dir, config):
+    """
+    High-rate mode: sample every --loop seconds into the binary log,
+    flushing one compressed block every --flush-every samples. Alert
+    state stays in memory and is saved on flush; process accounting
+    keeps its own 10-minute cadence. No probe sleeps or forks every
+    sample (see take_snapshot), so 1 Hz is reachable.
+    """
+    import signal
+    import binlog
+
+    stop = []
+    signal.signal(signal.SIGTERM, lambda *_: stop.append(True))
+    alert_path = log_dir / ".alert_state.json"
+    alert_state = health_alerts.load_state(alert_path)
+    writer, writer_day = None, None
+    probes = {}
+    last_procs = 0.0
+    n = 0
+    try:
+        while not stop:
+            t0 = time.monotonic()
+            today = datetime.now().strftime("%Y-%m-%d")
+            if today != writer_day:
+                if writer:
+                    writer.flush()
+                writer, writer_day = binlog.BinLogWriter(log_dir, f"{today}_rpi_health"), today
+
+            header, row = take_snapshot(args, probes)
+            writer.append(header, row, binlog_types(header))
+            try:
+                health_alerts.evaluate_state(dict(zip(header, row)), config, alert_state)
+            except Exception as e:     # a bad alert rule must not stop the sampling
+                print(f"health alerts failed: {e}", file=sys.stderr)
+            n += 1
+            if n % args.flush_every == 0:
+                writer.flush()
+                health_alerts.save_state(alert_state, alert_path)
+
+            if not args.no_procs and time.time() - last_procs >= args.procs_every:
+                log_process_accounting(log_dir, read_process_names(config), row[0], today)
+                last_procs = time.time()
+
+            time.sleep(max(0.0, args.loop - (time.monotonic() - t0)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer:
+            writer.flush()
+        health_alerts.save_state(alert_state, alert_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raspberry Pi health snapshot for cron.")
+    parser.add_argument("--interface", type=str, default="eth0", help="Network interface (default: eth0)")
+    parser.add_argument("--mount-check", nargs="*", default=[], help="Mount paths to check")
+    parser.add_argument("--no-procs", action="store_true", help="Skip per-process accounting")
+    parser.add_argument("--format", choices=["csv", "bin"], default="csv",
+                        help="Log format: text CSV or compressed binary log (see binlog.py)")
+    parser.add_argument("--loop", type=float, default=None,
+                        help="Keep running and sample every LOOP seconds (implies --format bin)")
+    parser.add_argument("--flush-every", type=int, default=60,
+                        help="Samples per compressed block in --loop mode (default: 60)")
+    parser.add_argument("--procs-every", type=float, default=600,
+                        help="Seconds between process-accounting rows in --loop mode (default: 600)")
+    parser.add_argument("--probe-every", type=float, default=10,
+                        help="Seconds between vcgencmd/arecord/chronyc probes in --loop mode (default: 10)")
+    args = parser.parse_args()
+
+    user = getpass.getuser()
+    today = datetime.now().strftime("%Y-%m-%d")
+    log_dir = pathlib.Path(f"/home/{user}/logs/rpi_health_snapshot")
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    script_dir = pathlib.Path(__file__).resolve().parent
+    config = configparser.ConfigParser()
+    config.read(script_dir / "config.ini")
+
+    if args.loop:
+        run_loop(args, log_dir, config)
+        return
+
+    header, row = take_snapshot(args)
+    if args.format == "bin":
+        import binlog
+        writer = binlog.BinLogWriter(log_dir, f"{today}_rpi_health")
+        writer.append(header, row, binlog_types(header))
+        writer.flush()
+    else:
+        write_csv_row(log_dir / f"{today}_rpi_health.csv", header, row)
+
+    try:
+        health_alerts.evaluate(dict(zip(header, row)), config, log_dir / ".alert_state.json")
+    except Exception as e:             # a bad alert rule must not cost the process accounting
+        print(f"health alerts failed: {e}", file=sys.stderr)
+
+    if not args.no_procs:
+        log_process_accounting(log_dir, read_process_names(config), row[0], today)
+
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+segment_timeline.py
+
+Sample-accurate continuity check across recorded segments.
+
+Builds a timeline of segments (any number of days, both naming schemes)
+from four independent sources, best first:
+
+  sidecar  wall clock of the first sample, from the .timing.csv that
+           recording-pi/segment_writer.py writes next to a segment
+           (clock map, ~ms; resolution taken as 100 ms)
+  timeref  BEXT origination_date midnight + time_reference (exact samples)
+  bext     BEXT origination_date + origination_time       (1 s resolution)
+  name     timestamp in the file name                      (1 s resolution)
+             auklab_20250601T101000.wav                    (current)
+             auklab_zoom_f8_pro_20250601_101000_0022.wav   (legacy)
+
+plus the frame count actually on disk (wav_header.read_header), and compares
+each segment's end with the next segment's start, in samples:
+
+  gap      next start − this end  > resolution   (audio missing)
+  overlap  next start − this end  < −resolution  (audio duplicated)
+  ok       within the timestamp resolution
+
+'drift' is the running sum of join errors inside a session (reset after a
+gap longer than --session-break). It telescopes to
+  start[k] − start[0] − Σ frames
+so timestamp jitter does not accumulate: after a day it is the number of
+samples the recording has lost (+) or gained (−) against the wall clock.
+
+segment_writer carries its sample clock from one segment to the next, so
+its time_reference, origination time and name show no drift (only an
+occasional re-anchor step); 'carried' marks such segments, and the
+sidecar is used whenever it exists so drift stays visible.
+
+All arithmetic is vectorised with numpy; only the header reads are per file.
+
+Usage:
+    python3 segment_timeline.py /media/nas/Audio/2025-06-0*       # print problems
+    python3 segment_timeline.py /media/nas/Audio --csv joins.csv --all
+"""
+
+import os
+import re
+import csv
+import sys
+import argparse
+import calendar
+from datetime import datetime
+
+import numpy as np
+
+import wav_header
+
+# auklab_20250601T101000.wav
+NAME_RE = re.compile(r"(\d{8})T(\d{6})")
+# auklab_zoom_f8_pro_20250601_101000_0022.wav
+LEGACY_NAME_RE = re.compile(r"(\d{8})_(\d{6})(?:_\d+)?\.wav$", re.IGNORECASE)
+
+# codes as stored in catalog.time_source; 'sidecar' came last
+SOURCES = ("timeref", "bext", "name", "sidecar")
+SIDECAR_SUFFIX = ".timing.csv"
+SIDECAR_RESOLUTION_S = 0.1
+WRITER_ORIGINATOR = "auklab segment_writer"
+
+###############################################################################
+# TIMESTAMPS
+###############################################################################
+
+def _epoch(date_s, time_s="000000"):
+    """'YYYYMMDD', 'HHMMSS' → POSIX seconds (naive times are taken as UTC)."""
+    try:
+        dt = datetime.strptime(date_s + time_s, "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+    return calendar.timegm(dt.timetuple())
+
+
+def parse_name_time(path):
+    """Start time from the file name (both schemes), or None."""
+    name = os.path.basename(path)
+    m = NAME_RE.search(name) or LEGACY_NAME_RE.search(name)
+    return _epoch(m.group(1), m.group(2)) if m else None
+
+
+def _digits(s):
+    return re.sub(r"\D", "", s or "")
+
+
+def parse_bext_time(bext, sample_rate):
+    """
+    Return (start_sample, origination_epoch) from a BEXT dict.
+
+    start_sample is midnight(origination_date)·sr + time_reference, or None
+    if the writer left time_reference at 0; EBU 3285 allows any separator in
+    the date/time fields, so only the digits are used.
+    """
+    if not bext:
+        return None, None
+    date_s, time_s = _digits(bext.get("origination_date")), _digits(bext.get("origination_time"))
+    if len(date_s) != 8:
+        return None, None
+    midnight = _epoch(date_s)
+    if midnight is None:
+        return None, None
+    orig = _epoch(date_s, time_s) if len(time_s) == 6 else None
+    tref = bext.get("time_reference") or 0
+    start = midnight * sample_rate + tref if tref > 0 and sample_rate else None
+    return start, orig
+
+
+def sidecar_path(path):
+    """segment_writer's timing sidecar for a segment (.wav or archived)."""
+    if path.endswith(wav_header.ARCHIVE_SUFFIX):
+        path = path[:-len(wav_header.ARCHIVE_SUFFIX)]
+    return os.path.splitext(path)[0] + SIDECAR_SUFFIX
+
+
+def read_sidecar(path):
+    """
+    The segment's sidecar as {column: int64 array} (sample, stream_sample,
+    realtime_ns, monotonic_ns[, map_ns]), or None if it is missing/empty.
+    """
+    sc = sidecar_path(path)
+    try:
+        with open(sc, encoding="utf-8") as f:
+            names = f.readline().strip().split(",")
+            rows = np.loadtxt(f, delimiter=",", dtype=np.int64, ndmin=2)
+    except (OSError, ValueError):
+        return None
+    if rows.shape[0] == 0 or rows.shape[1] != len(names) or "realtime_ns" not in names:
+        return None
+    return {name: rows[:, i] for i, name in enumerate(names)}
+
+
+def sidecar_start(sidecar, sample_rate):
+    """Wall-clock start (samples since the epoch) of the segment's first sample."""
+    ns = sidecar["map_ns"] if "map_ns" in sidecar else sidecar["realtime_ns"]
+    return int(ns[0]) * sample_rate // 10**9 - int(sidecar["sample"][0])
+
+###############################################################################
+# TIMELINE
+###############################################################################
+
+def build_timeline(paths, default_rate=48000):
+    """
+    Read headers of all WAVs under *paths* and return a dict of arrays,
+    sorted by start sample:
+
+      path, frames, sample_rate, name_time, bext_time (POSIX s, NaN if absent),
+      start (samples since the epoch, from the best source), source,
+      resolution (samples), carried (BEXT/name from segment_writer's
+      carried sample clock)
+    """
+    rows = []
+    for path in wav_header.iter_wavs(paths):
+        try:
+            hdr = wav_header.read_header(path)
+        except OSError as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            continue
+        sr = hdr.get("sample_rate") or default_rate
+        frames = hdr.get("frames_on_disk") or 0
+        name_t = parse_name_time(path)
+        tref_start, bext_t = parse_bext_time(hdr.get("bext"), sr)
+        carried = (hdr.get("bext") or {}).get("originator") == WRITER_ORIGINATOR
+        sidecar = read_sidecar(path)
+        if sidecar is not None:
+            start, source, res = sidecar_start(sidecar, sr), 3, int(sr * SIDECAR_RESOLUTION_S)
+        elif tref_start is not None:
+            start, source, res = tref_start, 0, 0
+        elif bext_t is not None:
+            start, source, res = bext_t * sr, 1, sr
+        elif name_t is not None:
+            start, source, res = name_t * sr, 2, sr
+        else:
+            print(f"{path}: no timestamp in name or BEXT; skipped", file=sys.stderr)
+            continue
+        rows.append((path, frames, sr, np.nan if name_t is None else name_t,
+                     np.nan if bext_t is None else bext_t, start, source, res, carried))
+
+    n = len(rows)
+    tl = {
+        "path": np.array([r[0] for r in rows], dtype=object),
+        "frames": np.fromiter((r[1] for r in rows), dtype=np.int64, count=n),
+        "sample_rate": np.fromiter((r[2] for r in rows), dtype=np.int64, count=n),
+        "name_time": np.fromiter((r[3] for r in rows), dtype=np.float64, count=n),
+        "bext_time": np.fromiter((r[4] for r in rows), dtype=np.float64, count=n),
+        "start": np.fromiter((r[5] for r in rows), dtype=np.int64, count=n),
+        "source": np.fromiter((r[6] for r in rows), dtype=np.int8, count=n),
+        "resolution": np.fromiter((r[7] for r in rows), dtype=np.int64, count=n),
+        "carried": np.fromiter((r[8] for r in rows), dtype=bool, count=n),
+    }
+    order = np.argsort(tl["start"], kind="stable")
+    return {k: v[order] for k, v in tl.items()}
+
+
+def analyse_joins(tl, tolerance=None, session_break=60.0):
+    """
+    Compare consecutive segments. Returns a dict of arrays, one entry per
+    join (len = segments − 1):
+
+      gap        next start − this end, samples (+ gap, − overlap)
+      status     'ok' | 'gap' | 'overlap'
+      drift      running Σ gap within the session, samples
+      session    session number (new session after a gap > session_break s)
+
+    tolerance (samples) defaults to the coarser timestamp resolution of the
+    two segments, so 1 s-resolution names don't raise false alarms.
+    """
+    start, frames, sr = tl["start"], tl["frames"], tl["sample_rate"]
+    if len(start) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return {"gap": empty, "status": np.zeros(0, dtype="<U7"),
+                "drift": empty, "session": empty}
+
+    gap = start[1:] - (start[:-1] + frames[:-1])
+    if tolerance is None:
+        tol = np.maximum(tl["resolution"][1:], tl["resolution"][:-1])
+    else:
+        tol = np.full(len(gap), int(tolerance), dtype=np.int64)
+
+    status = np.full(len(gap), "ok", dtype="<U7")
+    status[gap > tol] = "gap"
+    status[gap < -tol] = "overlap"
+
+    # Session breaks: real outages (recorder restarted), not jitter.
+    is_break = gap > session_break * sr[1:]
+    session = np.cumsum(is_break)
+    within = np.where(is_break, 0, gap)
+    csum = np.cumsum(within)
+    # Subtract the running total at the start of each session.
+    base = np.zeros(session[-1] + 1, dtype=np.int64)
+    first = np.flatnonzero(np.concatenate(([True], session[1:] != session[:-1])))
+    base[session[first]] = csum[first] - within[first]
+    drift = csum - base[session]
+    return {"gap": gap, "status": status, "drift": drift, "session": session}
+
+
+def session_summary(tl, joins):
+    """Per session: first/last file, segments, span (s), drift (samples, ppm)."""
+    out = []
+    if len(tl["start"]) == 0:
+        return out
+    seg_session = np.concatenate(([0], joins["session"])) if len(joins["session"]) else np.zeros(1, int)
+    for s in np.unique(seg_session):
+        idx = np.flatnonzero(seg_session == s)
+        i0, i1 = idx[0], idx[-1]
+        sr = int(tl["sample_rate"][i0])
+        span = (tl["start"][i1] + tl["frames"][i1] - tl["start"][i0]) / sr
+        j = idx[1:] - 1                      # joins inside this session
+        drift = int(joins["drift"][j[-1]]) if len(j) else 0
+        elapsed = (tl["start"][i1] - tl["start"][i0]) / sr
+        out.append({
+            "session": int(s),
+            "first": tl["path"][i0],
+            "last": tl["path"][i1],
+            "segments": len(idx),
+            "span_s": span,
+            "drift_samples": drift,
+            "drift_ppm": drift / (elapsed * sr) * 1e6 if elapsed > 0 else 0.0,
+            "gaps": int(np.sum(joins["status"][j] == "gap")) if len(j) else 0,
+            "overlaps": int(np.sum(joins["status"][j] == "overlap")) if len(j) else 0,
+        })
+    return out
+
+
+def join_rows(tl, joins, all_rows=False):
+    """Yield one dict per join (problems only unless all_rows)."""
+    for i in range(len(joins["gap"])):
+        if not all_rows and joins["status"][i] == "ok":
+            continue
+        sr = int(tl["sample_rate"][i])
+        yield {
+            "prev": tl["path"][i],
+            "next": tl["path"][i + 1],
+            "status": joins["status"][i],
+            "gap_samples": int(joins["gap"][i]),
+            "gap_s": joins["gap"][i] / sr,
+            "drift_samples": int(joins["drift"][i]),
+            "source": SOURCES[tl["source"][i + int(tl["resolution"][i + 1] > tl["resolution"][i])]],
+            "session": int(joins["session"][i]),
+        }
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Gap/overlap/drift check across WAV segments.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories (recursive)")
+    parser.add_argument("--tolerance", type=int, default=None,
+                        help="allowed |gap| in samples (default: timestamp resolution)")
+    parser.add_argument("--session-break", type=float, default=60.0,
+                        help="gap (s) that starts a new session (default: 60)")
+    parser.add_argument("--csv", help="write joins to this CSV")
+    parser.add_argument("--all", action="store_true", help="include ok joins in output")
+    args = parser.parse_args()
+
+    tl = build_timeline(args.paths)
+    if len(tl["start"]) == 0:
+        print("No timestamped .wav files found.")
+        return 1
+    joins = analyse_joins(tl, args.tolerance, args.session_break)
+    rows = list(join_rows(tl, joins, args.all))
+
+    for r in rows:
+        print(f"{r['status']:8s} {r['gap_samples']:+12d} samples ({r['gap_s']:+.3f} s) "
+              f"[{r['source']}]  {os.path.basename(r['prev'])} → {os.path.basename(r['next'])}")
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["prev", "next", "status", "gap_samples",
+                                                   "gap_s", "drift_samples", "source", "session"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print()
+    for s in session_summary(tl, joins):
+        print(f"session {s['session']}: {s['segments']} segments, {s['span_s'] / 3600:.2f} h, "
+              f"{s['gaps']} gaps, {s['overlaps']} overlaps, drift {s['drift_samples']:+d} samples "
+              f"({s['drift_ppm']:+.1f} ppm)  {os.path.basename(s['first'])} … "
+              f"{os.path.basename(s['last'])}")
+    bad = int(np.sum(joins["status"] != "ok"))
+    print(f"{len(tl['start'])} segments, {len(joins['gap'])} joins, {bad} with gaps/overlaps.")
+    return 0 if not bad else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
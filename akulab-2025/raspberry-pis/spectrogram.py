@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+spectrogram.py
+
+Streaming STFT spectrograms of recorded segments with bounded memory.
+
+Audio is read block by block (audio_blocks.iter_blocks); each block is
+joined with the unconsumed tail of the previous one, cut into Hann-windowed
+frames of --nfft every --hop samples and transformed for all channels at
+once. Power is averaged over --time-decim frames and --freq-decim adjacent
+bins before converting to dB, so a 10-min 8-ch segment becomes a few MB of
+float16 instead of 1.4 GB of samples. Peak RAM is one block plus its frames.
+
+Output per segment (in --out-dir, default next to the WAV):
+    <name>_spec.npz          db (channels, freqs, times) float16, freqs, times, params
+    <name>_spectrogram.png   optional (--png), one row per channel
+
+Batch mode runs files on a process pool and skips segments whose outputs
+are newer than the WAV and were made with the same parameters.
+
+Usage:
+    python3 spectrogram.py /media/nas/Audio/2025-06-01 --workers 3 --png
+    python3 spectrogram.py seg.wav --nfft 2048 --hop 1024 --out-dir /tmp/spec
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import wav_header
+from audio_blocks import BLOCK_FRAMES, iter_blocks
+
+DEFAULT_PARAMS = {"nfft": 1024, "hop": 512, "time_decim": 8, "freq_decim": 4}
+
+###############################################################################
+# STFT ENGINE
+###############################################################################
+
+def stft_power(path, nfft=1024, hop=512, hdr=None, block_frames=BLOCK_FRAMES):
+    """
+    Yield power spectra (frames, channels, nfft//2 + 1) float64, block by
+    block, for frames starting at 0, hop, 2·hop, … of the whole file.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    window = np.hanning(nfft).astype(np.float32)
+    tail = np.zeros((0, hdr["channels"]), dtype=np.float32)
+    skip = 0                                   # frames between frames not yet read (hop > nfft)
+    for block in iter_blocks(path, hdr, block_frames=block_frames):
+        if skip >= len(block):
+            skip -= len(block)
+            continue
+        buf = np.concatenate((tail, block[skip:]))
+        skip = 0
+        if len(buf) < nfft:
+            tail = buf
+            continue
+        n = (len(buf) - nfft) // hop + 1
+        # (frames, channels, nfft) strided view, no copy until the window multiply
+        frames = np.lib.stride_tricks.sliding_window_view(buf, nfft, axis=0)[:n * hop:hop]
+        spec = np.fft.rfft(frames * window, axis=-1)
+        yield spec.real**2 + spec.imag**2
+        skip = max(0, n * hop - len(buf))
+        tail = buf[n * hop:]
+
+
+def spectrogram(path, nfft=1024, hop=512, time_decim=8, freq_decim=4, hdr=None):
+    """
+    Return dict(db, freqs, times, sample_rate) with db shaped
+    (channels, freqs, times), time- and frequency-decimated.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    sr = hdr["sample_rate"]
+    nbins = (nfft // 2 + 1) // freq_decim * freq_decim
+    cols = []
+    carry = None
+    for power in stft_power(path, nfft, hop, hdr):
+        if carry is not None:
+            power = np.concatenate((carry, power))
+        n = len(power) // time_decim * time_decim
+        if n:
+            p = power[:n, :, :nbins]
+            p = p.reshape(n // time_decim, time_decim, p.shape[1], nbins // freq_decim, freq_decim)
+            cols.append(p.mean(axis=(1, 4)).astype(np.float32))
+        carry = power[n:]
+    if carry is not None and len(carry):
+        p = carry[:, :, :nbins]
+        p = p.reshape(1, len(carry), p.shape[1], nbins // freq_decim, freq_decim)
+        cols.append(p.mean(axis=(1, 4)).astype(np.float32))
+
+    if cols:
+        pw = np.concatenate(cols)                          # (times, channels, freqs)
+    else:
+        pw = np.zeros((0, hdr["channels"], nbins // freq_decim), dtype=np.float32)
+    db = (10.0 * np.log10(pw + 1e-20)).transpose(1, 2, 0).astype(np.float16)
+    freqs = (np.arange(nbins // freq_decim) * freq_decim + (freq_decim - 1) / 2.0) * sr / nfft
+    times = (np.arange(pw.shape[0]) * time_decim * hop + (time_decim * hop + nfft) / 2.0) / sr
+    return {"db": db, "freqs": freqs, "times": times, "sample_rate": sr}
+
+###############################################################################
+# OUTPUTS
+###############################################################################
+
+def output_paths(wav_path, out_dir=None):
+    base = os.path.splitext(os.path.basename(wav_path))[0]
+    d = out_dir or os.path.dirname(wav_path)
+    return os.path.join(d, base + "_spec.npz"), os.path.join(d, base + "_spectrogram.png")
+
+
+def is_up_to_date(wav_path, npz_path, params, png_path=None):
+    """
+    True if npz (and png, if wanted) are newer than the WAV — or its
+    float_codec archive when only that exists — with the same params.
+    """
+    try:
+        source = wav_path
+        if not os.path.exists(wav_path):
+            source = wav_header.read_header(wav_path).get("archive", wav_path)
+        wav_mtime = os.path.getmtime(source)
+        if os.path.getmtime(npz_path) < wav_mtime:
+            return False
+        if png_path and os.path.getmtime(png_path) < wav_mtime:
+            return False
+        with np.load(npz_path) as z:
+            return json.loads(str(z["params"])) == params
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def save_png(spec, png_path, title, vmin=None, vmax=None):
+    """One row per channel; matplotlib is only imported here."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    db = spec["db"].astype(np.float32)
+    channels = db.shape[0]
+    if vmax is None:
+        vmax = float(np.percentile(db, 99.5)) if db.size else 0.0
+    if vmin is None:
+        vmin = vmax - 80.0
+    extent = [0, spec["times"][-1] if len(spec["times"]) else 0,
+              spec["freqs"][0] / 1000.0, spec["freqs"][-1] / 1000.0]
+    fig, axes = plt.subplots(channels, 1, figsize=(10, 2 * channels), sharex=True)
+    axes = np.atleast_1d(axes)
+    for ch in range(channels):
+        ax = axes[ch]
+        ax.imshow(db[ch], origin="lower", aspect="auto", extent=extent,
+                  cmap="viridis", vmin=vmin, vmax=vmax, interpolation="nearest")
+        ax.set_ylabel(f"Ch{ch+1}\nkHz")
+        if ch == 0:
+            ax.set_title(title)
+    axes[-1].set_xlabel("Time (s)")
+    plt.tight_layout()
+    plt.savefig(png_path)
+    plt.close(fig)
+
+
+def process_file(wav_path, out_dir=None, params=None, png=False, force=False):
+    """Compute and save the spectrogram of one WAV unless it is up to date."""
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    npz_path, png_path = output_paths(wav_path, out_dir)
+    if not force and is_up_to_date(wav_path, npz_path, params, png_path if png else None):
+        return {"file": wav_path, "status": "skipped"}
+
+    t0 = time.perf_counter()
+    hdr = wav_header.read_header(wav_path)
+    if hdr["frames_on_disk"] is None:
+        return {"file": wav_path, "status": "error", "error": "; ".join(hdr["problems"])}
+    spec = spectrogram(wav_path, hdr=hdr, **params)
+    tmp = npz_path + ".tmp.npz"
+    np.savez(tmp, db=spec["db"], freqs=spec["freqs"], times=spec["times"],
+             params=json.dumps(params, sort_keys=True))
+    os.replace(tmp, npz_path)
+    if png:
+        save_png(spec, png_path, os.path.basename(wav_path))
+    dt = time.perf_counter() - t0
+    audio_s = hdr["frames_on_disk"] / float(hdr["sample_rate"])
+    return {"file": wav_path, "status": "done", "seconds": dt, "realtime": audio_s / dt if dt else 0.0}
+
+
+def load(npz_path):
+    """Load a saved spectrogram as the dict spectrogram() returns."""
+    with np.load(npz_path) as z:
+        return {"db": z["db"], "freqs": z["freqs"], "times": z["times"],
+                "params": json.loads(str(z["params"]))}
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming, bounded-memory spectrograms of WAV segments.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories (recursive)")
+    parser.add_argument("--out-dir", help="output directory (default: next to each WAV)")
+    parser.add_argument("--nfft", type=int, default=DEFAULT_PARAMS["nfft"])
+    parser.add_argument("--hop", type=int, default=DEFAULT_PARAMS["hop"])
+    parser.add_argument("--time-decim", type=int, default=DEFAULT_PARAMS["time_decim"],
+                        help="STFT frames averaged per output column")
+    parser.add_argument("--freq-decim", type=int, default=DEFAULT_PARAMS["freq_decim"],
+                        help="FFT bins averaged per output row")
+    parser.add_argument("--png", action="store_true", help="also write a PNG per segment")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1)")
+    parser.add_argument("--force", action="store_true", help="recompute up-to-date outputs")
+    args = parser.parse_args()
+
+    params = {"nfft": args.nfft, "hop": args.hop,
+              "time_decim": args.time_decim, "freq_decim": args.freq_decim}
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    wavs = list(wav_header.iter_wavs(args.paths))
+    if not wavs:
+        print("No .wav files found.")
+        return 1
+
+    t0 = time.perf_counter()
+    counts = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_file, w, args.out_dir, params, args.png, args.force): w
+                   for w in wavs}
+        for fut in as_completed(futures):
+            try:
+                res = fut.result()
+            except Exception as e:   # one bad file must not stop a batch
+                res = {"file": futures[fut], "status": "error", "error": repr(e)}
+            counts[res["status"]] = counts.get(res["status"], 0) + 1
+            if res["status"] == "done":
+                print(f"{res['file']}: {res['seconds']:.1f} s ({res['realtime']:.0f}x real time)")
+            elif res["status"] == "error":
+                print(f"{res['file']}: ERROR {res['error']}")
+    dt = time.perf_counter() - t0
+    print(f"{len(wavs)} files in {dt:.1f} s: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    return 0 if not counts.get("error") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
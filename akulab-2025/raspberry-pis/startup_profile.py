@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+startup_profile.py
+
+Measure interpreter start-up + import cost of the cron entry points and log
+it, so regressions (a new top-level numpy import, …) show up in the logs.
+
+For each script it runs
+    python3 -X importtime <script> --help
+which executes every module-level import but no real work, parses the
+importtime report and appends one row per script to
+    /home/<user>/logs/startup_profile/<DATE>_startup.csv
+
+Columns: timestamp, script, wall_ms, import_ms, top_imports
+(top_imports = the five most expensive top-level imports, "name:ms;…").
+
+Usage:
+    python3 startup_profile.py                  # default entry points
+    python3 startup_profile.py path/to/other.py
+"""
+
+import os
+import re
+import sys
+import csv
+import time
+import getpass
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_SCRIPTS = [
+    SCRIPT_DIR / "rpi_health_snapshot.py",
+    SCRIPT_DIR / "backup_recordings.py",
+    SCRIPT_DIR / "analytics-pi" / "summarize_daily_logs.py",
+]
+
+# "import time:       123 |       4567 |   psutil"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """Return [(module, cumulative_us)] for top-level imports only."""
+    top = []
+    for line in stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        indent = len(m.group(3)) - 1   # one space separates the column
+        if indent == 0:
+            top.append((m.group(4), int(m.group(2))))
+    return top
+
+
+def profile_script(script):
+    """Run 'script --help' under -X importtime; return (wall_ms, import_ms, top)."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(script), "--help"],
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    top = parse_importtime(proc.stderr)
+    import_ms = sum(us for _, us in top) / 1000.0
+    top.sort(key=lambda t: t[1], reverse=True)
+    return wall_ms, import_ms, top
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log import-time profiles of the cron entry points.")
+    parser.add_argument("scripts", nargs="*", help="scripts to profile (default: cron entry points)")
+    parser.add_argument("--top", type=int, default=5, help="top-level imports to keep (default: 5)")
+    args = parser.parse_args()
+
+    scripts = [Path(s) for s in args.scripts] or DEFAULT_SCRIPTS
+    user = getpass.getuser()
+    log_dir = Path(f"/home/{user}/logs/startup_profile")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f"{datetime.now():%Y-%m-%d}_startup.csv"
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = []
+    for script in scripts:
+        wall_ms, import_ms, top = profile_script(script)
+        top_s = ";".join(f"{name}:{us / 1000.0:.1f}" for name, us in top[:args.top])
+        rows.append([now, script.name, f"{wall_ms:.1f}", f"{import_ms:.1f}", top_s])
+        print(f"{script.name:28s} wall {wall_ms:7.1f} ms  imports {import_ms:7.1f} ms  {top_s}")
+
+    write_header = not os.path.exists(log_path)
+    with open(log_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(["timestamp", "script", "wall_ms", "import_ms", "top_imports"])
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+tone_detect.py
+
+Test-tone detector: presence, level and SNR of one or more known
+frequencies on every channel, in many short windows across a segment.
+
+Instead of a full FFT of one spot on channel 0, each window is projected
+onto a small bank of single DFT bins (the quantity the Goertzel recursion
+computes), evaluated as one matrix product for all channels at once:
+
+    target bins     f_k                       (the test tones)
+    reference bins  f_k ± 3·Δf … ± 6·Δf       (local noise floor)
+
+With a Hann window, level = 2|X(f)| / Σw (dBFS for a sine) and
+SNR = |X(f)|² / mean |X(ref)|². A tone is 'present' in a window when its
+SNR exceeds --snr dB. Only the windows are read (seek + read via
+audio_blocks), so a 10-min segment with a window every 10 s touches
+~1 % of the file.
+
+Usage:
+    python3 tone_detect.py seg.wav --freq 1000
+    python3 tone_detect.py /media/nas/Audio/2025-06-01 --freq 440 --freq 1000 --step 5 --csv tones.csv
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+
+import numpy as np
+
+import wav_header
+from audio_blocks import read_frames
+
+REF_OFFSETS = (-6, -5, -4, -3, 3, 4, 5, 6)     # reference bins, in units of 1/window
+
+###############################################################################
+# DETECTOR
+###############################################################################
+
+def dft_bank(freqs, n, sr):
+    """
+    (n, 2F) float32 basis: Hann-windowed cos | sin columns for every target
+    and reference frequency (real-valued, so the product stays a float32
+    GEMM instead of a complex one). Returns (basis, n_targets, window sum).
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    df = sr / float(n)
+    refs = (freqs[:, None] + np.asarray(REF_OFFSETS)[None, :] * df).ravel()
+    allf = np.concatenate((freqs, refs))
+    t = np.arange(n) / float(sr)
+    window = np.hanning(n)
+    phase = 2.0 * np.pi * t[:, None] * allf[None, :]
+    basis = np.concatenate((window[:, None] * np.cos(phase), window[:, None] * np.sin(phase)), axis=1)
+    return basis.astype(np.float32), len(freqs), window.sum()
+
+
+def detect_tones(path, freqs, window_s=0.5, step_s=10.0, snr_db=10.0, hdr=None):
+    """
+    Return dict with
+      times     (W,) window centres, s
+      level_db  (W, C, K) tone level, dBFS
+      snr_db    (W, C, K)
+      present   (W, C, K) bool
+    for K = len(freqs) target frequencies over C channels.
+    """
+    if hdr is None:
+        hdr = wav_header.read_header(path)
+    sr, total = hdr["sample_rate"], hdr["frames_on_disk"] or 0
+    n = min(int(window_s * sr), total)
+    k = len(freqs)
+    if n < 16:
+        empty = np.zeros((0, hdr["channels"], k))
+        return {"times": np.zeros(0), "level_db": empty, "snr_db": empty, "present": empty.astype(bool)}
+
+    basis, k, wsum = dft_bank(freqs, n, sr)
+    step = max(n, int(step_s * sr)) if step_s else n
+    starts = np.arange(0, total - n + 1, step)
+
+    level = np.empty((len(starts), hdr["channels"], k))
+    snr = np.empty_like(level)
+    for i, s in enumerate(starts):
+        x = read_frames(path, int(s), n, hdr)                           # (n, C) float32
+        x = x - x.mean(axis=0)
+        re, im = np.split((x.T @ basis).astype(np.float64), 2, axis=1)  # (C, F) each
+        p = re**2 + im**2
+        tone = p[:, :k]
+        noise = p[:, k:].reshape(p.shape[0], k, len(REF_OFFSETS)).mean(axis=2)
+        level[i] = 20.0 * np.log10(np.maximum(2.0 * np.sqrt(tone) / wsum, 1e-12))
+        snr[i] = 10.0 * np.log10(np.maximum(tone, 1e-30) / np.maximum(noise, 1e-30))
+    return {
+        "times": (starts + n / 2.0) / sr,
+        "level_db": level,
+        "snr_db": snr,
+        "present": snr > snr_db,
+    }
+
+
+def summarise(res, freqs):
+    """Per (channel, freq): fraction of windows present, median level and SNR."""
+    out = []
+    if not len(res["times"]):
+        return out
+    frac = res["present"].mean(axis=0)
+    level = np.median(res["level_db"], axis=0)
+    snr = np.median(res["snr_db"], axis=0)
+    for c in range(frac.shape[0]):
+        for j, f in enumerate(freqs):
+            out.append({"channel": c + 1, "freq": f, "present_frac": float(frac[c, j]),
+                        "level_db": float(level[c, j]), "snr_db": float(snr[c, j])})
+    return out
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-window, all-channel test-tone detector.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories (recursive)")
+    parser.add_argument("--freq", type=float, action="append", required=True,
+                        help="target frequency in Hz (repeat for several)")
+    parser.add_argument("--window", type=float, default=0.5, help="window length, s (default: 0.5)")
+    parser.add_argument("--step", type=float, default=10.0,
+                        help="window spacing, s; 0 = contiguous (default: 10)")
+    parser.add_argument("--snr", type=float, default=10.0, help="presence threshold, dB (default: 10)")
+    parser.add_argument("--csv", help="write per-window results (file, t, channel, freq, level, snr)")
+    args = parser.parse_args()
+
+    writer = None
+    out = open(args.csv, "w", newline="") if args.csv else None
+    if out:
+        writer = csv.writer(out)
+        writer.writerow(["file", "t_s", "channel", "freq_hz", "level_dbfs", "snr_db", "present"])
+
+    t0 = time.perf_counter()
+    n_files = 0
+    for path in wav_header.iter_wavs(args.paths):
+        res = detect_tones(path, args.freq, args.window, args.step, args.snr)
+        n_files += 1
+        print(os.path.basename(path))
+        for s in summarise(res, args.freq):
+            mark = "present" if s["present_frac"] >= 0.5 else "MISSING"
+            print(f"  ch{s['channel']} {s['freq']:8.1f} Hz  {mark:8s} in {s['present_frac'] * 100:5.1f} % "
+                  f"of windows, level {s['level_db']:7.1f} dBFS, SNR {s['snr_db']:5.1f} dB")
+        if writer:
+            for w, t in enumerate(res["times"]):
+                for c in range(res["level_db"].shape[1]):
+                    for j, f in enumerate(args.freq):
+                        writer.writerow([path, f"{t:.3f}", c + 1, f, f"{res['level_db'][w, c, j]:.2f}",
+                                         f"{res['snr_db'][w, c, j]:.2f}", int(res["present"][w, c, j])])
+    if out:
+        out.close()
+    print(f"{n_files} files in {time.perf_counter() - t0:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
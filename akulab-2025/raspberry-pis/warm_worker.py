@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+warm_worker.py
+
+Pre-warmed fork server for the cron-launched Python entry points.
+
+Every 10 minutes cron starts a fresh interpreter for rpi_health_snapshot.py,
+backup_recordings.py and summarize_daily_logs.py, and each start pays for
+importing psutil, hashlib, csv, statistics, … again. The server imports those
+once and, per request, forks a child that runs the script with the given
+arguments. The child's stdout/stderr go back over the socket, so cron
+redirection works as before.
+
+Server (systemd user service, see analytics-pi/systemd-services/):
+    python3 warm_worker.py serve
+
+Client (from cron; -S skips site-packages so the client itself starts fast):
+    python3 -S warm_worker.py call rpi_health_snapshot --mount-check /media/nas
+
+If the server is not running, 'call' falls back to exec'ing the script in a
+normal interpreter, so cron jobs keep working either way.
+
+The server re-executes itself when any entry-point script or helper module
+changes on disk (e.g. after a git pull).
+"""
+
+import os
+import sys
+import json
+import socket
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name → script path (relative to this directory). Only these can be run.
+ENTRY_POINTS = {
+    "rpi_health_snapshot": "rpi_health_snapshot.py",
+    "backup_recordings": "backup_recordings.py",
+    "summarize_daily_logs": "analytics-pi/summarize_daily_logs.py",
+}
+
+EXIT_MARKER = b"\0AKW-EXIT:"
+
+
+def socket_path():
+    return f"/tmp/akulab_warm_worker_{os.getuid()}.sock"
+
+###############################################################################
+# CLIENT
+###############################################################################
+
+def call(name, argv):
+    """Run entry point 'name' in the warm server; return its exit code."""
+    if name not in ENTRY_POINTS:
+        sys.stderr.write(f"unknown entry point: {name}\n")
+        return 2
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path())
+    except OSError:
+        # No server: run the script cold in this process' place.
+        script = os.path.join(SCRIPT_DIR, ENTRY_POINTS[name])
+        os.execv(sys.executable, [sys.executable, script] + argv)
+
+    request = {"name": name, "argv": argv, "cwd": os.getcwd()}
+    sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+    out = sys.stdout.buffer
+    tail = b""
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        data = tail + data
+        idx = data.find(EXIT_MARKER)
+        if idx >= 0:
+            out.write(data[:idx])
+            out.flush()
+            rest = data[idx + len(EXIT_MARKER):]
+            while b"\n" not in rest:
+                more = sock.recv(64)
+                if not more:
+                    break
+                rest += more
+            return int(rest.split(b"\n", 1)[0] or 1)
+        # Keep a few bytes back in case the marker is split across reads.
+        keep = len(EXIT_MARKER) - 1
+        out.write(data[:-keep])
+        tail = data[-keep:]
+    out.write(tail)
+    out.flush()
+    return 1   # server died before reporting an exit code
+
+###############################################################################
+# SERVER
+###############################################################################
+
+def watched_files():
+    """Entry points plus sibling helper modules whose change triggers a re-exec."""
+    files = [os.path.join(SCRIPT_DIR, p) for p in ENTRY_POINTS.values()]
+    files += [os.path.join(SCRIPT_DIR, f) for f in os.listdir(SCRIPT_DIR) if f.endswith(".py")]
+    return files
+
+
+def snapshot_mtimes():
+    mtimes = {}
+    for f in watched_files():
+        try:
+            mtimes[f] = os.stat(f).st_mtime
+        except OSError:
+            mtimes[f] = None
+    return mtimes
+
+
+def preload():
+    """Import every entry point once so its dependencies sit in sys.modules."""
+    import importlib.util
+    for name, rel in ENTRY_POINTS.items():
+        path = os.path.join(SCRIPT_DIR, rel)
+        script_dir = os.path.dirname(path)
+        if script_dir not in sys.path:
+            sys.path.insert(0, script_dir)
+        spec = importlib.util.spec_from_file_location(f"_akw_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:   # a broken script must not take the server down
+            sys.stderr.write(f"preload of {name} failed: {e}\n")
+
+
+def run_child(conn, request, cold=False):
+    """
+    In the forked child: run the script with output on the socket, then exit.
+    cold=True runs it in a fresh interpreter instead (used when the warm
+    modules are stale).
+    """
+    import runpy
+    import signal
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    code = 0
+    try:
+        fd = conn.fileno()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.chdir(request.get("cwd") or "/")
+        path = os.path.join(SCRIPT_DIR, ENTRY_POINTS[request["name"]])
+        argv = list(request.get("argv", []))
+        if cold:
+            import subprocess
+            code = subprocess.call([sys.executable, path] + argv)
+        else:
+            # psutil's interval=None baselines were taken when the server
+            # imported it; restart them at the fork, as a fresh interpreter would
+            psutil = sys.modules.get("psutil")
+            if psutil is not None:
+                psutil.cpu_percent()
+                psutil.cpu_percent(percpu=True)
+                psutil.cpu_times_percent()
+            sys.argv = [path] + argv
+            sys.path[0] = os.path.dirname(path)
+            try:
+                runpy.run_path(path, run_name="__main__")
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.write(fd, EXIT_MARKER + f"{code}\n".encode())
+    finally:
+        os._exit(code)
+
+
+def reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def serve():
+    preload()
+    mtimes = snapshot_mtimes()
+
+    path = socket_path()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    server.bind(path)
+    os.umask(old_umask)
+    server.listen(8)
+    print(f"warm_worker serving on {path}", flush=True)
+
+    import signal
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        serve_forever(server, path, mtimes)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def serve_forever(server, path, mtimes):
+    while True:
+        conn, _ = server.accept()
+        reap_children()
+        try:
+            raw = conn.makefile("rb").readline()
+            request = json.loads(raw)
+            if request.get("name") not in ENTRY_POINTS:
+                raise ValueError(f"unknown entry point {request.get('name')!r}")
+        except ValueError as e:
+            conn.sendall(f"bad request: {e}\n".encode() + EXIT_MARKER + b"2\n")
+            conn.close()
+            continue
+
+        if snapshot_mtimes() != mtimes:
+            # Code changed on disk: run this request cold, then restart warm.
+            print("sources changed, re-executing", flush=True)
+            if os.fork() == 0:
+                server.close()
+                run_child(conn, request, cold=True)
+            conn.close()
+            server.close()
+            os.unlink(path)
+            os.execv(sys.executable, [sys.executable, os.path.abspath(__file__), "serve"])
+
+        if os.fork() == 0:
+            server.close()
+            run_child(conn, request)
+        conn.close()
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        serve()
+        return 0
+    if len(sys.argv) >= 3 and sys.argv[1] == "call":
+        return call(sys.argv[2], sys.argv[3:])
+    sys.stderr.write(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
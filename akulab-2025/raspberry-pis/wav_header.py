@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+wav_header.py
+
+Header-only parser for RIFF / RF64 / BW64 WAV files, plus in-place repair.
+
+ffmpeg sometimes ignored `-rf64 always` (see notes.txt) and produced 5.5 GB
+files whose plain RIFF header still describes at most 4 GB, so libsndfile
+(check_wavs.py, verify_segments.py) truncates or rejects them. This module
+never touches the audio: it reads the first 64 KiB of a file once, walks the
+chunk list (`ds64`, `fmt `, `bext`, `data`, …) and compares the header with
+the real file size, so a NAS full of segments can be scanned in seconds.
+
+read_header(path) returns a dict:
+    riff_id          'RIFF' | 'RF64' | 'BW64'
+    file_size        bytes on disk
+    channels, sample_rate, bits_per_sample, block_align, format_tag
+    subtype          'FLOAT' | 'DOUBLE' | 'PCM_16' | 'PCM_24' | 'PCM_32' | …
+    data_offset      byte offset of the first sample
+    data_size        data size the header claims (ds64 resolved)
+    frames           frames the header claims
+    frames_on_disk   frames actually present (from file size)
+    bext             dict (description, originator, origination_date,
+                     origination_time, time_reference, coding_history, …)
+                     or None
+    has_junk         28+ byte JUNK chunk right after WAVE (RF64 placeholder)
+    problems         list of human-readable header problems (empty = OK)
+
+Repair (header bytes only, rewritten in place):
+  * RIFF > 4 GiB with a JUNK placeholder → converted to RF64 + ds64
+  * RIFF ≤ 4 GiB with stale RIFF/data sizes → sizes rewritten
+  * RF64 with stale ds64 sizes (e.g. writer killed) → ds64 rewritten
+The data size is extended to EOF unless well-formed chunks (LIST, iXML, …)
+follow the audio; then it ends where they start.
+
+Usage:
+    python3 wav_header.py show  file.wav
+    python3 wav_header.py scan  /media/nas/Audio [--csv report.csv]
+    python3 wav_header.py repair file.wav [...]  [--dry-run] [--backup]
+"""
+
+import os
+import sys
+import csv
+import time
+import struct
+import argparse
+
+READ_SIZE = 65536
+U32_MAX = 0xFFFFFFFF
+BEXT_FIXED = 602
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+ARCHIVE_SUFFIX = ".f32z"         # float_codec.py archives
+
+###############################################################################
+# PARSING
+###############################################################################
+
+def subtype_of(format_tag, bits):
+    """Map (format tag, bits) to the libsndfile subtype names used elsewhere."""
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return {32: "FLOAT", 64: "DOUBLE"}.get(bits, f"FLOAT_{bits}")
+    if format_tag == WAVE_FORMAT_PCM:
+        return "PCM_U8" if bits == 8 else f"PCM_{bits}"
+    return f"TAG_{format_tag:#06x}"
+
+
+def _cstr(raw):
+    return raw.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+
+
+def parse_bext(body):
+    """Decode the fixed part of a BWF 'bext' chunk (EBU Tech 3285)."""
+    if len(body) < 348:
+        return None
+    tr_low, tr_high = struct.unpack_from("<II", body, 338)
+    version = struct.unpack_from("<H", body, 346)[0]
+    return {
+        "description": _cstr(body[0:256]),
+        "originator": _cstr(body[256:288]),
+        "originator_reference": _cstr(body[288:320]),
+        "origination_date": _cstr(body[320:330]),
+        "origination_time": _cstr(body[330:338]),
+        "time_reference": (tr_high << 32) | tr_low,
+        "version": version,
+        "coding_history": _cstr(body[BEXT_FIXED:]) if len(body) > BEXT_FIXED else "",
+    }
+
+
+def parse_header_bytes(head, file_size, f=None):
+    """
+    Parse a WAV header from 'head' (the first bytes of the file).
+    If the data chunk lies beyond 'head', 'f' (open file) is used to seek
+    to the remaining chunk headers.
+    """
+    hdr = {
+        "riff_id": None, "riff_size": None, "file_size": file_size,
+        "format_tag": None, "channels": None, "sample_rate": None,
+        "bits_per_sample": None, "block_align": None, "subtype": None,
+        "data_offset": None, "data_size": None, "data_size_field": None,
+        "frames": None, "frames_on_disk": None,
+        "bext": None, "has_junk": False, "junk_offset": None,
+        "ds64_offset": None, "problems": [],
+    }
+    problems = hdr["problems"]
+    if len(head) < 12 or head[8:12] != b"WAVE":
+        problems.append("not a WAVE file")
+        return hdr
+    riff_id = head[0:4].decode("ascii", "replace")
+    hdr["riff_id"] = riff_id
+    hdr["riff_size"] = struct.unpack_from("<I", head, 4)[0]
+    if riff_id not in ("RIFF", "RF64", "BW64"):
+        problems.append(f"unknown RIFF id {riff_id!r}")
+        return hdr
+
+    ds64 = None
+    pos = 12
+    while True:
+        if pos + 8 > len(head):
+            if f is None or pos + 8 > file_size:
+                break
+            f.seek(pos)
+            chunk_head = f.read(8)
+            if len(chunk_head) < 8:
+                break
+            cid, size = chunk_head[:4], struct.unpack("<I", chunk_head[4:])[0]
+            body = b""
+        else:
+            cid, size = head[pos:pos + 4], struct.unpack_from("<I", head, pos + 4)[0]
+            body = head[pos + 8:pos + 8 + size] if cid != b"data" else b""
+
+        if cid == b"ds64":
+            hdr["ds64_offset"] = pos
+            if len(body) >= 24:
+                riff64, data64, count64 = struct.unpack_from("<QQQ", body, 0)
+                ds64 = {"riff_size": riff64, "data_size": data64, "sample_count": count64}
+        elif cid == b"JUNK" and pos == 12 and size >= 28:
+            hdr["has_junk"], hdr["junk_offset"] = True, pos
+        elif cid == b"fmt ":
+            if len(body) >= 16:
+                tag, ch, sr, _, align, bits = struct.unpack_from("<HHIIHH", body, 0)
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack_from("<H", body, 24)[0]
+                hdr.update(format_tag=tag, channels=ch, sample_rate=sr,
+                           block_align=align, bits_per_sample=bits,
+                           subtype=subtype_of(tag, bits))
+        elif cid == b"bext":
+            if f is not None and len(body) < size and pos + 8 + size <= file_size:
+                f.seek(pos + 8)
+                body = f.read(size)
+            hdr["bext"] = parse_bext(body)
+        elif cid == b"data":
+            hdr["data_offset"] = pos + 8
+            hdr["data_size_field"] = size
+            if size == U32_MAX and ds64 is not None:
+                hdr["data_size"] = ds64["data_size"]
+            else:
+                hdr["data_size"] = size
+            break
+
+        if size == U32_MAX:
+            problems.append(f"chunk {cid!r} has RF64 size but no ds64")
+            break
+        pos += 8 + size + (size & 1)
+
+    if hdr["channels"] is None:
+        problems.append("missing fmt chunk")
+    if hdr["data_offset"] is None:
+        problems.append("missing data chunk")
+        return hdr
+
+    align = hdr["block_align"] or 1
+    on_disk = file_size - hdr["data_offset"]
+    hdr["frames_on_disk"] = on_disk // align
+    hdr["frames"] = hdr["data_size"] // align if hdr["data_size"] is not None else None
+
+    if riff_id in ("RF64", "BW64"):
+        if ds64 is None:
+            problems.append("RF64 without ds64 chunk")
+        else:
+            if ds64["riff_size"] != file_size - 8:
+                problems.append(f"ds64 riff size {ds64['riff_size']} != {file_size - 8}")
+            if hdr["data_size"] < on_disk - align + 1 or hdr["data_size"] > on_disk:
+                problems.append(f"ds64 data size {hdr['data_size']} != {on_disk}")
+    else:
+        if file_size - 8 > U32_MAX:
+            problems.append(f"RIFF header on {file_size / 2**30:.2f} GiB file (needs RF64)")
+        elif hdr["riff_size"] != file_size - 8:
+            problems.append(f"riff size {hdr['riff_size']} != {file_size - 8}")
+        if hdr["data_size"] > on_disk:
+            problems.append(f"data size {hdr['data_size']} > {on_disk} on disk (truncated file)")
+        elif on_disk - hdr["data_size"] >= align and file_size - 8 <= U32_MAX:
+            # Trailing chunks after 'data' are legal; only flag if the RIFF
+            # size also ends at the data chunk.
+            if hdr["riff_size"] + 8 <= hdr["data_offset"] + hdr["data_size"] + 1:
+                problems.append(f"data size {hdr['data_size']} < {on_disk} on disk")
+    return hdr
+
+
+def read_header(path, read_size=READ_SIZE):
+    """
+    Parse the header of 'path' with a single small read (see module doc).
+    A float_codec archive (or a .wav path of which only the archive exists)
+    returns the original file's header plus 'archive'.
+    """
+    if str(path).endswith(ARCHIVE_SUFFIX) or (
+            not os.path.exists(path) and os.path.exists(str(path) + ARCHIVE_SUFFIX)):
+        import float_codec
+        return float_codec.read_header(float_codec.archive_path(path))
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(read_size)
+        hdr = parse_header_bytes(head, file_size, f)
+    hdr["path"] = str(path)
+    return hdr
+
+###############################################################################
+# REPAIR
+###############################################################################
+
+def _chunks_reach(buf, pos, end):
+    """True if buf[pos:end] is a run of well-formed chunks ending at end."""
+    while end - pos >= 8:
+        if not all(0x20 <= c < 0x7F for c in buf[pos:pos + 4]):
+            return False
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        pos += 8 + size + (size & 1)
+    return pos in (end, end + 1)               # the last pad byte may be missing
+
+
+def audio_end(path, hdr, tail_bytes=1 << 20):
+    """
+    Byte offset where the audio really ends: the first frame boundary at or
+    after the declared data end (searched within the last tail_bytes) from
+    which well-formed chunks run exactly to EOF; EOF if there is none.
+    """
+    size, start = hdr["file_size"], hdr["data_offset"]
+    align = hdr["block_align"] or 1
+    declared = start + (hdr["data_size"] or 0)
+    if hdr["data_size"] is None or declared > size - 8:
+        return size                            # truncated or no room for a chunk: all audio
+    lo = max(declared, size - tail_bytes)
+    with open(path, "rb") as f:
+        f.seek(lo)
+        buf = f.read(size - lo)
+    candidates = [declared + (declared & 1)] if lo == declared else []
+    first = start + -(-(lo - start) // align) * align
+    candidates += range(first, size - 7, align)
+    for pos in candidates:
+        if pos >= lo and _chunks_reach(buf, pos - lo, size - lo):
+            return pos
+    return size
+
+
+def plan_repair(hdr):
+    """
+    Return a list of (offset, bytes) patches that make the header match the
+    file size, or raise ValueError if it cannot be fixed in place.
+    """
+    if hdr["data_offset"] is None or hdr["channels"] is None:
+        raise ValueError("no fmt/data chunk; cannot repair")
+    size = hdr["file_size"]
+    align = hdr["block_align"] or 1
+    end = audio_end(hdr["path"], hdr) if hdr.get("path") else size
+    data_size = (end - hdr["data_offset"]) // align * align
+    frames = data_size // align
+    patches = []
+
+    if hdr["riff_id"] in ("RF64", "BW64"):
+        if hdr["ds64_offset"] is None:
+            raise ValueError("RF64 without ds64; cannot repair in place")
+        body = hdr["ds64_offset"] + 8
+        patches.append((body, struct.pack("<QQQ", size - 8, data_size, frames)))
+        patches.append((4, struct.pack("<I", U32_MAX)))
+        patches.append((hdr["data_offset"] - 4, struct.pack("<I", U32_MAX)))
+    elif size - 8 > U32_MAX:
+        if not hdr["has_junk"]:
+            raise ValueError("RIFF > 4 GiB without JUNK placeholder; header must grow, "
+                             "cannot repair in place")
+        j = hdr["junk_offset"]
+        patches.append((0, b"RF64" + struct.pack("<I", U32_MAX)))
+        patches.append((j, b"ds64"))
+        patches.append((j + 8, struct.pack("<QQQI", size - 8, data_size, frames, 0)))
+        patches.append((hdr["data_offset"] - 4, struct.pack("<I", U32_MAX)))
+    else:
+        patches.append((4, struct.pack("<I", size - 8)))
+        patches.append((hdr["data_offset"] - 4, struct.pack("<I", data_size)))
+    return patches
+
+
+def repair(path, dry_run=False, backup=False):
+    """
+    Rewrite only the header bytes of 'path'. Returns (changed, message).
+    With backup=True the original first data_offset bytes are saved to
+    '<path>.hdr.bak' first.
+    """
+    hdr = read_header(path)
+    if not hdr["problems"]:
+        return False, "OK"
+    try:
+        patches = plan_repair(hdr)
+    except ValueError as e:
+        return False, f"NOT REPAIRABLE: {e}"
+    if dry_run:
+        return False, "would repair: " + "; ".join(hdr["problems"])
+
+    with open(path, "r+b") as f:
+        if backup:
+            f.seek(0)
+            with open(str(path) + ".hdr.bak", "wb") as b:
+                b.write(f.read(hdr["data_offset"]))
+        fd = f.fileno()
+        for offset, data in patches:
+            os.pwrite(fd, data, offset)
+        os.fsync(fd)
+
+    after = read_header(path)
+    if after["problems"]:
+        return True, "repaired, but still: " + "; ".join(after["problems"])
+    return True, "repaired: " + "; ".join(hdr["problems"])
+
+###############################################################################
+# MAIN
+###############################################################################
+
+def iter_wavs(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                dirs.sort()
+                names = set(files)
+                for name in sorted(files):
+                    if name.lower().endswith(".wav"):
+                        yield os.path.join(root, name)
+                    elif name.lower().endswith(".wav" + ARCHIVE_SUFFIX):
+                        # archived segment: listed under its .wav name
+                        wav = name[:-len(ARCHIVE_SUFFIX)]
+                        if wav not in names:
+                            yield os.path.join(root, wav)
+        else:
+            yield p
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Header-only WAV/RF64/BEXT parser and repair tool.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_show = sub.add_parser("show", help="print the parsed header")
+    p_show.add_argument("path")
+    p_scan = sub.add_parser("scan", help="scan files/directories (recursive) for header problems")
+    p_scan.add_argument("paths", nargs="+")
+    p_scan.add_argument("--csv", help="write one row per file to this CSV")
+    p_rep = sub.add_parser("repair", help="rewrite header bytes in place from the true file size")
+    p_rep.add_argument("paths", nargs="+")
+    p_rep.add_argument("--dry-run", action="store_true", help="only report what would change")
+    p_rep.add_argument("--backup", action="store_true", help="save original header to <file>.hdr.bak")
+    args = parser.parse_args()
+
+    if args.cmd == "show":
+        hdr = read_header(args.path)
+        for k, v in hdr.items():
+            if k == "bext" and v:
+                for bk, bv in v.items():
+                    print(f"  bext.{bk:20s} {bv!r}")
+            else:
+                print(f"{k:22s} {v!r}")
+        return 0 if not hdr["problems"] else 1
+
+    if args.cmd == "scan":
+        t0 = time.perf_counter()
+        n = bad = 0
+        out = open(args.csv, "w", newline="") if args.csv else None
+        writer = csv.writer(out) if out else None
+        if writer:
+            writer.writerow(["path", "riff_id", "channels", "sample_rate", "subtype",
+                             "frames", "frames_on_disk", "time_reference", "problems"])
+        for path in iter_wavs(args.paths):
+            try:
+                hdr = read_header(path)
+            except OSError as e:
+                hdr = {"problems": [f"read error: {e}"]}
+            n += 1
+            if hdr["problems"]:
+                bad += 1
+                print(f"{path}: " + "; ".join(hdr["problems"]))
+            if writer:
+                bext = hdr.get("bext") or {}
+                writer.writerow([path, hdr.get("riff_id"), hdr.get("channels"), hdr.get("sample_rate"),
+                                 hdr.get("subtype"), hdr.get("frames"), hdr.get("frames_on_disk"),
+                                 bext.get("time_reference"), "; ".join(hdr["problems"])])
+        if out:
+            out.close()
+        dt = time.perf_counter() - t0
+        print(f"Scanned {n} files in {dt:.2f} s ({n / dt if dt else 0:.0f} files/s), {bad} with problems.")
+        return 0 if not bad else 1
+
+    rc = 0
+    for path in iter_wavs(args.paths):
+        changed, msg = repair(path, dry_run=args.dry_run, backup=args.backup)
+        if msg != "OK":
+            print(f"{path}: {msg}")
+        if msg.startswith("NOT") or "still" in msg:
+            rc = 1
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
 import os
 import sys
-from datetime import datetime, timedelta
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
 import statistics
 
+import numpy as np
+
+RPI_DIR = Path(__file__).resolve().parent.parent / "raspberry-pis"
+sys.path.insert(0, str(RPI_DIR))
+from segment_timeline import parse_name_time
+
 def parse_ls_output(file_path):
     """Parse the ls -al output to extract filenames and their sizes."""
     file_sizes = {}
@@ -18,42 +26,56 @@ def parse_ls_output(file_path):
             filenames.append(filename)
     return file_sizes, sorted(set(filenames))  # Return file sizes and sorted filenames
 
-def check_consecutive_segments(audio_files):
-    """Check if all 10-minute segments are consecutive and identify missing ones."""
-    timestamps = []
-
-    # Extract timestamps from file names (assuming format: YYYYMMDD_HHMMSS)
+def check_consecutive_segments(audio_files, segment_time=None, tolerance=2.0):
+    """
+    Check that segments follow each other every segment_time seconds and
+    list the missing ones. segment_time defaults to the median step between
+    starts, so 1-minute legacy listings (0422.txt) and 10-minute ones both
+    work without flags. Start times come from the full date + time in the
+    file name (both auklab_YYYYMMDDTHHMMSS.wav and the legacy
+    ..._YYYYMMDD_HHMMSS_NNNN.wav), so listings spanning midnight or several
+    days work. Segments need not be clock-aligned (after a restart the first
+    segment is short); a join is only flagged when the step differs from
+    segment_time by more than 'tolerance' seconds.
+    """
+    names, starts = [], []
     for file in audio_files:
-        try:
-            timestamp_str = file.split('_')[-2]  # Extract HHMMSS part from the second-to-last segment
-            timestamp = datetime.strptime(timestamp_str, "%H%M%S")
-            # Validate that the timestamp is aligned to a 10-minute boundary
-            if timestamp.minute % 10 != 0 or timestamp.second != 0:
-                print(f"Invalid timestamp (not aligned to 10-minute boundary): {file}")
-                continue
-            timestamps.append(timestamp)
-        except ValueError:
+        t = parse_name_time(file)
+        if t is None:
             print(f"Invalid timestamp format in file: {file}")
+            continue
+        names.append(file)
+        starts.append(t)
+    if len(starts) < 2:
+        print("Not enough timestamped segments to check.")
+        return
 
-    # Sort timestamps
-    timestamps.sort()
+    order = np.argsort(starts)
+    starts = np.asarray(starts, dtype=np.int64)[order]
+    names = [names[i] for i in order]
+    step = np.diff(starts)
+    if not segment_time:
+        segment_time = int(np.median(step))
+        print(f"Segment time {segment_time} s (median step; --segment-time to override)")
 
-    # Check for gaps
     missing_segments = []
-    for i in range(len(timestamps) - 1):
-        expected_next = timestamps[i] + timedelta(minutes=10)
-        if timestamps[i + 1] != expected_next:
-            current = timestamps[i]
-            while current + timedelta(minutes=10) < timestamps[i + 1]:
-                current += timedelta(minutes=10)
-                missing_segments.append(current.strftime("%H:%M"))
+    for i in np.flatnonzero(step > segment_time + tolerance):
+        current = starts[i] + segment_time
+        while current + segment_time - tolerance <= starts[i + 1]:
+            missing_segments.append(datetime.fromtimestamp(int(current), timezone.utc)
+                                    .strftime("%Y-%m-%d %H:%M:%S"))
+            current += segment_time
+        if current < starts[i + 1] - tolerance:
+            print(f"Partial gap of {starts[i + 1] - current} s before {names[i + 1]}")
+    for i in np.flatnonzero(step < segment_time - tolerance):
+        print(f"Short step of {step[i]} s (restart?): {names[i]} -> {names[i + 1]}")
 
     if missing_segments:
-        print("Missing 10-minute segments:")
+        print(f"Missing {segment_time}-second segments:")
         for segment in missing_segments:
             print(f"  {segment}")
     else:
-        print("All 10-minute segments are consecutive.")
+        print(f"All {segment_time}-second segments are consecutive.")
 
 def analyze_file_sizes(file_sizes):
     """Analyze file sizes and identify files far from the mean."""
@@ -80,7 +102,12 @@ def analyze_file_sizes(file_sizes):
 
 # Example usage in main()
 def main():
-    file_path = sys.argv[1] if len(sys.argv) > 1 else 'ls_output.txt'
+    parser = argparse.ArgumentParser(description="Check an `ls -al` listing of segments for size outliers and gaps.")
+    parser.add_argument("file_path", nargs="?", default="ls_output.txt", help="ls -al output (default: ls_output.txt)")
+    parser.add_argument("--segment-time", type=int, default=None,
+                        help="expected segment length, s (default: median step between segments)")
+    args = parser.parse_args()
+    file_path = args.file_path
 
     file_sizes, audio_files = parse_ls_output(file_path)
     print(f"Parsed {len(audio_files)} unique audio files.")
@@ -88,8 +115,8 @@ def main():
     print("\nAnalyzing file sizes...")
     analyze_file_sizes(file_sizes)
 
-    print("\nChecking consecutive 10-minute segments...")
-    check_consecutive_segments(audio_files)
+    print("\nChecking consecutive segments...")
+    check_consecutive_segments(audio_files, args.segment_time)
     #for file in audio_files:
     #    print(f"file:  {file}")
     print("All audio files processed.")